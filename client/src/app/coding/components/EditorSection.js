@@ -252,6 +252,7 @@ const EditorSection = ({
           test_type: testType,
           output: response.data.output || '',
           error: response.data.error || '',
+          usage: response.data.usage || null,
           is_submission: false,
           action_type: 'run'
         };
@@ -1,9 +1,17 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
-from app.services.chat_service import chat
+from app.services.chat_service import (
+    HISTORY_TRIM_BLOCK,
+    chat,
+    extract_problem_id,
+    hint_history_buffer,
+    interaction_log_buffer,
+    load_user_context,
+    prompt_cache_stats,
+)
+from app.db.database import mongo
 import asyncio
-from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 import os
@@ -19,7 +27,6 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017")
 DEFAULT_MAX_QUESTIONS = int(
     os.getenv("DEFAULT_MAX_QUESTIONS", "10")
 )  # Default to 10 questions per exercise
@@ -27,24 +34,6 @@ RESET_INTERVAL = int(os.getenv("RESET_INTERVAL", "8"))  # Reset period in hours
 MAX_CONVERSATION_LENGTH = int(
     os.getenv("MAX_CONVERSATION_LENGTH", "20")
 )  # Max messages to keep
-MONGODB_MAX_POOL_SIZE = int(
-    os.getenv("MONGODB_MAX_POOL_SIZE", "50")
-)  # Connection pool size
-
-# MongoDB connection with proper connection pooling
-client = MongoClient(
-    MONGO_URI,
-    maxPoolSize=MONGODB_MAX_POOL_SIZE,
-    serverSelectionTimeoutMS=5000,  # 5 seconds timeout
-    connectTimeoutMS=5000,
-)
-db = client["mydatabase"]
-users_collection = db["users"]
-reset_collection = db["question_resets"]
-conversation_collection = db["conversations"]
-exercises_collection = db[
-    "exercises"
-]  # Collection for tracking exercise-specific quotas
 
 # Create router
 router = APIRouter()
@@ -77,14 +66,14 @@ async def check_reset_questions():
     """Check if it's time to reset questions and do so if needed"""
     try:
         # Get the last reset time from database
-        reset_record = reset_collection.find_one({"_id": "last_reset"})
+        reset_record = await mongo.question_resets.find_one({"_id": "last_reset"})
 
         current_time = datetime.utcnow()
         should_reset = False
 
         if not reset_record:
             # First time, create the record
-            reset_collection.insert_one(
+            await mongo.question_resets.insert_one(
                 {"_id": "last_reset", "timestamp": current_time}
             )
             logger.info(f"Initialized question reset timer at {current_time}")
@@ -96,13 +85,13 @@ async def check_reset_questions():
 
         if should_reset:
             # Reset all users' question counters
-            users_collection.update_many({}, {"$set": {"questions_used": 0}})
+            await mongo.users.update_many({}, {"$set": {"questions_used": 0}})
 
             # Reset all exercise-specific question counters
-            exercises_collection.update_many({}, {"$set": {"questions_used": 0}})
+            await mongo.exercises.update_many({}, {"$set": {"questions_used": 0}})
 
             # Update the last reset time
-            reset_collection.update_one(
+            await mongo.question_resets.update_one(
                 {"_id": "last_reset"}, {"$set": {"timestamp": current_time}}
             )
             logger.info(f"Questions reset for all users at {current_time}")
@@ -125,7 +114,7 @@ async def get_conversation_history(user_id, exercise_id=None):
         if exercise_id:
             query["exercise_id"] = exercise_id
 
-        conversation = conversation_collection.find_one(query)
+        conversation = await mongo.conversations.find_one(query)
         if conversation:
             return conversation.get("messages", [])
         else:
@@ -139,7 +128,7 @@ async def get_conversation_history(user_id, exercise_id=None):
             if exercise_id:
                 new_record["exercise_id"] = exercise_id
 
-            conversation_collection.insert_one(new_record)
+            await mongo.conversations.insert_one(new_record)
             return []
     except PyMongoError as e:
         logger.error(f"Error retrieving conversation history: {str(e)}")
@@ -155,7 +144,7 @@ async def update_conversation_history(user_id, prompt, response, exercise_id=Non
             query["exercise_id"] = exercise_id
 
         # Add new messages to history
-        conversation_collection.update_one(
+        await mongo.conversations.update_one(
             query,
             {
                 "$push": {
@@ -171,18 +160,16 @@ async def update_conversation_history(user_id, prompt, response, exercise_id=Non
             upsert=True,
         )
 
-        # Trim conversation if it exceeds maximum length
-        conversation_collection.update_one(
+        # Trim conversation if it exceeds maximum length, dropping whole
+        # blocks of old exchanges like trim_history so the history the chat
+        # sends keeps a stable start for prompt caching
+        limit = MAX_CONVERSATION_LENGTH * 2
+        block = HISTORY_TRIM_BLOCK * 2
+        excess = {"$max": [{"$subtract": [{"$size": "$messages"}, limit]}, 0]}
+        drop = {"$multiply": [{"$toInt": {"$ceil": {"$divide": [excess, block]}}}, block]}
+        await mongo.conversations.update_one(
             query,
-            [
-                {
-                    "$set": {
-                        "messages": {
-                            "$slice": ["$messages", -MAX_CONVERSATION_LENGTH * 2]
-                        }
-                    }
-                }
-            ],
+            [{"$set": {"messages": {"$slice": ["$messages", drop, limit]}}}],
         )
     except PyMongoError as e:
         logger.error(f"Error updating conversation history: {str(e)}")
@@ -203,13 +190,13 @@ async def upload_exercises(request: ExerciseUploadRequest):
         # Store exercises for this user
         for exercise in exercises_data:
             # Check if this exercise is already tracked
-            exercise_record = exercises_collection.find_one(
+            exercise_record = await mongo.exercises.find_one(
                 {"user_id": user_id, "exercise_id": str(exercise["id"])}
             )
 
             if not exercise_record:
                 # Create a new record with default quota
-                exercises_collection.insert_one(
+                await mongo.exercises.insert_one(
                     {
                         "user_id": user_id,
                         "exercise_id": str(exercise["id"]),
@@ -249,16 +236,17 @@ async def ai_chat(
     if not user_id or not prompt:
         raise HTTPException(status_code=400, detail="User ID and prompt are required.")
 
-    # First check if user exists
+    # First check if user exists; this read also serves the chat itself,
+    # with the hint state of this message's problem only
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user:
+        context = await load_user_context(user_id, extract_problem_id(prompt))
+        if not context.exists:
             logger.warning(f"User not found: {user_id}")
             raise HTTPException(status_code=404, detail="User not found.")
 
         # If exercise_id is provided, check if the user has questions left for this exercise
         if exercise_id:
-            exercise_record = exercises_collection.find_one(
+            exercise_record = await mongo.exercises.find_one(
                 {"user_id": user_id, "exercise_id": exercise_id}
             )
 
@@ -271,7 +259,7 @@ async def ai_chat(
                     "max_questions": DEFAULT_MAX_QUESTIONS,
                     "created_at": datetime.utcnow(),
                 }
-                exercises_collection.insert_one(exercise_record)
+                await mongo.exercises.insert_one(exercise_record)
 
             questions_used = exercise_record.get("questions_used", 0)
             max_questions = exercise_record.get("max_questions", DEFAULT_MAX_QUESTIONS)
@@ -286,25 +274,29 @@ async def ai_chat(
                 )
 
             # Increment the questions_used counter for this exercise
-            exercises_collection.update_one(
+            await mongo.exercises.update_one(
                 {"user_id": user_id, "exercise_id": exercise_id},
                 {"$inc": {"questions_used": 1}},
             )
 
         # If no exercise_id, use the global question limit
         else:
-            questions_used = user.get("questions_used", 0)
-            max_questions = DEFAULT_MAX_QUESTIONS
-
-            if questions_used >= max_questions:
+            # Check and count the question in one update, so concurrent
+            # messages can't all pass the check before any is counted
+            claimed = await mongo.users.update_one(
+                {
+                    "_id": ObjectId(user_id),
+                    "$or": [
+                        {"questions_used": {"$lt": DEFAULT_MAX_QUESTIONS}},
+                        {"questions_used": {"$exists": False}},
+                    ],
+                },
+                {"$inc": {"questions_used": 1}},
+            )
+            if claimed.matched_count == 0:
                 logger.info(f"Global question limit reached for user: {user_id}")
                 raise HTTPException(status_code=403, detail="Question limit reached.")
 
-            # Increment the global questions_used counter
-            users_collection.update_one(
-                {"_id": ObjectId(user_id)}, {"$inc": {"questions_used": 1}}
-            )
-
         # Get conversation history from database (exercise-specific if provided)
         conversation_history = await get_conversation_history(user_id, exercise_id)
 
@@ -312,7 +304,7 @@ async def ai_chat(
         response_content = []
 
         async def response_generator():
-            async for chunk in chat(prompt, user_id, conversation_history):
+            async for chunk in chat(prompt, user_id, conversation_history, context):
                 response_content.append(chunk)
                 yield chunk
 
@@ -342,7 +334,7 @@ async def get_remaining_questions(
 ):
     try:
         # Get the reset time info
-        reset_record = reset_collection.find_one({"_id": "last_reset"})
+        reset_record = await mongo.question_resets.find_one({"_id": "last_reset"})
         if reset_record:
             last_reset_time = reset_record["timestamp"]
             next_reset = last_reset_time + timedelta(hours=RESET_INTERVAL)
@@ -353,7 +345,7 @@ async def get_remaining_questions(
 
         # If exercise_id is provided, get exercise-specific questions
         if exercise_id:
-            exercise_record = exercises_collection.find_one(
+            exercise_record = await mongo.exercises.find_one(
                 {"user_id": user_id, "exercise_id": exercise_id}
             )
 
@@ -366,7 +358,7 @@ async def get_remaining_questions(
                     "max_questions": DEFAULT_MAX_QUESTIONS,
                     "created_at": datetime.utcnow(),
                 }
-                exercises_collection.insert_one(exercise_record)
+                await mongo.exercises.insert_one(exercise_record)
 
             questions_used = exercise_record.get("questions_used", 0)
             max_questions = exercise_record.get("max_questions", DEFAULT_MAX_QUESTIONS)
@@ -380,7 +372,7 @@ async def get_remaining_questions(
 
         # Otherwise get global questions remaining
         else:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
+            user = await mongo.users.find_one({"_id": ObjectId(user_id)})
             if not user:
                 raise HTTPException(status_code=404, detail="User not found.")
 
@@ -410,14 +402,14 @@ async def reset_questions(request: QuestionsRequest):
     try:
         # If exercise_id is provided, reset only that exercise's counter
         if exercise_id:
-            result = exercises_collection.update_one(
+            result = await mongo.exercises.update_one(
                 {"user_id": user_id, "exercise_id": exercise_id},
                 {"$set": {"questions_used": 0}},
             )
 
             if result.matched_count == 0:
                 # Create a new record with zero questions used
-                exercises_collection.insert_one(
+                await mongo.exercises.insert_one(
                     {
                         "user_id": user_id,
                         "exercise_id": exercise_id,
@@ -437,7 +429,7 @@ async def reset_questions(request: QuestionsRequest):
 
         # Otherwise reset the global counter
         else:
-            result = users_collection.update_one(
+            result = await mongo.users.update_one(
                 {"_id": ObjectId(user_id)}, {"$set": {"questions_used": 0}}
             )
             if result.matched_count == 0:
@@ -470,7 +462,7 @@ async def update_skill_level(request: SkillLevelRequest):
         )
 
     try:
-        result = users_collection.update_one(
+        result = await mongo.users.update_one(
             {"_id": ObjectId(user_id)}, {"$set": {"skill_level": skill_level}}
         )
 
@@ -495,9 +487,9 @@ async def update_skill_level(request: SkillLevelRequest):
 @router.post("/admin/reset-all-questions")
 async def admin_reset_all_questions():
     try:
-        users_collection.update_many({}, {"$set": {"questions_used": 0}})
-        exercises_collection.update_many({}, {"$set": {"questions_used": 0}})
-        reset_collection.update_one(
+        await mongo.users.update_many({}, {"$set": {"questions_used": 0}})
+        await mongo.exercises.update_many({}, {"$set": {"questions_used": 0}})
+        await mongo.question_resets.update_one(
             {"_id": "last_reset"},
             {"$set": {"timestamp": datetime.utcnow()}},
             upsert=True,
@@ -523,7 +515,7 @@ async def clear_conversation_history(user_id: str, exercise_id: str = None):
         if exercise_id:
             query["exercise_id"] = exercise_id
 
-        result = conversation_collection.delete_one(query)
+        result = await mongo.conversations.delete_one(query)
 
         if result.deleted_count == 0:
             return {
@@ -564,8 +556,14 @@ async def health_check():
     """Health check endpoint to verify the API and database are working"""
     try:
         # Check database connection
-        db.command("ping")
-        return {"status": "healthy", "database": "connected"}
+        await mongo.accounts_db.command("ping")
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "interaction_logs": interaction_log_buffer.stats(),
+            "hint_history": hint_history_buffer.stats(),
+            "prompt_cache": prompt_cache_stats.stats(),
+        }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Service unavailable")
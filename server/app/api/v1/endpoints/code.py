@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi_limiter.depends import RateLimiter
-from app.db.schemas import Code, CodeHistory, KeystrokeData
-from app.services.run_code_service import run_code as run_code_service
+from app.db.schemas import BatchRunRequest, Code, CodeHistory, GradeRequest, KeystrokeData
+from app.services.run_code_service import run_code as run_code_service, stream_code
+from app.services.grading_service import grade_submission
+from app.services.batch_run_service import run_with_inputs
 from app.services.export_code import export_code
 from typing import Dict, Any, Tuple, List
 from app.core.security import get_current_user
+import json
 import time
 from datetime import datetime
 router = APIRouter()
@@ -49,6 +52,84 @@ async def run_code(
         # This prevents duplicate entries in the database
         
         return result
+    except HTTPException as e:
+        # Let queue rejections (429) and load shedding (503 with Retry-After)
+        # reach the client as real status codes
+        if e.status_code in (429, 503):
+            raise
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.post("/run-code/stream")
+async def run_code_stream(
+    request: Request,
+    code: Code,
+    current_user=Depends(get_current_user),
+    _: bool = Depends(RateLimiter(times=20, seconds=60, identifier=get_identifier)),
+):
+    """
+    Run Python code and stream its output as server-sent events
+
+    Emits `stdout` and `stderr` events (JSON-encoded text) as the program
+    prints, then a single `done` or `error` event.
+    """
+    user, user_id = current_user
+    events = stream_code(Code(code=code.code or ""), user_id)
+
+    async def event_stream():
+        async for event in events:
+            name = event.pop("event")
+            payload = event["data"] if name in ("stdout", "stderr") else event
+            yield f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/run-batch", response_model=Dict[str, Any])
+async def run_code_batch(
+    request: Request,
+    batch: BatchRunRequest,
+    current_user=Depends(get_current_user),
+    _: bool = Depends(RateLimiter(times=20, seconds=60, identifier=get_identifier)),
+):
+    """
+    Run Python code once per stdin payload and return each run's output
+    """
+    user, user_id = current_user
+    try:
+        return await run_with_inputs(batch.code or "", batch.inputs, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.post("/grade", response_model=Dict[str, Any])
+async def grade_code(
+    request: Request,
+    grade_request: GradeRequest,
+    current_user=Depends(get_current_user),
+    _: bool = Depends(RateLimiter(times=20, seconds=60, identifier=get_identifier)),
+):
+    """
+    Grade code against a coding exercise's test cases
+    """
+    user, user_id = current_user
+    try:
+        return await grade_submission(
+            grade_request.code or "",
+            grade_request.exercise,
+            user_id,
+            stop_on_failure=bool(grade_request.stop_on_failure),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
@@ -92,6 +173,13 @@ async def save_code_history(
             
         if history.execution_time is not None:
             history_data["execution_time"] = history.execution_time
+
+        if history.usage:
+            history_data["usage"] = {
+                key: history.usage[key]
+                for key in ("cpu_user_ms", "cpu_system_ms", "max_rss_kb", "output_bytes", "wall_ms")
+                if isinstance(history.usage.get(key), (int, float))
+            }
             
         if history.is_submission is not None:
             history_data["is_submission"] = history.is_submission
@@ -200,6 +288,8 @@ async def get_user_code_analytics(
                 "attempts": {"$sum": 1},
                 "submissions": {"$sum": {"$cond": ["$is_submission", 1, 0]}},
                 "avg_execution_time": {"$avg": "$execution_time"},
+                "avg_cpu_ms": {"$avg": {"$add": ["$usage.cpu_user_ms", "$usage.cpu_system_ms"]}},
+                "max_rss_kb": {"$max": "$usage.max_rss_kb"},
                 "last_attempt": {"$max": "$created_at"}
             }},
             {"$sort": {"_id": 1}}
@@ -233,6 +323,8 @@ async def get_problem_analytics(
                 "attempts": {"$sum": 1},
                 "submissions": {"$sum": {"$cond": ["$is_submission", 1, 0]}},
                 "avg_execution_time": {"$avg": "$execution_time"},
+                "avg_cpu_ms": {"$avg": {"$add": ["$usage.cpu_user_ms", "$usage.cpu_system_ms"]}},
+                "max_rss_kb": {"$max": "$usage.max_rss_kb"},
                 "last_attempt": {"$max": "$created_at"}
             }},
             {"$sort": {"attempts": -1}}
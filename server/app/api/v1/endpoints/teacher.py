@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.core.security import get_current_user
-from app.db.database import collection
+from app.db.database import mongo
+from app.services.autograder_service import autograde_assignment
 from typing import List, Dict, Optional
 from bson import ObjectId
 
@@ -21,7 +22,7 @@ async def get_all_students(current_user: dict = Depends(get_current_user)):
             )
 
         # Get all users with role "student" from MongoDB
-        students = list(collection.find(
+        students = await mongo.users.find(
             {"role": "student"},
             {
                 "hashed_password": 0,  # Exclude sensitive data
@@ -32,7 +33,7 @@ async def get_all_students(current_user: dict = Depends(get_current_user)):
                 "email": 1,
                 "_id": 1
             }
-        ))
+        ).to_list(length=None)
 
         # Format the data to match what the front-end expects
         formatted_students = []
@@ -55,4 +56,38 @@ async def get_all_students(current_user: dict = Depends(get_current_user)):
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch students: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+@router.post("/assignments/{assignment_id}/autograde",
+    summary="Autograde an assignment",
+    description="Grades the pending and late submissions of an assignment that were not "
+                "autograded since they were submitted (all of them with regrade=true) "
+                "and reports throughput")
+async def autograde(
+    request: Request,
+    assignment_id: str,
+    regrade: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    user, user_id = current_user
+
+    # Verify the user is a teacher
+    if user.get("role") != "teacher":
+        raise HTTPException(
+            status_code=403,
+            detail="Only teachers can access this endpoint"
+        )
+
+    if request.app.mongodb is None:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return await autograde_assignment(request.app.mongodb, assignment_id, regrade)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to autograde assignment: {str(e)}"
+        )
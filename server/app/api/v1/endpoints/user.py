@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
 from app.core.security import get_current_user
-from app.db.database import collection
+from app.db.database import mongo
 from typing import List, Dict, Optional
 from datetime import datetime
 from pydantic import BaseModel
@@ -53,12 +53,12 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
 async def get_all_users():
     try:
         # Get all users from MongoDB - Fixed projection
-        users = list(collection.find(
+        users = await mongo.users.find(
             {},  # Empty filter to get all documents
             {
                 "hashed_password": 0  # Only exclude hashed_password
             }
-        ))
+        ).to_list(length=None)
 
         # Convert ObjectId to string for JSON serialization
         for user in users:
@@ -90,15 +90,15 @@ async def get_users_paginated(
 ):
     try:
         # Get total count
-        total_users = collection.count_documents({})
+        total_users = await mongo.users.count_documents({})
 
         # Get paginated users - Fixed projection
-        users = list(collection.find(
+        users = await mongo.users.find(
             {},
             {
                 "hashed_password": 0  # Only exclude hashed_password
             }
-        ).skip(skip).limit(limit))
+        ).skip(skip).limit(limit).to_list(length=None)
 
         # Convert ObjectId to string for JSON serialization
         for user in users:
@@ -173,7 +173,7 @@ async def update_skill_level(
             )
 
         # Update user's skill level in database
-        result = collection.update_one(
+        result = await mongo.users.update_one(
             {"_id": ObjectId(user_id)},
             {
                 "$set": {
@@ -243,7 +243,7 @@ async def get_all_students(current_user: dict = Depends(get_current_user)):
             )
 
         # Get all users with role "student"
-        users = list(collection.find(
+        users = await mongo.users.find(
             {"role": "student"},
             {
                 "_id": 1,
@@ -254,7 +254,7 @@ async def get_all_students(current_user: dict = Depends(get_current_user)):
                 "skill_level": 1,
                 "email": 1       # Explicitly include email field
             }
-        ))
+        ).to_list(length=None)
 
         # Format the data for frontend
         formatted_users = []
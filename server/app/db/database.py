@@ -1,10 +1,133 @@
-from pymongo import MongoClient
+"""
+The app's single MongoDB connection.
+
+Every module reaches MongoDB through ``mongo``: one Motor client, and so one
+connection pool, shared by the API, authentication and the AI tutor. The pool
+is sized with MONGODB_MAX_POOL_SIZE. The app lifespan calls ``connect``;
+outside of it (scripts, tests) the client is created on first use.
+
+Data lives in two databases on that client: MONGODB_DB (code history,
+keystrokes, assignments and submissions) and MONGODB_ACCOUNTS_DB (users and
+the AI tutor's conversations, quotas and logs).
+"""
+import asyncio
+import logging
 import os
+from typing import Optional
+
 from dotenv import load_dotenv
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase,
+)
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017")
-client = MongoClient(MONGO_URI)
-db = client["mydatabase"]
-collection = db["users"]
+MONGODB_DB = os.getenv("MONGODB_DB", "users")
+MONGODB_ACCOUNTS_DB = os.getenv("MONGODB_ACCOUNTS_DB", "mydatabase")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_TIMEOUT_MS = 5000
+
+
+class MongoDatabase:
+    """Owner of the Motor client and accessor for every collection."""
+
+    def __init__(self):
+        self._client: Optional[AsyncIOMotorClient] = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(
+                MONGO_URI,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+                connectTimeoutMS=MONGODB_TIMEOUT_MS,
+            )
+        return self._client
+
+    async def connect(self, retries: int = 5, delay: float = 2) -> AsyncIOMotorClient:
+        """
+        Create the client and check that MongoDB answers, with retries.
+
+        Raises:
+            Exception: The last connection error if every attempt failed
+        """
+        for attempt in range(retries):
+            try:
+                await self.client.admin.command("ping")
+                logger.info("Successfully connected to MongoDB")
+                return self.client
+            except Exception as e:
+                if attempt == retries - 1:
+                    logger.error(f"Failed to connect to MongoDB after {retries} attempts: {str(e)}")
+                    raise
+                logger.warning(f"MongoDB connection attempt {attempt + 1} failed, retrying... Error: {str(e)}")
+                await asyncio.sleep(delay)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        return self.client[MONGODB_DB]
+
+    @property
+    def accounts_db(self) -> AsyncIOMotorDatabase:
+        return self.client[MONGODB_ACCOUNTS_DB]
+
+    # Accounts and the AI tutor
+    @property
+    def users(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["users"]
+
+    @property
+    def interaction_logs(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["interaction_logs"]
+
+    @property
+    def code_patterns(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["code_patterns"]
+
+    @property
+    def hint_history(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["hint_history"]
+
+    @property
+    def conversations(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["conversations"]
+
+    @property
+    def question_resets(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["question_resets"]
+
+    @property
+    def exercises(self) -> AsyncIOMotorCollection:
+        return self.accounts_db["exercises"]
+
+    # Code and coursework
+    @property
+    def code_history(self) -> AsyncIOMotorCollection:
+        return self.db["code_history"]
+
+    @property
+    def code_keystrokes(self) -> AsyncIOMotorCollection:
+        return self.db["code_keystrokes"]
+
+    @property
+    def assignments(self) -> AsyncIOMotorCollection:
+        return self.db["assignments"]
+
+    @property
+    def submissions(self) -> AsyncIOMotorCollection:
+        return self.db["submissions"]
+
+
+mongo = MongoDatabase()
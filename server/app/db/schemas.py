@@ -271,6 +271,17 @@ class Code(BaseModel):
     code: str
 
 
+class BatchRunRequest(BaseModel):
+    code: str
+    inputs: List[str]  # stdin payloads, one run each
+
+
+class GradeRequest(BaseModel):
+    code: str
+    exercise: CodingExercise
+    stop_on_failure: Optional[bool] = False
+
+
 class CodeHistory(BaseModel):
     user_id: Optional[str] = None  # Will be set by the server
     username: Optional[str] = None  # Store the username for easier identification
@@ -280,6 +291,7 @@ class CodeHistory(BaseModel):
     output: Optional[str] = None
     error: Optional[str] = None
     execution_time: Optional[float] = None
+    usage: Optional[Dict[str, Any]] = None  # Sandbox CPU/memory/output accounting
     is_submission: Optional[bool] = False
     action_type: Optional[str] = "run"
     created_at: Optional[datetime] = None  # Will be set by the server
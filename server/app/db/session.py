@@ -1,7 +1,5 @@
-from app.db.database import db
-
-def get_user(db, username: str):
-    user = db.find_one({"username": username})
+async def get_user(users, username: str):
+    user = await users.find_one({"username": username})
     if user:
         return user
     return None
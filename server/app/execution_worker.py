@@ -0,0 +1,64 @@
+"""
+Standalone code execution worker.
+
+Run with ``python -m app.execution_worker``. Pops jobs that API processes in
+``EXECUTION_MODE=queue`` push onto Redis, runs them on a local warm sandbox
+pool and pushes the results back (see ``app.services.execution_queue``).
+Start as many of these as execution capacity requires.
+"""
+import asyncio
+import logging
+import os
+import signal
+
+import redis.asyncio as redis
+
+from app.services.execution_queue import ExecutionQueue
+from app.services.run_code_service import sandbox_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Jobs handled at once; defaults to one per warm sandbox worker
+EXECUTION_WORKER_CONCURRENCY = int(
+    os.getenv("EXECUTION_WORKER_CONCURRENCY", str(max(sandbox_pool.size, 1)))
+)
+
+
+async def main() -> None:
+    redis_instance = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=0,
+        decode_responses=True,
+        socket_timeout=5,
+        socket_connect_timeout=5,
+    )
+    await redis_instance.ping()
+    queue = ExecutionQueue("queue")
+    queue.bind_redis(redis_instance)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await sandbox_pool.start()
+    logger.info(
+        f"Execution worker consuming with concurrency {EXECUTION_WORKER_CONCURRENCY}"
+    )
+    try:
+        await asyncio.gather(
+            *(
+                queue.consume(sandbox_pool, stop)
+                for _ in range(EXECUTION_WORKER_CONCURRENCY)
+            )
+        )
+    finally:
+        await sandbox_pool.close()
+        await redis_instance.close()
+        logger.info("Execution worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,16 @@ import redis.asyncio as redis
 import logging
 import asyncio
 from app.api.v1.endpoints import auth, user, code, ai, test, teacher
+from app.services.run_code_service import (
+    admission_controller,
+    execution_cache,
+    sandbox_pool,
+    scratch_dirs,
+)
+from app.services.execution_queue import execution_queue
+from app.db.database import mongo
+from app.services import chat_service
+from app.services.chat_service import close_anthropic_client, start_anthropic_client
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from typing import Optional
 
@@ -20,27 +30,6 @@ class CustomFastAPI(FastAPI):
     redis_instance: Optional[redis.Redis] = None
 
 
-async def connect_to_mongo(retries=5, delay=2) -> AsyncIOMotorClient:
-    """Connect to MongoDB with retry logic"""
-    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-    for attempt in range(retries):
-        try:
-            client = AsyncIOMotorClient(
-                mongo_uri,
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=5000
-            )
-            await client.admin.command("ping")
-            logger.info("Successfully connected to MongoDB")
-            return client
-        except Exception as e:
-            if attempt == retries - 1:
-                logger.error(f"Failed to connect to MongoDB after {retries} attempts: {str(e)}")
-                raise
-            logger.warning(f"MongoDB connection attempt {attempt + 1} failed, retrying... Error: {str(e)}")
-            await asyncio.sleep(delay)
-
-
 async def connect_to_redis(retries=5, delay=2):
     """Connect to Redis with retry logic"""
     redis_host = os.getenv("REDIS_HOST", "localhost")
@@ -69,7 +58,7 @@ async def connect_to_redis(retries=5, delay=2):
 
 async def setup_mongo_indexes(app: CustomFastAPI):
     """Setup MongoDB indexes with proper error handling"""
-    if not app.mongodb:
+    if app.mongodb is None:
         return
         
     try:
@@ -107,11 +96,13 @@ async def lifespan(app: CustomFastAPI):
     try:
         # Connect to MongoDB with more resilient error handling
         try:
-            client = await connect_to_mongo()
-            app.mongodb_client = client
-            if app.mongodb_client is not None:
-                app.mongodb = app.mongodb_client[os.getenv("MONGODB_DB", "users")]
-                await setup_mongo_indexes(app)
+            # Every module shares this one client and its connection pool
+            app.mongodb_client = await mongo.connect()
+            app.mongodb = mongo.db
+            await setup_mongo_indexes(app)
+            await chat_service.setup_database()
+            chat_service.interaction_log_buffer.start()
+            chat_service.hint_history_buffer.start()
         except Exception as e:
             logger.error(f"MongoDB connection failed: {str(e)}")
             # Continue even if MongoDB fails - the app might still work partially
@@ -123,23 +114,58 @@ async def lifespan(app: CustomFastAPI):
             redis_instance = await connect_to_redis()
             app.redis_instance = redis_instance
             await FastAPILimiter.init(redis_instance)
+            execution_cache.bind_redis(redis_instance)
+            execution_queue.bind_redis(redis_instance)
+            chat_service.solution_seeking_counter.bind_redis(redis_instance)
         except Exception as e:
             logger.error(f"Redis connection failed: {str(e)}")
             # Continue even if Redis fails
             app.redis_instance = None
 
+        # Warm up the code execution sandbox workers (in queue mode runs go to
+        # the execution workers, so the local pool only starts if it's needed)
+        if sandbox_pool.enabled and not execution_queue.enabled:
+            try:
+                await sandbox_pool.start()
+            except Exception as e:
+                logger.error(f"Sandbox pool startup failed: {str(e)}")
+
+        # One Anthropic client (and HTTPS connection pool) for every chat
+        try:
+            start_anthropic_client()
+        except Exception as e:
+            logger.error(f"Anthropic client setup failed: {str(e)}")
+
+        # Create the cold-start scratch directories before the first run
+        try:
+            scratch_dirs.start()
+        except OSError as e:
+            logger.error(f"Scratch directory setup failed: {str(e)}")
+
         logger.info("Services initialized")
         yield
     finally:
         # Clean up resources
-        if app.mongodb_client:
-            app.mongodb_client.close()
+        # Write the buffered logs and hint history before the connection goes away
+        await chat_service.interaction_log_buffer.close()
+        await chat_service.hint_history_buffer.close()
+        if app.mongodb_client is not None:
+            app.mongodb_client = None
+            app.mongodb = None
             logger.info("MongoDB connection closed")
+        mongo.close()
             
         if app.redis_instance:
+            execution_cache.bind_redis(None)
+            execution_queue.bind_redis(None)
+            chat_service.solution_seeking_counter.bind_redis(None)
             await app.redis_instance.close()
             logger.info("Redis connection closed")
 
+        await sandbox_pool.close()
+        await scratch_dirs.close()
+        await close_anthropic_client()
+
 
 # Get environment variables with appropriate defaults for production
 debug_mode = os.getenv("DEBUG", "False").lower() == "true"
@@ -204,7 +230,9 @@ async def health_check():
         "status": "ok", 
         "service": "DevOnaut API",
         "mongo_connected": app.mongodb_client is not None,
-        "redis_connected": app.redis_instance is not None
+        "redis_connected": app.redis_instance is not None,
+        "execution": admission_controller.stats(),
+        "scratch_dirs": scratch_dirs.stats(),
     }
 
 # Include all the API routes
@@ -11,7 +11,7 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from app.db.session import get_user
 from app.db.schemas import User
-from app.db.database import collection
+from app.db.database import mongo
 from app.core.config import SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.core.security import verify_password, get_password_hash, create_access_token
 from bson import ObjectId
@@ -44,7 +44,7 @@ async def register(user: User):
     Register a new user in the database
     """
     # Check if username already exists
-    if get_user(collection, user.username):
+    if await get_user(mongo.users, user.username):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create user document
@@ -61,7 +61,7 @@ async def register(user: User):
 
     try:
         # Insert into MongoDB
-        result = collection.insert_one(user_doc)
+        result = await mongo.users.insert_one(user_doc)
 
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="Failed to create user")
@@ -87,7 +87,7 @@ async def login(response: Response, user: User):
     """
     Authenticate a user and return a JWT token
     """
-    user_data = get_user(collection, user.username)
+    user_data = await get_user(mongo.users, user.username)
     if not user_data or not verify_password(
         user.password, user_data["hashed_password"]
     ):
@@ -164,7 +164,7 @@ async def login_with_tu(response: Response, username: str, password: str):
             tu_faculty = tu_data.get("faculty", "")
 
             # Check if user exists in our database
-            existing_user = get_user(collection, tu_username)
+            existing_user = await get_user(mongo.users, tu_username)
 
             # Prepare user document with all available TU data
             user_doc = {
@@ -192,7 +192,7 @@ async def login_with_tu(response: Response, username: str, password: str):
                 )
 
                 # Insert new user
-                result = collection.insert_one(user_doc)
+                result = await mongo.users.insert_one(user_doc)
                 if not result.inserted_id:
                     raise HTTPException(
                         status_code=500,
@@ -200,7 +200,7 @@ async def login_with_tu(response: Response, username: str, password: str):
                     )
             else:
                 # Update existing user with latest TU information
-                collection.update_one({"username": tu_username}, {"$set": user_doc})
+                await mongo.users.update_one({"username": tu_username}, {"$set": user_doc})
 
             # Create access token with role information
             access_token_expires = timedelta(minutes=120)  # 2 hours
@@ -309,7 +309,7 @@ async def process_google_callback(request: Request, code: Optional[str] = None):
     picture = user_data.get("picture")
 
     # Check if user exists and has complete profile
-    existing_user = get_user(collection, email)
+    existing_user = await get_user(mongo.users, email)
     is_new_user = False
     needs_profile = False
     role = "student"  # Default role
@@ -317,7 +317,7 @@ async def process_google_callback(request: Request, code: Optional[str] = None):
     if not existing_user:
         # First time Google sign-in - create a new user
         hashed_password = get_password_hash("defaultpassword")
-        collection.insert_one(
+        await mongo.users.insert_one(
             {
                 "username": email,
                 "hashed_password": hashed_password,
@@ -344,7 +344,7 @@ async def process_google_callback(request: Request, code: Optional[str] = None):
             )
         logger.info(f"Creating new user from Google auth: {email}")
         hashed_password = get_password_hash("defaultpassword")
-        collection.insert_one(
+        await mongo.users.insert_one(
             {
                 "username": email,
                 "hashed_password": hashed_password,
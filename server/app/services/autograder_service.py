@@ -0,0 +1,288 @@
+"""
+Bulk autograder for assignments.
+
+Streams an assignment's pending and late submissions from Mongo and grades
+every exercise that has an objective answer:
+
+- ``output`` and ``fill`` answers are compared in-process against answers
+  normalized once per exercise, so each submission costs a few dict/set
+  lookups;
+- ``coding`` answers are graded against the exercise's test cases on a
+  dedicated sandbox pool with one warm worker per CPU, many submissions at a
+  time. Their scores are provisional: a submission with a coding exercise
+  always waits for a teacher to confirm it;
+- ``explain`` answers are left for the teacher.
+
+Scores are written back in unordered bulk writes, one per chunk of
+submissions. A submission is only marked graded when every exercise was
+scored in-process; late submissions keep a ``late`` flag when they are.
+Submissions already autograded are skipped unless they were submitted again
+since, or the caller asks for a regrade.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.db.schemas import CodingExercise, Exercise
+from app.services.grading_service import grade_code
+from app.services.run_code_service import SANDBOX_WORKER_MAX_USES, sandbox_pool
+from app.services.sandbox_pool import SandboxPool
+
+logger = logging.getLogger(__name__)
+
+AUTOGRADE_POOL_SIZE = int(os.getenv("AUTOGRADE_POOL_SIZE", str(os.cpu_count() or 1)))
+# Submissions graded concurrently and written back per bulk write
+AUTOGRADE_CHUNK_SIZE = int(os.getenv("AUTOGRADE_CHUNK_SIZE", "64"))
+
+
+def normalize_answer(value: Any) -> str:
+    """Normalize an answer for comparison: trim lines, collapse inner spaces."""
+    if value is None:
+        return ""
+    lines = (" ".join(line.split()) for line in str(value).strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _blank_answers(blank: Dict[str, Any]) -> Optional[frozenset]:
+    """Accepted answers for one blank, or None if the blank has no key."""
+    accepted = blank.get("answers", blank.get("answer"))
+    if accepted is None:
+        return None
+    if not isinstance(accepted, (list, tuple)):
+        accepted = [accepted]
+    return frozenset(normalize_answer(answer) for answer in accepted)
+
+
+class AnswerKey:
+    """An exercise's expected answers, normalized once for every submission."""
+
+    def __init__(self, exercise: Exercise):
+        self.exercise = exercise
+        self.points = exercise.points or 0
+        self.auto = False
+        self.expected_output = None
+        self.blanks: List[frozenset] = []
+        self.coding: Optional[CodingExercise] = None
+
+        if exercise.type == "output" and exercise.expected_output is not None:
+            self.expected_output = normalize_answer(exercise.expected_output)
+            self.auto = True
+        elif exercise.type == "fill" and exercise.blanks:
+            blanks = [_blank_answers(blank) for blank in exercise.blanks]
+            if all(accepted is not None for accepted in blanks):
+                self.blanks = blanks
+                self.auto = True
+        elif exercise.type == "coding" and (
+            (exercise.test_cases or "").strip()
+            or (exercise.expected_output or "").strip()
+        ):
+            self.coding = CodingExercise(**exercise.model_dump(exclude_none=True))
+            self.auto = True
+
+    @property
+    def in_process(self) -> bool:
+        return self.auto and self.coding is None
+
+    def grade(self, answer: Any) -> Dict[str, Any]:
+        """Grade an output or fill answer."""
+        if self.expected_output is not None:
+            correct = normalize_answer(answer) == self.expected_output
+            return {
+                "score": self.points if correct else 0,
+                "feedback": "Correct output" if correct else "Output does not match",
+            }
+
+        answers = answer if isinstance(answer, (list, tuple)) else [answer]
+        correct = sum(
+            1
+            for accepted, given in zip(self.blanks, answers)
+            if normalize_answer(given) in accepted
+        )
+        return {
+            "score": round(self.points * correct / len(self.blanks), 2),
+            "feedback": f"{correct}/{len(self.blanks)} blanks correct",
+        }
+
+
+def _answer_for(submission: Dict[str, Any], exercise_id: int) -> Any:
+    # Mongo stores the answers' int keys as strings
+    answers = submission.get("answers") or {}
+    return answers.get(str(exercise_id), answers.get(exercise_id))
+
+
+async def _grade_coding(
+    key: AnswerKey, answer: Any, user_id: str, pool: SandboxPool
+) -> Dict[str, Any]:
+    try:
+        result = await grade_code(str(answer or ""), key.coding, user_id, pool=pool)
+    except HTTPException as e:
+        return {"score": 0, "feedback": str(e.detail)}
+    if "cases" not in result:
+        # Infrastructure failure: leave the exercise for manual review
+        return {"score": None, "feedback": result.get("error")}
+    score = key.points * result["passed_count"] / result["total"]
+    feedback = f"{result['passed_count']}/{result['total']} test cases passed"
+    if result["error"]:
+        feedback = f"{feedback} ({result['error']})"
+    return {"score": round(score, 2), "feedback": feedback}
+
+
+async def grade_submission_document(
+    submission: Dict[str, Any], keys: List[AnswerKey], pool: SandboxPool
+) -> Dict[str, Any]:
+    """
+    Grade every auto-gradable exercise of one submission.
+
+    Args:
+        submission: Submission document from Mongo
+        keys: Answer keys for the assignment's exercises
+        pool: Sandbox pool for coding exercises
+
+    Returns:
+        Fields to $set on the submission. It is marked graded only when no
+        exercise is left for manual review and it has no coding exercise,
+        whose test-case scores a teacher confirms.
+    """
+    user_id = str(submission.get("user_id", ""))
+    results: Dict[str, Dict[str, Any]] = {}
+    coding = []
+    for key in keys:
+        if not key.auto:
+            continue
+        answer = _answer_for(submission, key.exercise.id)
+        if key.in_process:
+            results[str(key.exercise.id)] = key.grade(answer)
+        else:
+            coding.append((key, _grade_coding(key, answer, user_id, pool)))
+
+    for (key, _), result in zip(
+        coding, await asyncio.gather(*(task for _, task in coding))
+    ):
+        results[str(key.exercise.id)] = result
+
+    graded = {
+        exercise_id: result
+        for exercise_id, result in results.items()
+        if result["score"] is not None
+    }
+    auto_score = round(sum(result["score"] for result in graded.values()), 2)
+    needs_review = len(graded) < len(keys) or bool(coding)
+
+    # Keep any feedback the teacher already wrote for other exercises
+    feedback = dict(submission.get("feedback") or {})
+    feedback.update(
+        (exercise_id, result["feedback"]) for exercise_id, result in results.items()
+    )
+    now = datetime.now()
+    update = {
+        "auto_score": auto_score,
+        "exercise_scores": {
+            exercise_id: result["score"] for exercise_id, result in graded.items()
+        },
+        "feedback": feedback,
+        "autograded_at": now,
+        "needs_review": needs_review,
+    }
+    if not needs_review:
+        update.update({"score": auto_score, "status": "graded", "graded_at": now})
+        if submission.get("status") == "late":
+            update["late"] = True
+
+    return update
+
+
+async def autograde_assignment(
+    db, assignment_id: str, regrade: bool = False
+) -> Dict[str, Any]:
+    """
+    Grade the pending and late submissions of an assignment.
+
+    Args:
+        db: Motor database holding the assignments and submissions collections
+        assignment_id: ID of the assignment to grade
+        regrade: Also grade submissions that were already autograded and
+            have not been submitted again since
+
+    Returns:
+        Dict with the number of submissions graded, how many still need
+        manual review, elapsed time and throughput in submissions per second
+
+    Raises:
+        HTTPException: 404 if the assignment does not exist
+    """
+    assignment = await db["assignments"].find_one({"id": assignment_id})
+    if assignment is None:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    keys = [AnswerKey(Exercise(**exercise)) for exercise in assignment.get("exercises", [])]
+
+    pool = SandboxPool(
+        size=AUTOGRADE_POOL_SIZE,
+        max_uses=SANDBOX_WORKER_MAX_USES,
+        env=sandbox_pool.env,
+        preexec_fn=sandbox_pool.preexec_fn,
+    )
+    submissions = db["submissions"]
+    started = time.monotonic()
+    graded = 0
+    needs_review = 0
+
+    async def flush(chunk: List[Dict[str, Any]]) -> None:
+        nonlocal graded, needs_review
+        updates = await asyncio.gather(
+            *(grade_submission_document(doc, keys, pool) for doc in chunk)
+        )
+        await submissions.bulk_write(
+            [
+                UpdateOne({"_id": doc["_id"]}, {"$set": update})
+                for doc, update in zip(chunk, updates)
+            ],
+            ordered=False,
+        )
+        graded += len(updates)
+        needs_review += sum(1 for update in updates if update["needs_review"])
+
+    try:
+        if any(key.coding is not None for key in keys):
+            await pool.start()
+        query = {"assignment_id": assignment_id, "status": {"$in": ["pending", "late"]}}
+        if not regrade:
+            # Coding submissions stay pending for review; don't grade them again
+            query["$or"] = [
+                {"autograded_at": {"$exists": False}},
+                {"$expr": {"$gt": ["$submitted_at", "$autograded_at"]}},
+            ]
+        chunk = []
+        cursor = submissions.find(
+            query,
+            {"answers": 1, "user_id": 1, "feedback": 1, "status": 1},
+            batch_size=AUTOGRADE_CHUNK_SIZE,
+        )
+        async for submission in cursor:
+            chunk.append(submission)
+            if len(chunk) >= AUTOGRADE_CHUNK_SIZE:
+                await flush(chunk)
+                chunk = []
+        if chunk:
+            await flush(chunk)
+    finally:
+        await pool.close()
+
+    elapsed = time.monotonic() - started
+    rate = graded / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        f"Autograded {graded} submissions for assignment {assignment_id} "
+        f"in {elapsed:.2f}s ({rate:.1f}/s)"
+    )
+    return {
+        "assignment_id": assignment_id,
+        "graded": graded,
+        "needs_review": needs_review,
+        "elapsed_seconds": round(elapsed, 3),
+        "submissions_per_second": round(rate, 2),
+    }
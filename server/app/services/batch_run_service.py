@@ -0,0 +1,146 @@
+"""
+Run one program against many stdin payloads in a single sandboxed process.
+
+Intro exercises read their data with ``input()``. Instead of one request and
+one process per input scenario, the whole batch is sent to one sandbox
+worker, which compiles the program once and runs it per payload with fresh
+globals, its own stdin and captured stdout (see ``sandbox_worker.run_batch``).
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+
+from app.services.run_code_service import (
+    analyze_code,
+    execution_scheduler,
+    run_sandbox_job,
+)
+from app.services.sandbox_pool import SandboxUnavailable
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_INPUTS = int(os.getenv("MAX_BATCH_INPUTS", "50"))
+MAX_BATCH_INPUT_SIZE = 16 * 1024  # characters per stdin payload
+BATCH_CASE_TIME_LIMIT = int(os.getenv("BATCH_CASE_TIME_LIMIT", "2"))  # seconds
+BATCH_TIME_LIMIT = int(os.getenv("BATCH_TIME_LIMIT", "10"))  # seconds, whole batch
+BATCH_CASE_OUTPUT_LIMIT = 16 * 1024  # characters per case
+
+
+def _check_inputs(inputs: List[str]) -> None:
+    if not inputs:
+        raise HTTPException(status_code=400, detail="At least one input is required")
+    if len(inputs) > MAX_BATCH_INPUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many inputs (at most {MAX_BATCH_INPUTS} per batch)",
+        )
+    if any(len(payload) > MAX_BATCH_INPUT_SIZE for payload in inputs):
+        raise HTTPException(status_code=400, detail="Input too large")
+
+
+def _build_results(inputs: List[str], result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Match per-case report frames to inputs, filling in cases that never ran."""
+    reported = {
+        report["index"]: report
+        for report in result.get("reports", [])
+        if report.get("event") == "case"
+    }
+    results = []
+    batch_timed_out = result.get("timed_out")
+    for index, payload in enumerate(inputs):
+        report = reported.get(index)
+        if report is None:
+            # Only the case running when the batch was killed timed out
+            results.append(
+                {
+                    "index": index,
+                    "input": payload,
+                    "output": "",
+                    "error": "Execution timed out" if batch_timed_out else "Not run",
+                    "timed_out": bool(batch_timed_out),
+                    "truncated": False,
+                    "time_ms": 0.0,
+                }
+            )
+            batch_timed_out = False
+            continue
+        error = report["error"]
+        if report["timed_out"]:
+            error = f"Execution timed out ({BATCH_CASE_TIME_LIMIT}s limit)"
+        elif report["truncated"]:
+            error = f"Output limit exceeded ({BATCH_CASE_OUTPUT_LIMIT // 1024}KB limit)"
+        results.append(
+            {
+                "index": index,
+                "input": payload,
+                "output": report["output"].rstrip(),
+                "error": error,
+                "timed_out": report["timed_out"],
+                "truncated": report["truncated"],
+                "time_ms": round(report["time_ms"], 3),
+            }
+        )
+    return results
+
+
+async def run_with_inputs(code: str, inputs: List[str], user_id: str) -> Dict[str, Any]:
+    """
+    Run code once per stdin payload in a single sandboxed interpreter.
+
+    Args:
+        code: Python code to run
+        inputs: stdin payloads, one per run
+        user_id: ID of the user running the code
+
+    Returns:
+        Dict with per-input results (index, input, output, error, timed_out,
+        truncated, time_ms), or an error
+
+    Raises:
+        HTTPException: 400 for unsafe code or too many/too large inputs,
+            429 if the user's queue is full
+    """
+    _check_inputs(inputs)
+    if not analyze_code(code).safe:
+        raise HTTPException(
+            status_code=400, detail="Potentially dangerous code detected"
+        )
+
+    job = {
+        "kind": "batch",
+        "code": code,
+        "inputs": inputs,
+        "case_timeout": BATCH_CASE_TIME_LIMIT,
+        "timeout": BATCH_TIME_LIMIT,
+        "cpu_limit": BATCH_TIME_LIMIT,
+        "max_output": BATCH_CASE_OUTPUT_LIMIT,
+        "env": {"USER_ID": str(user_id)},
+    }
+    async with execution_scheduler.slot(user_id) as queue_wait:
+        try:
+            result = await run_sandbox_job(job)
+        except asyncio.TimeoutError:
+            return {"error": "Request timed out"}
+        except SandboxUnavailable as e:
+            logger.error(f"Batch run failed to start: {str(e)}")
+            return {"error": "Code execution is temporarily unavailable"}
+
+    if result.get("event") != "result":
+        logger.error(f"Sandbox worker error: {result.get('error')}")
+        return {"error": f"Server error: {result.get('error')}"}
+
+    compile_errors = [
+        report for report in result.get("reports", [])
+        if report.get("event") == "compile_error"
+    ]
+    if compile_errors:
+        return {"error": f"Runtime error: {compile_errors[0]['error']}"}
+
+    return {
+        "results": _build_results(inputs, result),
+        "user_id": user_id,
+        "queue_wait_ms": round(queue_wait * 1000, 2),
+    }
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache of code execution results.
+
+Results are keyed by a hash of the source plus a salt describing the
+interpreter and sandbox limits, so identical programs (starter code,
+unchanged re-runs, exercise examples) skip the sandbox entirely. There is an
+in-process LRU tier bounded by entry count, total size and TTL, plus an
+optional Redis tier shared by every API worker.
+
+Programs whose output can change between runs (reading input, randomness,
+clocks, object identity, set ordering) are never cached; run_code_service's
+analyze_code decides that from these names while validating the program.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "run_code:result:"
+
+NONDETERMINISTIC_MODULES = {
+    "random",
+    "time",
+    "datetime",
+    "secrets",
+    "uuid",
+    "threading",
+    "multiprocessing",
+    "asyncio",
+}
+NONDETERMINISTIC_NAMES = {"input", "id", "hash", "set", "frozenset"}
+
+
+def is_cacheable_result(result: Dict[str, Any]) -> bool:
+    """Only clean runs and ordinary exceptions are worth replaying."""
+    if "output" in result:
+        return True
+    error = result.get("error", "")
+    return error.startswith("Runtime error:") and "Traceback" in error
+
+
+class ExecutionCache:
+    """Two-tier (in-process LRU + optional Redis) result cache."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        redis_ttl: int,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.redis = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def bind_redis(self, redis_instance) -> None:
+        """Enable the shared Redis tier (None disables it)."""
+        self.redis = redis_instance
+
+    @staticmethod
+    def key(code: str, salt: str) -> str:
+        return hashlib.sha256(f"{salt}\0{code}".encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result, or None on a miss."""
+        payload = self._get_local(key)
+        if payload is None and self.redis is not None:
+            try:
+                payload = await self.redis.get(REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"Execution cache Redis read failed: {str(e)}")
+            if payload is not None:
+                self._set_local(key, payload)
+
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(payload)
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        payload = json.dumps(result)
+        self._set_local(key, payload)
+        if self.redis is not None:
+            try:
+                await self.redis.set(REDIS_KEY_PREFIX + key, payload, ex=self.redis_ttl)
+            except Exception as e:
+                logger.warning(f"Execution cache Redis write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis": self.redis is not None,
+        }
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def _set_local(self, key: str, payload: str) -> None:
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl, payload)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
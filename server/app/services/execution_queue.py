@@ -0,0 +1,134 @@
+"""
+Redis-backed queue between the API and dedicated execution workers.
+
+With ``EXECUTION_MODE=queue`` the API does not run sandboxes itself: each job
+(the same job dict the warm sandbox workers understand) is pushed onto a
+Redis list, one of the ``app.execution_worker`` processes pops it, runs it on
+its own sandbox pool, and pushes the result frame onto a per-job reply key
+that the API is blocking on. Execution capacity then scales by adding worker
+containers, independently of the API processes.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict
+
+from app.services.sandbox_pool import WORKER_GRACE_PERIOD, SandboxPool, SandboxUnavailable
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "local")  # "local" or "queue"
+JOBS_KEY = "run_code:jobs"
+REPLY_KEY_PREFIX = "run_code:reply:"
+# How long a job may wait in the queue for a free worker
+EXECUTION_QUEUE_TIMEOUT = int(os.getenv("EXECUTION_QUEUE_TIMEOUT", "10"))  # seconds
+# Reply keys outlive an API that gave up waiting by this long
+REPLY_TTL = 60  # seconds
+# Blocking pops are sliced below the Redis client's 5s socket timeout
+BLOCK_SLICE = 2  # seconds
+
+
+class ExecutionQueue:
+    """Job submission (API side) and consumption (worker side) over Redis."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.redis = None
+
+    def bind_redis(self, redis_instance) -> None:
+        """Attach the shared Redis connection (None detaches it)."""
+        self.redis = redis_instance
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode == "queue" and self.redis is not None
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Enqueue a job and wait for a worker's result frame.
+
+        Args:
+            job: Job dict understood by ``sandbox_worker``
+
+        Returns:
+            The worker's result frame
+
+        Raises:
+            SandboxUnavailable: If Redis cannot be reached
+            asyncio.TimeoutError: If no worker answered in time
+        """
+        job_id = uuid.uuid4().hex
+        reply_key = REPLY_KEY_PREFIX + job_id
+        try:
+            message = {
+                "id": job_id,
+                "job": job,
+                # Workers skip jobs the API has already given up on
+                "expires_at": time.time() + EXECUTION_QUEUE_TIMEOUT,
+            }
+            await self.redis.lpush(JOBS_KEY, json.dumps(message))
+        except Exception as e:
+            logger.error(f"Execution queue push failed: {str(e)}")
+            raise SandboxUnavailable(str(e)) from e
+
+        loop = asyncio.get_running_loop()
+        deadline = (
+            loop.time()
+            + EXECUTION_QUEUE_TIMEOUT
+            + job.get("timeout", 5)
+            + WORKER_GRACE_PERIOD
+        )
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                reply = await self.redis.blpop(
+                    reply_key, timeout=max(1, min(BLOCK_SLICE, int(remaining)))
+                )
+            except Exception as e:
+                logger.error(f"Execution queue read failed: {str(e)}")
+                raise SandboxUnavailable(str(e)) from e
+            if reply is not None:
+                return json.loads(reply[1])
+
+    async def consume(self, pool: SandboxPool, stop: asyncio.Event) -> None:
+        """
+        Worker loop: pop jobs, run them on the pool and push back results.
+
+        Args:
+            pool: Sandbox pool the jobs run on
+            stop: Set to finish after the current job
+        """
+        while not stop.is_set():
+            try:
+                item = await self.redis.brpop(JOBS_KEY, timeout=BLOCK_SLICE)
+            except Exception as e:
+                logger.error(f"Execution queue pop failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                continue
+
+            message = json.loads(item[1])
+            if message.get("expires_at", float("inf")) < time.time():
+                logger.warning(f"Dropping expired execution job {message['id']}")
+                continue
+            try:
+                result = await pool.run(message["job"])
+            except Exception as e:
+                logger.error(f"Execution job {message['id']} failed: {str(e)}")
+                result = {"event": "error", "error": str(e)}
+
+            reply_key = REPLY_KEY_PREFIX + message["id"]
+            try:
+                await self.redis.rpush(reply_key, json.dumps(result))
+                await self.redis.expire(reply_key, REPLY_TTL)
+            except Exception as e:
+                logger.error(f"Execution queue reply failed: {str(e)}")
+
+
+execution_queue = ExecutionQueue(EXECUTION_MODE)
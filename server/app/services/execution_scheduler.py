@@ -0,0 +1,148 @@
+"""
+Fair per-user scheduler for code execution slots.
+
+Every user gets their own FIFO queue, and free slots are handed out
+round-robin across users with queued work. A student hammering Run only
+lengthens their own queue; everyone else still gets the next free slot in
+turn. Each user may hold a limited number of slots at once, and their queue
+is bounded with overflow rejected immediately with a 429.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+
+class ExecutionScheduler:
+    """Round-robin dispatcher of a fixed number of execution slots."""
+
+    def __init__(
+        self,
+        slots: int,
+        max_queue_per_user: int,
+        max_active_per_user: Optional[int] = None,
+    ):
+        """
+        Args:
+            slots: Runs allowed at once across all users
+            max_queue_per_user: Runs a user may have waiting for a slot
+            max_active_per_user: Slots a user may hold at once (defaults to
+                all of them); further runs wait in the user's queue
+        """
+        self.slots = slots
+        self.max_queue_per_user = max_queue_per_user
+        self.max_active_per_user = max_active_per_user or slots
+        self.active = 0
+        # Slots held per user, for users holding any
+        self._running: Dict[str, int] = {}
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        # Users with queued work, in dispatch order. A user is in the
+        # rotation exactly when they have an entry in _queues.
+        self._rotation: Deque[str] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, user_id: str) -> float:
+        """
+        Wait for an execution slot.
+
+        Args:
+            user_id: ID of the user requesting the slot
+
+        Returns:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            HTTPException: 429 if the user's queue is already full
+        """
+        if (
+            self.active < self.slots
+            and not self._rotation
+            and self._running.get(user_id, 0) < self.max_active_per_user
+        ):
+            self._grant(user_id)
+            return 0.0
+
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._rotation.append(user_id)
+        if len(queue) >= self.max_queue_per_user:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many queued runs, please wait for your previous runs to finish",
+            )
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        # Slots may be free while only users at their limit are waiting
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we were cancelled
+                self.release(user_id)
+            else:
+                self._discard(user_id, future)
+            raise
+        return time.monotonic() - started
+
+    def release(self, user_id: str) -> None:
+        """Return a user's slot and hand it to the next user in the rotation."""
+        self.active -= 1
+        running = self._running.get(user_id, 0) - 1
+        if running > 0:
+            self._running[user_id] = running
+        else:
+            self._running.pop(user_id, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str) -> AsyncIterator[float]:
+        """Hold an execution slot for the duration of the block."""
+        waited = await self.acquire(user_id)
+        try:
+            yield waited
+        finally:
+            self.release(user_id)
+
+    def _grant(self, user_id: str) -> None:
+        self.active += 1
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+
+    def _dispatch(self) -> None:
+        # Users at their own limit keep their place and are passed over
+        skipped = 0
+        while self.active < self.slots and skipped < len(self._rotation):
+            user_id = self._rotation.popleft()
+            if self._running.get(user_id, 0) >= self.max_active_per_user:
+                self._rotation.append(user_id)
+                skipped += 1
+                continue
+            skipped = 0
+            queue = self._queues[user_id]
+            future = queue.popleft()
+            if queue:
+                self._rotation.append(user_id)
+            else:
+                del self._queues[user_id]
+            if future.done():
+                continue
+            self._grant(user_id)
+            future.set_result(None)
+
+    def _discard(self, user_id: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self._queues[user_id]
+            self._rotation.remove(user_id)
@@ -0,0 +1,248 @@
+"""
+Test-case grading for coding exercises.
+
+A submission is graded against all of an exercise's test cases in a single
+job on a warm sandbox worker: the submission is run once, then every test
+case runs in a child forked from it (starting from the globals the
+submission left) and per-case results are reported as they come. Grading a
+class therefore costs one job and a fork per case, not one interpreter start
+or one run of the submission per test case.
+"""
+import ast
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.db.schemas import CodingExercise
+from app.services.execution_queue import execution_queue
+from app.services.run_code_service import (
+    EXECUTION_OUTPUT_LIMIT,
+    EXECUTION_TIME_LIMIT,
+    analyze_code,
+    execution_scheduler,
+    run_sandbox_job,
+    sandbox_pool,
+)
+from app.services.sandbox_pool import SandboxPool, SandboxUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on an exercise's own time_limit, for the whole submission
+MAX_GRADING_TIME_LIMIT = 30  # seconds
+OUTPUT_CASE_SOURCE = "expected output"
+
+
+def split_test_cases(test_cases: str) -> List[str]:
+    """
+    Split an exercise's test code into individually graded cases.
+
+    Each assert statement is a case. Statements before an assert (setup such
+    as building an input list) belong to that assert's case, and trailing
+    statements after the last assert form a case of their own.
+
+    Args:
+        test_cases: Test code as stored on the exercise
+
+    Returns:
+        List of case sources, in order
+
+    Raises:
+        HTTPException: 400 if the test code does not parse
+    """
+    if not test_cases or not test_cases.strip():
+        return []
+    try:
+        tree = ast.parse(test_cases)
+    except SyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid test cases: {e.msg}")
+
+    cases = []
+    pending = []
+    for statement in tree.body:
+        pending.append(ast.get_source_segment(test_cases, statement))
+        if isinstance(statement, ast.Assert):
+            cases.append("\n".join(pending))
+            pending = []
+    if pending:
+        cases.append("\n".join(pending))
+    return cases
+
+
+def _time_limit(exercise: CodingExercise) -> int:
+    return max(1, min(exercise.time_limit or EXECUTION_TIME_LIMIT, MAX_GRADING_TIME_LIMIT))
+
+
+def _build_report(
+    cases: List[str],
+    exercise: CodingExercise,
+    result: Dict[str, Any],
+    time_limit: int,
+) -> Dict[str, Any]:
+    """Turn the worker's per-case report frames into a grading result."""
+    submission = None
+    reported = {}
+    for report in result.get("reports", []):
+        if report.get("event") == "submission":
+            submission = report
+        elif report.get("event") == "case":
+            reported[report["index"]] = report
+
+    timeout_error = f"Execution timed out ({time_limit}s limit)"
+    timed_out = bool(result.get("timed_out")) or any(
+        report.get("timed_out") for report in result.get("reports", [])
+    )
+
+    error = None
+    if submission is None:
+        if result.get("timed_out"):
+            error = timeout_error
+        elif result.get("truncated"):
+            error = f"Output limit exceeded ({EXECUTION_OUTPUT_LIMIT // 1024}KB limit)"
+        else:
+            error = f"Runtime error: {result.get('stderr', '').strip()}"
+    elif submission.get("timed_out"):
+        error = timeout_error
+    elif submission["error"] is not None:
+        error = f"Runtime error: {submission['error']}"
+
+    unreported_error = "Not run"
+    if error is None and result.get("timed_out"):
+        unreported_error = timeout_error
+
+    results = []
+    for index, source in enumerate(cases):
+        report = reported.get(index)
+        if report is None:
+            results.append(
+                {
+                    "index": index,
+                    "source": source,
+                    "passed": False,
+                    "error": error or unreported_error,
+                    "time_ms": 0.0,
+                }
+            )
+            # Only the case that was running when time ran out timed out
+            unreported_error = "Not run"
+            continue
+        results.append(
+            {
+                "index": index,
+                "source": source,
+                "passed": report["passed"],
+                "error": timeout_error if report.get("timed_out") else report["error"],
+                "time_ms": round(report["time_ms"], 3),
+            }
+        )
+
+    output = submission["output"] if submission is not None else ""
+    expected = (exercise.expected_output or "").strip()
+    if expected:
+        matches = error is None and output.strip() == expected
+        results.append(
+            {
+                "index": len(results),
+                "source": OUTPUT_CASE_SOURCE,
+                "passed": matches,
+                "error": None if matches else error or "Output does not match",
+                "time_ms": 0.0,
+            }
+        )
+
+    passed_count = sum(1 for case in results if case["passed"])
+    return {
+        "passed": error is None and passed_count == len(results),
+        "passed_count": passed_count,
+        "total": len(results),
+        "cases": results,
+        "output": output.strip(),
+        "error": error,
+        "timed_out": timed_out,
+    }
+
+
+async def _run_on_pool(pool: SandboxPool, job: Dict[str, Any]) -> Dict[str, Any]:
+    if not pool.enabled:
+        return await pool.run_once(job)
+    try:
+        return await pool.run(job)
+    except SandboxUnavailable:
+        logger.warning("Sandbox pool unavailable, grading on a fresh worker")
+        return await pool.run_once(job)
+
+
+async def grade_code(
+    code: str,
+    exercise: CodingExercise,
+    user_id: str,
+    stop_on_failure: bool = False,
+    pool: Optional[SandboxPool] = None,
+) -> Dict[str, Any]:
+    """
+    Grade a submission against an exercise's test cases in one sandbox job.
+
+    Does not take an execution slot; callers are expected to schedule it.
+
+    Args:
+        code: Submitted Python code
+        exercise: Exercise holding test_cases, expected_output and time_limit
+        user_id: ID of the submitting user
+        stop_on_failure: Skip the remaining cases after the first failure
+        pool: Sandbox pool to run on (defaults to wherever run_code jobs run)
+
+    Returns:
+        Dict with passed, passed_count, total, per-case results
+        (index, source, passed, error, time_ms), output and error
+
+    Raises:
+        HTTPException: 400 if the code or test cases are rejected
+    """
+    cases = split_test_cases(exercise.test_cases)
+    if not analyze_code(code).safe or not all(
+        analyze_code(case).safe for case in cases
+    ):
+        raise HTTPException(
+            status_code=400, detail="Potentially dangerous code detected"
+        )
+
+    time_limit = _time_limit(exercise)
+    job = {
+        "kind": "grade",
+        "code": code,
+        "cases": cases,
+        "stop_on_failure": stop_on_failure,
+        "timeout": time_limit,
+        "cpu_limit": time_limit,
+        "max_output": EXECUTION_OUTPUT_LIMIT,
+        "env": {"USER_ID": str(user_id)},
+    }
+
+    try:
+        if pool is None and execution_queue.enabled:
+            result = await run_sandbox_job(job)
+        else:
+            result = await _run_on_pool(pool or sandbox_pool, job)
+    except asyncio.TimeoutError:
+        return {"error": "Request timed out"}
+    except SandboxUnavailable as e:
+        return {"error": f"Server error: {str(e)}"}
+
+    if result.get("event") != "result":
+        logger.error(f"Sandbox worker error: {result.get('error')}")
+        return {"error": f"Server error: {result.get('error')}"}
+    return _build_report(cases, exercise, result, time_limit)
+
+
+async def grade_submission(
+    code: str,
+    exercise: CodingExercise,
+    user_id: str,
+    stop_on_failure: bool = False,
+) -> Dict[str, Any]:
+    """Grade a submission through the fair per-user execution scheduler."""
+    async with execution_scheduler.slot(user_id) as queue_wait:
+        result = await grade_code(code, exercise, user_id, stop_on_failure)
+    result["queue_wait_ms"] = round(queue_wait * 1000, 2)
+    return result
@@ -0,0 +1,129 @@
+"""
+Multi-phrase matching in one pass over the text.
+
+A PhraseMatcher compiles any number of phrases, grouped into named
+categories, into an Aho-Corasick automaton once. Scanning a prompt then
+costs one step per character however many phrases there are, and reports
+every occurrence (overlapping ones included) with the category, the phrase,
+its character offset and the index of the whitespace-separated word it
+starts in. Matching is on the lowercased text and is plain substring
+matching, like ``phrase in prompt.lower()``.
+"""
+import re
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Tuple
+
+_WORD = re.compile(r"\S+")
+
+
+class PhraseMatch(NamedTuple):
+    category: str
+    phrase: str
+    start: int  # character offset in the lowercased text
+    word: int  # index in text.split() of the word the match starts in
+
+
+class PhraseMatches:
+    """Every phrase occurrence found by one scan, grouped by category."""
+
+    def __init__(self, matches: List[PhraseMatch]):
+        self.matches = matches
+        self._words: Dict[str, List[int]] = {}
+        for match in matches:
+            self._words.setdefault(match.category, []).append(match.word)
+
+    @property
+    def categories(self) -> FrozenSet[str]:
+        return frozenset(self._words)
+
+    def __contains__(self, category: str) -> bool:
+        return category in self._words
+
+    def words(self, category: str) -> List[int]:
+        """Sorted word indices of the category's matches (with repeats)."""
+        return self._words.get(category, [])
+
+    def near(self, first: str, second: str, distance: int) -> bool:
+        """Whether a match of each category starts within distance words."""
+        a, b = self.words(first), self.words(second)
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if abs(a[i] - b[j]) <= distance:
+                return True
+            if a[i] < b[j]:
+                i += 1
+            else:
+                j += 1
+        return False
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over categorized phrases."""
+
+    def __init__(self, phrases: Dict[str, Iterable[str]]):
+        """
+        Args:
+            phrases: Category name to the phrases in it. Phrases are
+                lowercased; a phrase may belong to several categories.
+        """
+        # Trie of phrases: per state, its transitions and what ends there
+        goto: List[Dict[str, int]] = [{}]
+        ends: List[List[Tuple[str, str]]] = [[]]
+        for category, members in phrases.items():
+            for phrase in members:
+                phrase = phrase.lower()
+                if not phrase:
+                    continue
+                state = 0
+                for ch in phrase:
+                    if ch not in goto[state]:
+                        goto.append({})
+                        ends.append([])
+                        goto[state][ch] = len(goto) - 1
+                    state = goto[state][ch]
+                ends[state].append((category, phrase))
+
+        # Breadth-first: link every state to its longest proper suffix in the
+        # trie, and turn the trie into a full DFA so a scan never backtracks
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        outputs: List[Tuple[Tuple[str, str], ...]] = [()] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            link = fail[state]
+            delta[state] = {**delta[link], **goto[state]}
+            outputs[state] = tuple(ends[state]) + outputs[link]
+            for ch, child in goto[state].items():
+                fail[child] = delta[link].get(ch, 0)
+                queue.append(child)
+
+        # Bound lookups keep the per-character step of a scan to one call
+        self._steps = [transitions.get for transitions in delta]
+        self._outputs = outputs
+        self.states = len(goto)
+
+    def scan(self, text: str) -> PhraseMatches:
+        """Find every phrase occurrence in the lowercased text."""
+        text = text.lower()
+        steps = self._steps
+        outputs = self._outputs
+        found: List[Tuple[int, str, str]] = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            state = steps[state](ch, 0)
+            if outputs[state]:
+                for category, phrase in outputs[state]:
+                    found.append((end - len(phrase), category, phrase))
+        if not found:
+            return PhraseMatches([])
+
+        found.sort()
+        word_starts = [word.start() for word in _WORD.finditer(text)]
+        return PhraseMatches(
+            [
+                PhraseMatch(category, phrase, start, bisect_right(word_starts, start) - 1)
+                for start, category, phrase in found
+            ]
+        )
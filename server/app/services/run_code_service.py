@@ -1,25 +1,115 @@
 import os
 import subprocess
 import asyncio
-import tempfile
 import ast
+import base64
+import dis
+import functools
+import marshal
 import pwd
 import resource
+import signal
+import hashlib
+import time
+from collections import OrderedDict
+from importlib.util import MAGIC_NUMBER
 from pathlib import Path
+from types import CodeType
 from fastapi import HTTPException
 from app.db.schemas import Code
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, NamedTuple, Optional
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from app.services.sandbox_pool import SANDBOX_PYTHON, SandboxPool, SandboxUnavailable
+from app.services.sandbox_worker import READ_CHUNK, resource_usage
+from app.services.execution_queue import execution_queue
+from app.services.execution_scheduler import ExecutionScheduler
+from app.services.admission_control import AdmissionController
+from app.services.scratch_dirs import ScratchDirPool
+from app.services.execution_cache import (
+    NONDETERMINISTIC_MODULES,
+    NONDETERMINISTIC_NAMES,
+    ExecutionCache,
+    is_cacheable_result,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Resource constraints
-SEMAPHORE = asyncio.Semaphore(50)
-THREAD_POOL = ThreadPoolExecutor(max_workers=25)
-TEMP_DIRS_SEMAPHORE = asyncio.Semaphore(75)
+# Warm worker pool (set SANDBOX_POOL_SIZE=0 to always start a fresh process)
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "4"))
+SANDBOX_WORKER_MAX_USES = int(os.getenv("SANDBOX_WORKER_MAX_USES", "200"))
+SANDBOX_WORKER_CPU_LIMIT = 120  # seconds, for a worker's own work across all jobs
+
+# Resource constraints. A warm worker runs one job at a time, so with the
+# local pool a slot is a worker: extra slots would only move the wait from
+# the fair queue into the pool. Fresh-process runs and queue mode (where the
+# execution workers bound concurrency) default to 50 slots.
+LOCAL_POOL = SANDBOX_POOL_SIZE > 0 and execution_queue.mode != "queue"
+EXECUTION_SLOTS = int(
+    os.getenv("EXECUTION_SLOTS", str(SANDBOX_POOL_SIZE if LOCAL_POOL else 50))
+)
+if LOCAL_POOL and EXECUTION_SLOTS > SANDBOX_POOL_SIZE:
+    logger.warning(
+        f"EXECUTION_SLOTS={EXECUTION_SLOTS} is more than SANDBOX_POOL_SIZE="
+        f"{SANDBOX_POOL_SIZE}; runs past the pool size will wait for a worker"
+    )
+MAX_QUEUED_RUNS_PER_USER = int(os.getenv("MAX_QUEUED_RUNS_PER_USER", "5"))
+# Runs one user may have executing at once; the rest wait in their queue
+MAX_ACTIVE_RUNS_PER_USER = int(os.getenv("MAX_ACTIVE_RUNS_PER_USER", "2"))
+execution_scheduler = ExecutionScheduler(
+    slots=EXECUTION_SLOTS,
+    max_queue_per_user=MAX_QUEUED_RUNS_PER_USER,
+    max_active_per_user=MAX_ACTIVE_RUNS_PER_USER,
+)
+# Pre-created working directories for fresh-process runs; their number bounds
+# concurrent cold runs. Point SCRATCH_DIR_ROOT at a tmpfs to keep them in memory.
+SCRATCH_DIR_COUNT = int(os.getenv("SCRATCH_DIR_COUNT", "75"))
+SCRATCH_DIR_ROOT = os.getenv("SCRATCH_DIR_ROOT")
+scratch_dirs = ScratchDirPool(size=SCRATCH_DIR_COUNT, root=SCRATCH_DIR_ROOT)
+
+EXECUTION_TIME_LIMIT = 5  # seconds
+EXECUTION_CPU_LIMIT = 4  # seconds
+# How long a run may take end to end before the request gives up on it
+RUN_REQUEST_TIMEOUT = EXECUTION_TIME_LIMIT + 1  # seconds
+# Byte budget for a run's stdout and stderr combined; the run is killed
+# as soon as it prints more
+EXECUTION_OUTPUT_LIMIT = int(os.getenv("EXECUTION_OUTPUT_LIMIT", str(64 * 1024)))
+# Hard cap on what a streaming run may print, stdout and stderr combined
+STREAM_OUTPUT_LIMIT = int(os.getenv("STREAM_OUTPUT_LIMIT", str(256 * 1024)))  # bytes
+
+# Runs that really execute at once: one per warm worker, or one per slot for
+# fresh-process runs. In queue mode set it to the execution workers' total
+# EXECUTION_WORKER_CONCURRENCY.
+EXECUTION_PARALLELISM = int(
+    os.getenv(
+        "EXECUTION_PARALLELISM",
+        str(min(SANDBOX_POOL_SIZE, EXECUTION_SLOTS) if LOCAL_POOL else EXECUTION_SLOTS),
+    )
+)
+# Runs predicted to miss RUN_REQUEST_TIMEOUT are rejected with a 503 up front
+admission_controller = AdmissionController(
+    execution_scheduler,
+    request_timeout=RUN_REQUEST_TIMEOUT,
+    parallelism=EXECUTION_PARALLELISM,
+)
+
+# Result cache for deterministic programs
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "600"))  # seconds
+RESULT_CACHE_REDIS_TTL = int(os.getenv("RESULT_CACHE_REDIS_TTL", "86400"))  # seconds
+# Bump when anything that changes program output changes (interpreter, limits)
+RESULT_CACHE_SALT = (
+    f"v1|{SANDBOX_PYTHON}|{EXECUTION_TIME_LIMIT}s|{EXECUTION_CPU_LIMIT}cpu|50MB"
+    f"|{EXECUTION_OUTPUT_LIMIT}B"
+)
+execution_cache = ExecutionCache(
+    max_entries=RESULT_CACHE_SIZE,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl=RESULT_CACHE_TTL,
+    redis_ttl=RESULT_CACHE_REDIS_TTL,
+)
 
 # Security configurations
 BANNED_PATTERNS = {".env", "config/", "/etc/passwd", "/etc/shadow"}
@@ -47,31 +137,213 @@ BANNED_METHODS = {
 }
 
 
-class SecurityVisitor(ast.NodeVisitor):
-    """AST visitor for security validation."""
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "2048"))
+# Bound on the marshaled bytecode the validation cache holds
+VALIDATION_CACHE_MAX_BYTES = int(
+    os.getenv("VALIDATION_CACHE_MAX_BYTES", str(8 * 1024 * 1024))
+)
+# Size charged per cache entry on top of its bytecode
+VALIDATION_ENTRY_OVERHEAD = 256  # bytes
+
+
+# Warm workers load precompiled bytecode only from an interpreter with this magic
+BYTECODE_MAGIC = MAGIC_NUMBER.hex()
+
+
+@functools.lru_cache(maxsize=None)
+def sandbox_magic() -> Optional[str]:
+    """
+    Bytecode magic number of SANDBOX_PYTHON, asked once.
+
+    Programs are only kept compiled when it matches the API's own
+    interpreter; otherwise every worker would drop the bytecode anyway.
+
+    Returns:
+        The magic number as hex, or None if the interpreter can't be run
+    """
+    try:
+        completed = subprocess.run(
+            [
+                SANDBOX_PYTHON,
+                "-I",
+                "-S",
+                "-c",
+                "import importlib.util; print(importlib.util.MAGIC_NUMBER.hex())",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not read the sandbox interpreter's magic number: {str(e)}")
+        return None
+    magic = completed.stdout.strip() or None
+    if magic != BYTECODE_MAGIC:
+        logger.info(
+            f"{SANDBOX_PYTHON} has bytecode magic {magic}, not {BYTECODE_MAGIC}; "
+            "programs will be compiled by the workers"
+        )
+    return magic
+
+
+class CodeAnalysis(NamedTuple):
+    """Result of checking a program once before it is run."""
+
+    safe: bool
+    cacheable: bool
+    # Base64 of the marshaled code object, for safe programs
+    bytecode: Optional[str] = None
+
+
+class AnalysisCache:
+    """LRU of code analyses, bounded by entry count and bytecode size."""
 
     def __init__(self):
-        self.unsafe = False
+        self._entries: "OrderedDict[bytes, CodeAnalysis]" = OrderedDict()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _size(analysis: CodeAnalysis) -> int:
+        return VALIDATION_ENTRY_OVERHEAD + len(analysis.bytecode or "")
+
+    def get(self, digest: bytes) -> Optional[CodeAnalysis]:
+        analysis = self._entries.get(digest)
+        if analysis is not None:
+            self._entries.move_to_end(digest)
+        return analysis
+
+    def put(self, digest: bytes, analysis: CodeAnalysis) -> None:
+        size = self._size(analysis)
+        if size > VALIDATION_CACHE_MAX_BYTES:
+            return
+        if digest in self._entries:
+            self._evict(digest)
+        self._entries[digest] = analysis
+        self.bytes += size
+        while (
+            len(self._entries) > VALIDATION_CACHE_SIZE
+            or self.bytes > VALIDATION_CACHE_MAX_BYTES
+        ):
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, digest: bytes) -> None:
+        self.bytes -= self._size(self._entries.pop(digest))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+
+_validation_cache = AnalysisCache()
+
+
+def _is_unsafe_node(node: ast.AST) -> bool:
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id in BANNED_FUNCTIONS
+        if isinstance(func, ast.Attribute):
+            return func.attr in BANNED_METHODS
+        return False
+    if isinstance(node, ast.Import):
+        return any(alias.name in BANNED_MODULES for alias in node.names)
+    if isinstance(node, ast.ImportFrom):
+        return node.module in BANNED_MODULES
+    return False
+
+
+# Every identifier the safety rules care about
+_SCREENED_NAMES = BANNED_MODULES | BANNED_FUNCTIONS | BANNED_METHODS
+_SET_OPCODES = {
+    dis.opmap[name] for name in ("BUILD_SET", "SET_ADD", "SET_UPDATE") if name in dis.opmap
+}
+
 
-    def visit_Import(self, node):
-        for alias in node.names:
-            if alias.name in BANNED_MODULES:
-                self.unsafe = True
-        self.generic_visit(node)
+def _scan_code_object(code_obj: CodeType):
+    """Collect every name used by a compiled program and whether it builds sets."""
+    names = set()
+    builds_sets = False
+    stack = [code_obj]
+    while stack:
+        co = stack.pop()
+        names.update(co.co_names, co.co_varnames, co.co_cellvars, co.co_freevars)
+        if not builds_sets and not _SET_OPCODES.isdisjoint(co.co_code[::2]):
+            builds_sets = True
+        for const in co.co_consts:
+            if isinstance(const, CodeType):
+                stack.append(const)
+            elif isinstance(const, frozenset):
+                builds_sets = True
+    return names, builds_sets
 
-    def visit_ImportFrom(self, node):
-        if node.module in BANNED_MODULES:
-            self.unsafe = True
-        self.generic_visit(node)
 
-    def visit_Call(self, node):
-        if isinstance(node.func, ast.Name):
-            if node.func.id in BANNED_FUNCTIONS:
-                self.unsafe = True
-        elif isinstance(node.func, ast.Attribute):
-            if node.func.attr in BANNED_METHODS:
-                self.unsafe = True
-        self.generic_visit(node)
+def _find_unsafe_node(tree: ast.AST) -> bool:
+    """Walk the tree, stopping at the first banned import or call."""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if _is_unsafe_node(node):
+            return True
+        stack.extend(ast.iter_child_nodes(node))
+    return False
+
+
+def _analyze(code: str) -> CodeAnalysis:
+    """
+    Check a program in a single compile.
+
+    After the banned pattern scan, the code is compiled once and the names
+    of every nested code object are collected. The AST only has to be walked
+    when one of those names is actually banned, to tell a banned call or
+    import apart from a harmless use of the same name. The same names decide
+    whether the program is deterministic enough for the result cache. When
+    the sandbox interpreter can load it, the compiled code object is kept,
+    marshaled, so warm workers don't have to compile the program again.
+    """
+    if any(pattern in code for pattern in BANNED_PATTERNS):
+        return CodeAnalysis(safe=False, cacheable=False)
+    try:
+        code_obj = compile(code, "<string>", "exec", dont_inherit=True)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return CodeAnalysis(safe=False, cacheable=False)
+
+    names, builds_sets = _scan_code_object(code_obj)
+    if not names.isdisjoint(_SCREENED_NAMES) and _find_unsafe_node(ast.parse(code)):
+        return CodeAnalysis(safe=False, cacheable=False)
+
+    cacheable = not builds_sets and not any(
+        name in NONDETERMINISTIC_NAMES
+        or name.split(".")[0] in NONDETERMINISTIC_MODULES
+        for name in names
+    )
+    bytecode = None
+    if sandbox_magic() == BYTECODE_MAGIC:
+        bytecode = base64.b64encode(marshal.dumps(code_obj)).decode("ascii")
+    return CodeAnalysis(safe=True, cacheable=cacheable, bytecode=bytecode)
+
+
+def analyze_code(code: str) -> CodeAnalysis:
+    """
+    Check a program, memoized by a hash of its source.
+
+    Args:
+        code: String containing Python code
+
+    Returns:
+        CodeAnalysis: Whether the code is safe to run and safe to cache
+    """
+    digest = hashlib.sha256(code.encode("utf-8", "surrogatepass")).digest()
+    analysis = _validation_cache.get(digest)
+    if analysis is not None:
+        return analysis
+
+    analysis = _analyze(code)
+    _validation_cache.put(digest, analysis)
+    return analysis
 
 
 def validate_code_safety(code: str) -> bool:
@@ -84,31 +356,29 @@ def validate_code_safety(code: str) -> bool:
     Returns:
         bool: True if code is safe, False otherwise
     """
-    try:
-        if any(pattern in code for pattern in BANNED_PATTERNS):
-            return False
-        tree = ast.parse(code)
-        visitor = SecurityVisitor()
-        visitor.visit(tree)
-        return not visitor.unsafe
-    except SyntaxError:
-        return False
+    return analyze_code(code).safe
 
 
-def sandbox_setup(uid: int, gid: int):
+def sandbox_setup(
+    uid: int, gid: int, cpu_limit: int = EXECUTION_CPU_LIMIT, workdir: str = "/"
+):
     """
     Set up sandbox environment with resource limits.
 
     Args:
         uid: User ID for sandbox
         gid: Group ID for sandbox
+        cpu_limit: CPU time limit in seconds
+        workdir: Directory the sandboxed process runs in
     """
     try:
         # Set resource limits
         resource.setrlimit(
             resource.RLIMIT_AS, (50 * 1024 * 1024, 50 * 1024 * 1024)
         )  # 50MB memory
-        resource.setrlimit(resource.RLIMIT_CPU, (4, 4))  # 4 seconds CPU time
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (cpu_limit, cpu_limit)
+        )  # 4 seconds CPU time by default
         resource.setrlimit(
             resource.RLIMIT_FSIZE, (512 * 1024, 512 * 1024)
         )  # 512KB file size
@@ -117,7 +387,7 @@ def sandbox_setup(uid: int, gid: int):
         # Drop privileges
         os.setgid(gid)
         os.setuid(uid)
-        os.chdir("/")
+        os.chdir(workdir)
 
         # Set no new privileges flag
         try:
@@ -133,6 +403,176 @@ def sandbox_setup(uid: int, gid: int):
         logger.warning(f"Could not set some resource limits: {str(e)}")
 
 
+def format_execution_result(
+    stdout: str,
+    stderr: str,
+    returncode: int,
+    timed_out: bool,
+    truncated: bool,
+    user_id: str,
+    usage: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Shape a finished run into the run_code response format."""
+    if timed_out:
+        result = {"error": "Execution timed out (5s limit)"}
+    elif truncated:
+        # Killed for printing too much: keep what fit in the budget
+        result = {
+            "output": stdout.strip(),
+            "error": f"Output limit exceeded ({EXECUTION_OUTPUT_LIMIT // 1024}KB limit)",
+            "truncated": True,
+            "user_id": user_id,
+        }
+    elif returncode != 0:
+        result = {"error": f"Runtime error: {stderr.strip()}"}
+    else:
+        result = {
+            "output": stdout.strip(),
+            "error": stderr.strip(),
+            "user_id": user_id,
+        }
+    if usage is not None:
+        result["usage"] = usage
+    return result
+
+
+async def _wait_for_exit(pid: int) -> None:
+    """Wait for a child to exit without reaping it, so wait4 can still see it."""
+    loop = asyncio.get_running_loop()
+    if not hasattr(os, "pidfd_open"):
+        await loop.run_in_executor(
+            None, os.waitid, os.P_PID, pid, os.WEXITED | os.WNOWAIT
+        )
+        return
+
+    pidfd = os.pidfd_open(pid)
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+
+
+# Reaps of killed children that must finish even if their run was cancelled
+_reaping = set()
+
+
+async def _reap(pid: int):
+    """Wait for a child to exit and reap it, returning (status, rusage)."""
+    await _wait_for_exit(pid)
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage
+
+
+async def _open_pipe_reader(fd: int, transports: list) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0)
+    )
+    transports.append(transport)
+    return reader
+
+
+async def _run_capped(
+    code_str: str, temp_dir: str, env: Dict[str, str], preexec_fn
+) -> Dict[str, Any]:
+    """
+    Run code in a fresh sandboxed process, reading its output incrementally.
+
+    Pipes are read on the event loop, so concurrent cold runs are bounded
+    only by the number of scratch directories, not by a thread pool. The child is killed as
+    soon as it runs past the time limit or prints more than
+    EXECUTION_OUTPUT_LIMIT bytes. It is reaped with wait4 to get its CPU time.
+    """
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    try:
+        process = subprocess.Popen(
+            [SANDBOX_PYTHON, "-I", "-S", "-c", code_str],
+            stdin=subprocess.DEVNULL,
+            stdout=out_w,
+            stderr=err_w,
+            env=env,
+            cwd=temp_dir,
+            preexec_fn=preexec_fn,
+        )
+    except BaseException:
+        os.close(out_r)
+        os.close(err_r)
+        raise
+    finally:
+        os.close(out_w)
+        os.close(err_w)
+
+    started = time.monotonic()
+    buffers = {"stdout": [], "stderr": []}
+    transports = []
+    remaining = EXECUTION_OUTPUT_LIMIT
+    timed_out = False
+    truncated = False
+
+    async def drain(name: str, stream: asyncio.StreamReader) -> None:
+        nonlocal remaining, truncated
+        while True:
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                return
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+                truncated = True
+            remaining -= len(chunk)
+            buffers[name].append(chunk)
+            if truncated:
+                os.kill(process.pid, signal.SIGKILL)
+                return
+
+    # Popen.kill()/poll() would reap the child and lose its rusage, so
+    # signals go straight to the pid, which stays ours until wait4 below
+    try:
+        stdout_reader = await _open_pipe_reader(out_r, transports)
+        stderr_reader = await _open_pipe_reader(err_r, transports)
+        await asyncio.wait_for(
+            asyncio.gather(
+                drain("stdout", stdout_reader),
+                drain("stderr", stderr_reader),
+                _wait_for_exit(process.pid),
+            ),
+            timeout=EXECUTION_TIME_LIMIT,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        # Also reached when the caller gives up on the run: the child is
+        # still reaped, in the background if this task is being cancelled
+        os.kill(process.pid, signal.SIGKILL)
+        for transport in transports:
+            transport.close()
+        reap = asyncio.ensure_future(_reap(process.pid))
+        _reaping.add(reap)
+        reap.add_done_callback(_reaping.discard)
+        status, rusage = await asyncio.shield(reap)
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    stdout = b"".join(buffers["stdout"])
+    stderr = b"".join(buffers["stderr"])
+    usage = resource_usage(rusage, len(stdout) + len(stderr))
+    # The peak RSS of a child forked from the API includes the API's own
+    # pages from before exec, so it says nothing about the program here
+    usage["max_rss_kb"] = None
+    usage["wall_ms"] = round((time.monotonic() - started) * 1000, 3)
+    return {
+        "stdout": stdout.decode("utf-8", errors="replace"),
+        "stderr": stderr.decode("utf-8", errors="replace"),
+        "returncode": process.returncode,
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "usage": usage,
+    }
+
+
 async def execute_in_sandbox(
     code_str: str, temp_dir: str, env: Dict[str, str], user_id: str
 ) -> Dict[str, Any]:
@@ -152,66 +592,244 @@ async def execute_in_sandbox(
         sandbox_gid = sandbox_user.pw_gid
         sandbox_uid = sandbox_user.pw_uid
 
-        result = await asyncio.get_event_loop().run_in_executor(
-            THREAD_POOL,
-            lambda: subprocess.run(
-                ["/usr/bin/python3", "-I", "-S", "-c", code_str],
-                capture_output=True,
-                text=True,
-                timeout=5,
-                check=True,
-                env=env,
-                cwd=temp_dir,
-                preexec_fn=lambda: sandbox_setup(sandbox_uid, sandbox_gid),
-            ),
+        result = await _run_capped(
+            code_str,
+            temp_dir,
+            env,
+            lambda: sandbox_setup(sandbox_uid, sandbox_gid, workdir=temp_dir),
         )
-        return {
-            "output": result.stdout.strip(),
-            "error": result.stderr.strip(),
-            "user_id": user_id,
-        }
-    except subprocess.TimeoutExpired:
-        return {"error": "Execution timed out (5s limit)"}
-    except subprocess.CalledProcessError as e:
-        return {"error": f"Runtime error: {e.stderr.strip()}"}
+        return format_execution_result(user_id=user_id, **result)
     except Exception as e:
         logger.error(f"Execution error: {str(e)}")
         return {"error": f"Server error: {str(e)}"}
 
 
+def _sandbox_worker_setup():
+    """preexec_fn for pool workers: same sandbox, longer CPU budget."""
+    sandbox_user = pwd.getpwnam("nobody")
+    sandbox_setup(
+        sandbox_user.pw_uid, sandbox_user.pw_gid, cpu_limit=SANDBOX_WORKER_CPU_LIMIT
+    )
+
+
+sandbox_pool = SandboxPool(
+    size=SANDBOX_POOL_SIZE,
+    max_uses=SANDBOX_WORKER_MAX_USES,
+    env={
+        "PATH": "/usr/bin:/bin",
+        "PYTHONPATH": "",
+        "PYTHONSAFEPATH": "1",
+        "PYTHONNOUSERSITE": "1",
+    },
+    preexec_fn=_sandbox_worker_setup,
+)
+
+
+async def run_sandbox_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a sandbox worker job on the execution workers in queue mode, or on
+    the local warm pool otherwise (a one-off worker if the pool is disabled).
+
+    Raises:
+        SandboxUnavailable: If neither can take the job
+    """
+    if execution_queue.enabled:
+        return await execution_queue.run(job)
+    if not sandbox_pool.enabled:
+        return await sandbox_pool.run_once(job)
+    return await sandbox_pool.run(job)
+
+
+def _program(code_str: str) -> Dict[str, Any]:
+    """Job fields for a program: its source, plus bytecode when compiled."""
+    program = {"code": code_str}
+    bytecode = analyze_code(code_str).bytecode
+    if bytecode is not None:
+        program.update(bytecode=bytecode, magic=BYTECODE_MAGIC)
+    return program
+
+
+async def execute_in_pool(code_str: str, user_id: str) -> Dict[str, Any]:
+    """
+    Execute code on a warm sandbox worker.
+
+    Args:
+        code_str: String containing Python code
+        user_id: ID of the user running the code
+
+    Returns:
+        Dict containing execution results or error message, in the same
+        shape as execute_in_sandbox
+
+    Raises:
+        SandboxUnavailable: If no worker could be started
+    """
+    result = await run_sandbox_job(
+        {
+            **_program(code_str),
+            "timeout": EXECUTION_TIME_LIMIT,
+            "cpu_limit": EXECUTION_CPU_LIMIT,
+            "env": {"USER_ID": str(user_id)},
+            "max_output": EXECUTION_OUTPUT_LIMIT,
+        }
+    )
+    if result.get("event") != "result":
+        logger.error(f"Sandbox worker error: {result.get('error')}")
+        return {"error": f"Server error: {result.get('error')}"}
+    return format_execution_result(
+        result["stdout"],
+        result["stderr"],
+        result["returncode"],
+        result["timed_out"],
+        result["truncated"],
+        user_id,
+        usage=dict(result["usage"], wall_ms=round(result["duration_ms"], 3)),
+    )
+
+
 async def run_code(code: Code, user_id: str) -> Dict[str, Any]:
     """
     Main function to run code with all security measures and user context.
+
+    Runs are admitted through the fair per-user scheduler, so one user's
+    burst only queues behind itself. The time spent waiting for a slot is
+    reported as queue_wait_ms. Deterministic programs are answered from the
+    result cache when possible. When the sandbox is saturated badly enough
+    that a run could not finish before the request timeout, it is rejected
+    straight away with a 503 and a Retry-After header instead of queueing.
     """
-    # Use a user-specific semaphore to prevent single user from hogging resources
-    user_semaphore = asyncio.Semaphore(10)  # Max 10 concurrent executions per user
-
-    async with user_semaphore:
-        async with SEMAPHORE:  # Global semaphore still applies
-            if not validate_code_safety(code.code):
-                raise HTTPException(
-                    status_code=400, detail="Potentially dangerous code detected"
-                )
-
-            async with TEMP_DIRS_SEMAPHORE:
-                try:
-                    with tempfile.TemporaryDirectory() as temp_dir:
-                        env = {
-                            "PATH": "/usr/bin:/bin",
-                            "PYTHONPATH": "",
-                            "PYTHONSAFEPATH": "1",
-                            "PYTHONNOUSERSITE": "1",
-                            "USER_ID": str(user_id),  # Add user context to environment
-                        }
-
-                        os.chmod(temp_dir, 0o555)
-
-                        return await asyncio.wait_for(
-                            execute_in_sandbox(code.code, temp_dir, env, user_id),
-                            timeout=6,
-                        )
-                except asyncio.TimeoutError:
-                    return {"error": "Request timed out"}
-                except Exception as e:
-                    logger.error(f"Unexpected error for user {user_id}: {str(e)}")
-                    return {"error": "Internal server error"}
+    analysis = analyze_code(code.code)
+    if not analysis.safe:
+        raise HTTPException(
+            status_code=400, detail="Potentially dangerous code detected"
+        )
+
+    cache_key = None
+    if analysis.cacheable:
+        cache_key = execution_cache.key(code.code, RESULT_CACHE_SALT)
+        cached = await execution_cache.get(cache_key)
+        if cached is not None:
+            if "user_id" in cached:
+                cached["user_id"] = user_id
+            # Nothing ran: the original run's usage would be recorded twice
+            cached.pop("usage", None)
+            cached["cached"] = True
+            cached["queue_wait_ms"] = 0.0
+            return cached
+
+    admission_controller.admit()
+    async with execution_scheduler.slot(user_id) as queue_wait:
+        result = await _execute(code.code, user_id)
+    wall_ms = result.get("usage", {}).get("wall_ms")
+    if wall_ms is not None:
+        # Time spent executing, without any wait for a free worker
+        admission_controller.record(wall_ms / 1000)
+
+    if cache_key is not None and is_cacheable_result(result):
+        await execution_cache.set(
+            cache_key, {k: v for k, v in result.items() if k != "usage"}
+        )
+    result["queue_wait_ms"] = round(queue_wait * 1000, 2)
+    return result
+
+
+async def _execute(code_str: str, user_id: str) -> Dict[str, Any]:
+    """Execute already validated code on the pool, or in a fresh process."""
+    if execution_queue.enabled or sandbox_pool.enabled:
+        try:
+            # The queue enforces its own deadline, which includes queueing time
+            return await asyncio.wait_for(
+                execute_in_pool(code_str, user_id),
+                timeout=None if execution_queue.enabled else RUN_REQUEST_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            return {"error": "Request timed out"}
+        except SandboxUnavailable:
+            # Fall back to a fresh process per run
+            logger.warning("Sandbox pool unavailable, using cold start")
+        except Exception as e:
+            logger.error(f"Unexpected error for user {user_id}: {str(e)}")
+            return {"error": "Internal server error"}
+
+    try:
+        async with scratch_dirs.lease() as temp_dir:
+            env = {
+                "PATH": "/usr/bin:/bin",
+                "PYTHONPATH": "",
+                "PYTHONSAFEPATH": "1",
+                "PYTHONNOUSERSITE": "1",
+                "USER_ID": str(user_id),  # Add user context to environment
+            }
+
+            return await asyncio.wait_for(
+                execute_in_sandbox(code_str, temp_dir, env, user_id),
+                timeout=RUN_REQUEST_TIMEOUT,
+            )
+    except asyncio.TimeoutError:
+        return {"error": "Request timed out"}
+    except Exception as e:
+        logger.error(f"Unexpected error for user {user_id}: {str(e)}")
+        return {"error": "Internal server error"}
+
+
+def stream_code(code: Code, user_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Validate code and return an iterator of its streamed output events.
+
+    Validation happens up front so unsafe code is still rejected with a 400
+    before any response is started. The run itself waits for a slot from the
+    execution scheduler when the iterator is first consumed.
+
+    Args:
+        code: Code to run
+        user_id: ID of the user running the code
+
+    Returns:
+        Async iterator of event dicts: ``stdout``/``stderr`` events with
+        ``data``, then one ``done`` event (returncode, timed_out, truncated,
+        duration_ms, queue_wait_ms) or an ``error`` event
+    """
+    if not analyze_code(code.code).safe:
+        raise HTTPException(
+            status_code=400, detail="Potentially dangerous code detected"
+        )
+    return _stream_events(code.code, user_id)
+
+
+async def _stream_events(code_str: str, user_id: str) -> AsyncIterator[Dict[str, Any]]:
+    try:
+        queue_wait = await execution_scheduler.acquire(user_id)
+    except HTTPException as e:
+        yield {"event": "error", "error": e.detail}
+        return
+
+    job = {
+        **_program(code_str),
+        "timeout": EXECUTION_TIME_LIMIT,
+        "cpu_limit": EXECUTION_CPU_LIMIT,
+        "env": {"USER_ID": str(user_id)},
+        "stream": True,
+        "max_output": STREAM_OUTPUT_LIMIT,
+    }
+    try:
+        async for frame in sandbox_pool.stream(job):
+            if frame.get("event") == "chunk":
+                yield {"event": frame["stream"], "data": frame["data"]}
+            elif frame.get("event") == "result":
+                yield {
+                    "event": "done",
+                    "returncode": frame["returncode"],
+                    "timed_out": frame["timed_out"],
+                    "truncated": frame["truncated"],
+                    "duration_ms": round(frame["duration_ms"], 2),
+                    "queue_wait_ms": round(queue_wait * 1000, 2),
+                }
+            else:
+                logger.error(f"Sandbox worker error: {frame.get('error')}")
+                yield {"event": "error", "error": "Internal server error"}
+    except asyncio.TimeoutError:
+        yield {"event": "error", "error": "Request timed out"}
+    except SandboxUnavailable:
+        yield {"event": "error", "error": "Code execution is temporarily unavailable"}
+    finally:
+        execution_scheduler.release(user_id)
@@ -0,0 +1,298 @@
+"""
+Pool of warm, pre-sandboxed Python workers.
+
+Each worker is a long-lived ``python3 -I -S`` process started with the sandbox
+rlimits and dropped privileges already applied. Jobs are sent over its stdin
+pipe and executed in a child forked from the warm interpreter (see
+``sandbox_worker``), so a run costs a fork instead of a full interpreter
+start. Workers are recycled after ``max_uses`` jobs, on any crash or protocol
+error, and whenever a job is abandoned mid-flight.
+"""
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from app.services import sandbox_worker
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_PYTHON = "/usr/bin/python3"
+WORKER_SOURCE = Path(sandbox_worker.__file__).read_text()
+HEADER = sandbox_worker.HEADER
+
+# How long a worker gets to start up and report ready
+WORKER_START_TIMEOUT = 10
+# Extra time allowed on top of a job's own timeout before the worker is killed
+WORKER_GRACE_PERIOD = 1
+
+
+class SandboxUnavailable(RuntimeError):
+    """Raised when no sandbox worker can be started."""
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    payload = json.dumps(message).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+
+class SandboxWorker:
+    """A single warm worker process and its pipe protocol."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.uses = 0
+        # Bytecode magic number of the worker's interpreter
+        self.magic: Optional[str] = None
+
+    @classmethod
+    async def spawn(
+        cls, env: Dict[str, str], preexec_fn: Callable[[], None]
+    ) -> "SandboxWorker":
+        process = await asyncio.create_subprocess_exec(
+            SANDBOX_PYTHON,
+            "-I",
+            "-S",
+            "-c",
+            WORKER_SOURCE,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=env,
+            preexec_fn=preexec_fn,
+        )
+        worker = cls(process)
+        try:
+            ready = await asyncio.wait_for(worker.read_frame(), WORKER_START_TIMEOUT)
+        except Exception:
+            await worker.stop()
+            raise
+        if ready.get("event") != "ready":
+            await worker.stop()
+            raise SandboxUnavailable(f"Unexpected worker handshake: {ready}")
+        worker.magic = ready.get("magic")
+        return worker
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def read_frame(self) -> Dict[str, Any]:
+        header = await self.process.stdout.readexactly(HEADER.size)
+        (size,) = HEADER.unpack(header)
+        return json.loads(await self.process.stdout.readexactly(size))
+
+    def encode_job(self, job: Dict[str, Any]) -> bytes:
+        """
+        Frame a job, dropping precompiled bytecode this worker can't load.
+
+        Jobs may carry ``bytecode`` (base64 of a marshaled code object) along
+        with the ``magic`` number of the interpreter that compiled it; the
+        worker then falls back to compiling ``code`` itself.
+        """
+        if "bytecode" in job and job.get("magic") != self.magic:
+            job = {k: v for k, v in job.items() if k not in ("bytecode", "magic")}
+        return encode_frame(job)
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a job and wait for its result frame."""
+        self.uses += 1
+        self.process.stdin.write(self.encode_job(job))
+        await self.process.stdin.drain()
+        return await asyncio.wait_for(
+            self.read_frame(), job.get("timeout", 5) + WORKER_GRACE_PERIOD
+        )
+
+    async def stream(self, job: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Send a job and yield its chunk frames, then its result frame."""
+        self.uses += 1
+        self.process.stdin.write(self.encode_job(job))
+        await self.process.stdin.drain()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + job.get("timeout", 5) + WORKER_GRACE_PERIOD
+        while True:
+            frame = await asyncio.wait_for(
+                self.read_frame(), max(0, deadline - loop.time())
+            )
+            yield frame
+            if frame.get("event") != "chunk":
+                return
+
+    async def stop(self) -> None:
+        if not self.alive:
+            return
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), 1)
+        except Exception:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+
+
+class SandboxPool:
+    """Fixed-size pool of warm sandbox workers."""
+
+    def __init__(
+        self,
+        size: int,
+        max_uses: int,
+        env: Dict[str, str],
+        preexec_fn: Callable[[], None],
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.env = env
+        self.preexec_fn = preexec_fn
+        self._idle: Optional[asyncio.Queue] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._live = 0
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def start(self) -> None:
+        """Spawn the initial workers. Safe to call more than once."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._idle is not None:
+                return
+            self._idle = asyncio.Queue()
+            await asyncio.gather(
+                *(self._spawn() for _ in range(self.size)), return_exceptions=True
+            )
+            logger.info(f"Sandbox pool started with {self._live}/{self.size} workers")
+
+    async def _spawn(self) -> None:
+        try:
+            worker = await SandboxWorker.spawn(self.env, self.preexec_fn)
+        except Exception as e:
+            logger.error(f"Failed to start sandbox worker: {str(e)}")
+            raise SandboxUnavailable(str(e)) from e
+        self._live += 1
+        self._idle.put_nowait(worker)
+
+    async def _retire(self, worker: SandboxWorker) -> None:
+        self._live -= 1
+        await worker.stop()
+        try:
+            await self._spawn()
+        except SandboxUnavailable:
+            pass
+
+    def _release(self, worker: SandboxWorker, healthy: bool) -> None:
+        if self._idle is None:
+            # Pool was closed while the job was running
+            task = asyncio.create_task(worker.stop())
+        elif healthy and worker.alive and worker.uses < self.max_uses:
+            self._idle.put_nowait(worker)
+            return
+        else:
+            task = asyncio.create_task(self._retire(worker))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _acquire(self) -> SandboxWorker:
+        if self._idle is None:
+            await self.start()
+        if self._live == 0:
+            await self._spawn()
+        return await self._idle.get()
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a job on an idle worker.
+
+        Args:
+            job: Job dict understood by ``sandbox_worker`` (code, timeout, ...)
+
+        Returns:
+            The worker's result frame
+
+        Raises:
+            SandboxUnavailable: If no worker is running and none can be started
+        """
+        worker = await self._acquire()
+        healthy = False
+        try:
+            result = await worker.run(job)
+            healthy = result.get("event") == "result"
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    async def stream(self, job: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run a streaming job, yielding output chunks as the program prints.
+
+        Uses an idle worker, or a one-off worker when the pool is disabled.
+        A stream abandoned before its result frame retires the worker.
+
+        Args:
+            job: Job dict with ``stream`` set
+
+        Yields:
+            ``chunk`` frames (stream, data), then the result frame
+
+        Raises:
+            SandboxUnavailable: If no worker can be started
+        """
+        if not self.enabled:
+            try:
+                worker = await SandboxWorker.spawn(self.env, self.preexec_fn)
+            except Exception as e:
+                logger.error(f"Failed to start sandbox worker: {str(e)}")
+                raise SandboxUnavailable(str(e)) from e
+            try:
+                async for frame in worker.stream(job):
+                    yield frame
+            finally:
+                await worker.stop()
+            return
+
+        worker = await self._acquire()
+        healthy = False
+        try:
+            async for frame in worker.stream(job):
+                healthy = frame.get("event") == "result"
+                yield frame
+        finally:
+            self._release(worker, healthy)
+
+    async def run_once(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a job on a fresh worker that is stopped afterwards.
+
+        Used when the pool is disabled but a job still needs the worker
+        protocol (e.g. grading several test cases in one process).
+
+        Raises:
+            SandboxUnavailable: If the worker cannot be started
+        """
+        try:
+            worker = await SandboxWorker.spawn(self.env, self.preexec_fn)
+        except Exception as e:
+            logger.error(f"Failed to start sandbox worker: {str(e)}")
+            raise SandboxUnavailable(str(e)) from e
+        try:
+            return await worker.run(job)
+        finally:
+            await worker.stop()
+
+    async def close(self) -> None:
+        """Stop all workers."""
+        if self._idle is None:
+            return
+        for task in list(self._tasks):
+            task.cancel()
+        while not self._idle.empty():
+            await self._idle.get_nowait().stop()
+        self._idle = None
+        self._lock = None
+        self._live = 0
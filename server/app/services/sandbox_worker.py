@@ -0,0 +1,747 @@
+"""
+Warm sandbox worker.
+
+This file is not imported by the API at runtime: its source is executed inside
+the sandbox as ``python3 -I -S -c <source>`` by ``sandbox_pool``, so it must
+only depend on the standard library.
+
+The worker is started once (already rlimited and running as ``nobody``), then
+reads length-prefixed JSON jobs from stdin. Each job is executed in a child
+forked from the warm interpreter, so every run starts from a clean state while
+skipping interpreter startup. Results are written back as length-prefixed JSON
+frames on stdout.
+"""
+import base64
+import builtins
+import codecs
+import io
+import json
+import marshal
+import os
+import resource
+import selectors
+import signal
+import struct
+import sys
+import time
+import traceback
+from importlib.util import MAGIC_NUMBER
+
+# Frame header: 4-byte big-endian payload length
+HEADER = struct.Struct(">I")
+READ_CHUNK = 65536
+
+# Streams counted against a job's max_output budget and forwarded when streaming
+OUTPUT_STREAMS = ("stdout", "stderr")
+
+# Imported ahead of time so forked children don't pay for them
+WARM_MODULES = ("math", "string", "collections", "itertools", "functools", "re")
+
+
+def read_frame(fd: int):
+    """Read one frame from fd, returning None on EOF."""
+    header = _read_exactly(fd, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    payload = _read_exactly(fd, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def write_frame(fd: int, message: dict) -> None:
+    """Write one frame to fd."""
+    payload = json.dumps(message).encode("utf-8")
+    data = HEADER.pack(len(payload)) + payload
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def _read_exactly(fd: int, size: int):
+    chunks = []
+    while size:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def run_child(job: dict, out_w: int, err_w: int, report_w: int) -> None:
+    """
+    Execute the job in the forked child. Never returns.
+
+    Whatever escapes the job (even a MemoryError while reporting) ends the
+    child with status 1; returning would send the fork back into the
+    worker's own job loop.
+    """
+    status = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        for fd in (devnull, out_w, err_w):
+            os.close(fd)
+
+        cpu_limit = job.get("cpu_limit")
+        if cpu_limit:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+        os.environ.update(job.get("env") or {})
+        if job.get("stream"):
+            # Pipes are block-buffered by default; flush every line instead
+            sys.stdout.reconfigure(line_buffering=True)
+
+        if job.get("kind") == "grade":
+            status = grade(job, report_w)
+        elif job.get("kind") == "batch":
+            status = run_batch(job, report_w)
+        else:
+            status = execute(job["code"], job.get("bytecode"))
+    except BaseException:
+        pass
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except BaseException:
+                pass
+        os._exit(status)
+
+
+def execute(source: str, bytecode: str = None) -> int:
+    """
+    Run a program like `python -c` would, returning its exit status.
+
+    ``bytecode`` is the base64 of the marshaled code object the API already
+    compiled from ``source``; the pool only sends it to workers whose
+    interpreter has the same magic number, so it can be loaded as is.
+    """
+    try:
+        if bytecode is not None:
+            code = marshal.loads(base64.b64decode(bytecode))
+        else:
+            code = compile(source, "<string>", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Skip this function's frame so tracebacks match `python -c`
+        tb = e.__traceback__.tb_next if e.__traceback__ else None
+        traceback.print_exception(type(e), e, tb)
+        return 1
+    return 0
+
+
+def describe_exception(e: BaseException) -> str:
+    return "".join(traceback.format_exception_only(type(e), e)).strip()
+
+
+# A graded record: test case index (-1 for the submission), the run's exit
+# status, then the byte lengths of the output and error text that follow
+RECORD = struct.Struct(">iiII")
+# Longest error text kept for a graded run, in characters
+ERROR_LIMIT = 4096
+# Time the grader keeps for itself to report before the job's own timeout
+GRADE_REPORT_MARGIN = 0.1  # seconds
+
+
+def grade(job: dict, report_w: int) -> int:
+    """
+    Run a submission once, then each test case in a child forked from it.
+
+    The grading process never runs student code. It forks a submission
+    process that runs the submission and then forks one child per test case
+    from the interpreter the submission left behind, so the submission's top
+    level runs once however many cases there are, and nothing one case does
+    reaches the next. A case passes only if its child exits cleanly. Only the
+    grader holds ``report_w``: the submission process sends plain binary
+    records over a separate pipe and the grader writes the report frames.
+
+    One report frame is written for the submission and one per test case as
+    soon as it finishes, so results survive a later crash. At the job's
+    timeout the submission process and its children are killed and whatever
+    was running is reported as timed out.
+    """
+    deadline = time.monotonic() + job.get("timeout", 5) - GRADE_REPORT_MARGIN
+    max_output = job.get("max_output") or 64 * 1024
+    code = job["code"]
+    cases = job.get("cases") or []
+
+    verdict_r, verdict_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(verdict_r)
+        os.close(report_w)
+        try:
+            os.setpgid(0, 0)
+            _graded_process(
+                code, cases, max_output, bool(job.get("stop_on_failure")), verdict_w
+            )
+        finally:
+            os._exit(1)
+    os.close(verdict_w)
+    try:
+        # Set on both sides so the group exists whichever runs first
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+
+    limit = 4 * max_output + (len(cases) + 1) * (RECORD.size + 4 * ERROR_LIMIT)
+    reader = RecordReader(pid, verdict_r, deadline, limit)
+    started = time.perf_counter()
+    submitted = False
+    failed = False
+    index = 0
+    try:
+        record = reader.read()
+        if record is not None and record[0] == -1:
+            submitted = True
+            _, status, output, error = record
+            failed = status != 0
+            _report_submission(report_w, output, _run_error(status, error), False)
+            while not failed and index < len(cases):
+                record = reader.read()
+                if record is None:
+                    break
+                if record[0] != index:
+                    reader.kill()
+                    break
+                _, status, _, error = record
+                _report_case(report_w, index, _run_error(status, error), False, started)
+                started = time.perf_counter()
+                index += 1
+        elif record is not None:
+            reader.kill()
+    finally:
+        reader.close()
+    returncode = os.waitstatus_to_exitcode(_reap(pid, deadline))
+
+    if reader.timed_out:
+        error = "Execution timed out"
+    else:
+        error = f"Exited with status {returncode}"
+    if not submitted:
+        _report_submission(report_w, "", error, reader.timed_out)
+        return 1
+    if failed:
+        return 1
+    if index < len(cases) and (reader.timed_out or returncode != 0):
+        _report_case(report_w, index, error, reader.timed_out, started)
+    return 0
+
+
+def _run_error(status: int, error):
+    """The error a graded run is reported with: None only if it exited cleanly."""
+    if status == 0:
+        return None
+    return error or f"Exited with status {status}"
+
+
+def _report_submission(report_w: int, output: str, error, timed_out: bool) -> None:
+    write_frame(
+        report_w,
+        {"event": "submission", "output": output, "error": error, "timed_out": timed_out},
+    )
+
+
+def _report_case(report_w: int, index: int, error, timed_out: bool, started: float) -> None:
+    write_frame(
+        report_w,
+        {
+            "event": "case",
+            "index": index,
+            "passed": error is None,
+            "error": error,
+            "timed_out": timed_out,
+            "time_ms": (time.perf_counter() - started) * 1000,
+        },
+    )
+
+
+def _graded_process(
+    code: str,
+    cases: list,
+    max_output: int,
+    stop_on_failure: bool,
+    verdict_w: int,
+    _exec=exec,
+    _compile=compile,
+    _fork=os.fork,
+    _pipe=os.pipe,
+    _read=os.read,
+    _write=os.write,
+    _close=os.close,
+    _waitpid=os.waitpid,
+    _exit=os._exit,
+    _pack=RECORD.pack,
+) -> None:
+    """
+    Run the submission, then fork a child per test case. Never returns.
+
+    Each case child starts from a copy of the globals the submission left
+    and its exit status decides the case: 0 only if the case ran without
+    raising. Printing more than ``max_output`` characters fails a run. The
+    interpreter's own primitives are bound here, before any student code
+    runs, so replacing them in builtins or in this module has no effect on
+    how cases are run, judged or reported.
+    """
+    namespace = {"__name__": "__main__", "__builtins__": builtins}
+    captured = CappedOutput(max_output)
+    failed = True
+    message = None
+    try:
+        sys.stdout = captured
+        _exec(_compile(code, "<string>", "exec"), namespace)
+        failed = False
+    except BaseException as e:
+        message = e
+    sys.stdout = sys.__stdout__
+    _send_record(
+        verdict_w,
+        -1,
+        int(failed),
+        captured.getvalue(),
+        _describe_run(message, max_output),
+        _write,
+        _pack,
+    )
+    if failed:
+        _exit(1)
+
+    for index, case in enumerate(cases):
+        error_r, error_w = _pipe()
+        pid = _fork()
+        if pid == 0:
+            _close(error_r)
+            _close(verdict_w)
+            try:
+                _graded_case(
+                    namespace, case, index, max_output, error_w, _exec, _compile, _write, _exit
+                )
+            finally:
+                _exit(1)
+        _close(error_w)
+        chunks = []
+        size = 0
+        while size <= 4 * ERROR_LIMIT:
+            chunk = _read(error_r, READ_CHUNK)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        _close(error_r)
+        status = os.waitstatus_to_exitcode(_waitpid(pid, 0)[1])
+        error = b"".join(chunks)[: 4 * ERROR_LIMIT].decode("utf-8", errors="replace")
+        _send_record(verdict_w, index, status, "", error, _write, _pack)
+        if status != 0 and stop_on_failure:
+            break
+    _exit(0)
+
+
+def _graded_case(
+    namespace: dict,
+    case: str,
+    index: int,
+    max_output: int,
+    error_w: int,
+    _exec,
+    _compile,
+    _write,
+    _exit,
+) -> None:
+    """Run one test case in a child of the submission process. Never returns."""
+    failed = True
+    message = None
+    try:
+        sys.stdout = CappedOutput(max_output)
+        _exec(_compile(case, f"<test {index + 1}>", "exec"), namespace)
+        failed = False
+    except BaseException as e:
+        message = e
+    try:
+        sys.stdout = sys.__stdout__
+        data = (_describe_run(message, max_output) or "").encode("utf-8", errors="replace")
+        while data:
+            data = data[_write(error_w, data):]
+    except BaseException:
+        pass
+    _exit(1 if failed else 0)
+
+
+def _describe_run(e, max_output: int):
+    """Describe what stopped a graded run, at most ERROR_LIMIT characters."""
+    if e is None:
+        return None
+    if isinstance(e, OutputLimitExceeded):
+        return f"Output limit exceeded ({max_output // 1024}KB limit)"
+    try:
+        return describe_exception(e)[:ERROR_LIMIT]
+    except BaseException:
+        return type(e).__name__
+
+
+def _send_record(fd: int, index: int, status: int, output: str, error, _write, _pack) -> None:
+    output = output.encode("utf-8", errors="replace")
+    error = (error or "").encode("utf-8", errors="replace")
+    data = _pack(index, status, len(output), len(error)) + output + error
+    while data:
+        data = data[_write(fd, data):]
+
+
+class RecordReader:
+    """Reads a submission process's records until EOF, a deadline or ``limit`` bytes."""
+
+    def __init__(self, pid: int, fd: int, deadline: float, limit: int):
+        self.pid = pid
+        self.fd = fd
+        self.deadline = deadline
+        self.limit = limit
+        self.buffer = bytearray()
+        self.size = 0
+        self.done = False
+        self.timed_out = False
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(fd, selectors.EVENT_READ)
+
+    def read(self):
+        """Return the next (index, status, output, error) record, or None."""
+        while True:
+            record = self._parse()
+            if record is not None or self.done:
+                return record
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self.timed_out = True
+                self.kill()
+                return None
+            if not self.selector.select(remaining):
+                continue
+            chunk = os.read(self.fd, READ_CHUNK)
+            if not chunk:
+                self.done = True
+                continue
+            self.size += len(chunk)
+            if self.size > self.limit:
+                self.kill()
+                return None
+            self.buffer += chunk
+
+    def _parse(self):
+        if len(self.buffer) < RECORD.size:
+            return None
+        index, status, output_size, error_size = RECORD.unpack_from(self.buffer)
+        end = RECORD.size + output_size + error_size
+        if len(self.buffer) < end:
+            return None
+        output = bytes(self.buffer[RECORD.size : RECORD.size + output_size])
+        error = bytes(self.buffer[RECORD.size + output_size : end])
+        del self.buffer[:end]
+        return (
+            index,
+            status,
+            output.decode("utf-8", errors="replace"),
+            error.decode("utf-8", errors="replace") or None,
+        )
+
+    def kill(self) -> None:
+        """Kill the submission process and every case child it started."""
+        self.done = True
+        _kill_group(self.pid)
+
+    def close(self) -> None:
+        self.selector.close()
+        os.close(self.fd)
+
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _reap(pid: int, deadline: float) -> int:
+    """Wait for the submission process, killing its group past the deadline."""
+    while True:
+        reaped, status = os.waitpid(pid, os.WNOHANG)
+        if reaped:
+            return status
+        if time.monotonic() >= deadline:
+            _kill_group(pid)
+            return os.waitpid(pid, 0)[1]
+        time.sleep(0.001)
+
+
+class CaseTimeout(BaseException):
+    """Raised in a batch case that ran past its time limit."""
+
+
+class OutputLimitExceeded(BaseException):
+    """Raised in a batch case that printed past its output limit."""
+
+
+class CappedOutput(io.StringIO):
+    """A stdout replacement that stops the program once it prints too much."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, text: str) -> int:
+        room = self.limit - self.tell()
+        if len(text) > room:
+            super().write(text[: max(room, 0)])
+            self.truncated = True
+            raise OutputLimitExceeded()
+        return super().write(text)
+
+
+def _raise_case_timeout(signum, frame):
+    raise CaseTimeout()
+
+
+def run_batch(job: dict, report_w: int) -> int:
+    """
+    Run one program once per stdin payload, each in fresh globals.
+
+    The program is compiled once. Every case gets its own globals, stdin and
+    captured stdout, and is interrupted by SIGALRM after ``case_timeout``
+    seconds. One report frame is written per case as soon as it finishes.
+    Modules imported by one case stay imported for the next.
+    """
+    try:
+        code = compile(job["code"], "<string>", "exec")
+    except SyntaxError as e:
+        write_frame(report_w, {"event": "compile_error", "error": format_traceback(e)})
+        return 1
+
+    case_timeout = job.get("case_timeout", 2)
+    max_output = job.get("max_output") or 64 * 1024
+    real_stdin, real_stdout = sys.stdin, sys.stdout
+    signal.signal(signal.SIGALRM, _raise_case_timeout)
+
+    for index, payload in enumerate(job.get("inputs") or []):
+        namespace = {"__name__": "__main__", "__builtins__": builtins}
+        sys.stdin = io.StringIO(payload)
+        sys.stdout = captured = CappedOutput(max_output)
+        error = None
+        timed_out = False
+        started = time.perf_counter()
+        signal.setitimer(signal.ITIMER_REAL, case_timeout)
+        try:
+            exec(code, namespace)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                error = str(e.code)
+        except CaseTimeout:
+            timed_out = True
+        except OutputLimitExceeded:
+            pass
+        except BaseException as e:
+            error = format_traceback(e)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            sys.stdin, sys.stdout = real_stdin, real_stdout
+        write_frame(
+            report_w,
+            {
+                "event": "case",
+                "index": index,
+                "output": captured.getvalue(),
+                "error": error,
+                "timed_out": timed_out,
+                "truncated": captured.truncated,
+                "time_ms": (time.perf_counter() - started) * 1000,
+            },
+        )
+    return 0
+
+
+def format_traceback(e: BaseException) -> str:
+    """Format a traceback without the worker's own frame, like `python -c`."""
+    if isinstance(e, SyntaxError):
+        return "".join(traceback.format_exception_only(type(e), e)).strip()
+    tb = e.__traceback__.tb_next if e.__traceback__ else None
+    return "".join(traceback.format_exception(type(e), e, tb)).strip()
+
+
+def collect_output(
+    pid: int, streams: dict, timeout: float, max_output=None, on_chunk=None
+):
+    """
+    Read the child's pipes until EOF, killing the child on timeout.
+
+    Args:
+        pid: Child process ID
+        streams: Mapping of stream name to the read end of its pipe
+        timeout: Seconds before the child is killed
+        max_output: Byte budget shared by stdout and stderr; the child is
+            killed as soon as it is exceeded
+        on_chunk: If given, called with (name, bytes) for stdout and stderr
+            chunks instead of buffering them
+
+    Returns:
+        Tuple of (mapping of stream name to bytes read, timed out flag,
+        truncated flag)
+    """
+    names = {fd: name for name, fd in streams.items()}
+    buffers = {name: [] for name in streams}
+    selector = selectors.DefaultSelector()
+    for fd in names:
+        selector.register(fd, selectors.EVENT_READ)
+
+    deadline = time.monotonic() + timeout
+    remaining_output = max_output
+    timed_out = False
+    truncated = False
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fd)
+                    continue
+                name = names[key.fd]
+                if name in OUTPUT_STREAMS and remaining_output is not None:
+                    if len(chunk) > remaining_output:
+                        chunk = chunk[:remaining_output]
+                        truncated = True
+                    remaining_output -= len(chunk)
+                if on_chunk is not None and name in OUTPUT_STREAMS:
+                    if chunk:
+                        on_chunk(name, chunk)
+                else:
+                    buffers[name].append(chunk)
+                if truncated:
+                    os.kill(pid, signal.SIGKILL)
+                    break
+            if truncated:
+                break
+    finally:
+        selector.close()
+        for fd in names:
+            os.close(fd)
+
+    output = {name: b"".join(chunks) for name, chunks in buffers.items()}
+    return output, timed_out, truncated
+
+
+def split_frames(data: bytes) -> list:
+    """Decode back-to-back frames, ignoring a trailing partial frame."""
+    frames = []
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        (size,) = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + size
+        if end > len(data):
+            break
+        frames.append(json.loads(data[offset + HEADER.size : end].decode("utf-8")))
+        offset = end
+    return frames
+
+
+def resource_usage(rusage, output_bytes: int) -> dict:
+    """Summarize a reaped child's rusage (from os.wait4)."""
+    return {
+        "cpu_user_ms": round(rusage.ru_utime * 1000, 3),
+        "cpu_system_ms": round(rusage.ru_stime * 1000, 3),
+        "max_rss_kb": rusage.ru_maxrss,
+        "output_bytes": output_bytes,
+    }
+
+
+def handle_job(job: dict) -> dict:
+    """Fork a child for the job and collect its result."""
+    pipes = {name: os.pipe() for name in ("stdout", "stderr", "report")}
+    started = time.monotonic()
+
+    pid = os.fork()
+    if pid == 0:
+        for read_end, _ in pipes.values():
+            os.close(read_end)
+        run_child(
+            job, pipes["stdout"][1], pipes["stderr"][1], pipes["report"][1]
+        )
+
+    for _, write_end in pipes.values():
+        os.close(write_end)
+
+    on_chunk = None
+    streamed = 0
+    if job.get("stream"):
+        decoders = {
+            name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for name in OUTPUT_STREAMS
+        }
+
+        def on_chunk(name: str, chunk: bytes) -> None:
+            nonlocal streamed
+            streamed += len(chunk)
+            text = decoders[name].decode(chunk)
+            if text:
+                write_frame(1, {"event": "chunk", "stream": name, "data": text})
+
+    output, timed_out, truncated = collect_output(
+        pid,
+        {name: read_end for name, (read_end, _) in pipes.items()},
+        job.get("timeout", 5),
+        max_output=job.get("max_output"),
+        on_chunk=on_chunk,
+    )
+    _, status, rusage = os.wait4(pid, 0)
+    if on_chunk is not None:
+        for name, decoder in decoders.items():
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                write_frame(1, {"event": "chunk", "stream": name, "data": tail})
+
+    return {
+        "event": "result",
+        "stdout": output["stdout"].decode("utf-8", errors="replace"),
+        "stderr": output["stderr"].decode("utf-8", errors="replace"),
+        "reports": split_frames(output["report"]),
+        "returncode": os.waitstatus_to_exitcode(status),
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "duration_ms": (time.monotonic() - started) * 1000,
+        "usage": resource_usage(
+            rusage, streamed + len(output["stdout"]) + len(output["stderr"])
+        ),
+    }
+
+
+def serve() -> None:
+    """Main loop: announce readiness, then handle jobs until stdin closes."""
+    for name in WARM_MODULES:
+        __import__(name)
+
+    write_frame(1, {"event": "ready", "pid": os.getpid(), "magic": MAGIC_NUMBER.hex()})
+    while True:
+        job = read_frame(0)
+        if job is None:
+            break
+        try:
+            result = handle_job(job)
+        except Exception as e:
+            result = {"event": "error", "error": str(e)}
+        write_frame(1, result)
+
+
+if __name__ == "__main__":
+    serve()
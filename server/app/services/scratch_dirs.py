@@ -0,0 +1,139 @@
+"""
+Reusable working directories for fresh-process sandbox runs.
+
+Creating, chmod-ing and deleting a TemporaryDirectory for every run is
+filesystem metadata work on the hot path. Instead a fixed number of
+directories is created and permissioned once and leased out per run. A
+directory that comes back empty (the usual case, they are read-only to the
+sandbox user) is reusable immediately; one that comes back with files in it
+is wiped in the background before it is handed out again. The number of
+directories also bounds how many cold runs can be in flight at once.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _is_empty(path: str) -> bool:
+    with os.scandir(path) as entries:
+        return next(entries, None) is None
+
+
+def _wipe(path: str, mode: int) -> None:
+    """Delete everything inside a directory and restore its permissions."""
+    os.chmod(path, 0o700)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.chmod(path, mode)
+
+
+class ScratchDirPool:
+    """Bounded pool of pre-created scratch directories."""
+
+    def __init__(self, size: int, root: Optional[str] = None, mode: int = 0o555):
+        """
+        Args:
+            size: Number of directories, and so of concurrent leases
+            root: Parent directory, e.g. a tmpfs mount (defaults to the
+                system temp dir). Each pool creates its own subdirectory.
+            mode: Permissions of a directory while it is leased
+        """
+        self.size = size
+        self.root = root
+        self.mode = mode
+        self.path: Optional[str] = None
+        self._dirs: List[str] = []
+        self._free: Optional[asyncio.Queue] = None
+        self._cleanups: Set[asyncio.Task] = set()
+        self.wiped = 0
+
+    def start(self) -> None:
+        """Create and permission every directory up front."""
+        if self.path is not None:
+            return
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="run_code_", dir=self.root or None)
+        # The sandbox user needs to traverse into its directory
+        os.chmod(self.path, 0o711)
+        self._free = asyncio.Queue()
+        for _ in range(self.size):
+            self._free.put_nowait(self._create())
+
+    def _create(self) -> str:
+        path = tempfile.mkdtemp(dir=self.path)
+        os.chmod(path, self.mode)
+        self._dirs.append(path)
+        return path
+
+    async def acquire(self) -> str:
+        """Wait for a free, empty directory."""
+        self.start()
+        return await self._free.get()
+
+    def release(self, path: str) -> None:
+        """Hand a directory back, wiping it in the background if it was used."""
+        try:
+            clean = _is_empty(path)
+        except OSError:
+            clean = False
+        if clean:
+            self._free.put_nowait(path)
+            return
+        task = asyncio.get_running_loop().create_task(self._clean(path))
+        self._cleanups.add(task)
+        task.add_done_callback(self._cleanups.discard)
+
+    async def _clean(self, path: str) -> None:
+        try:
+            await asyncio.to_thread(_wipe, path, self.mode)
+            self.wiped += 1
+        except OSError as e:
+            # Replace a directory that cannot be wiped instead of reusing it
+            logger.error(f"Could not wipe scratch directory {path}: {str(e)}")
+            self._dirs.remove(path)
+            shutil.rmtree(path, ignore_errors=True)
+            path = self._create()
+        self._free.put_nowait(path)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[str]:
+        """Hold a scratch directory for the duration of the block."""
+        path = await self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    async def close(self) -> None:
+        """Finish pending cleanups and delete every directory."""
+        if self._cleanups:
+            await asyncio.gather(*self._cleanups, return_exceptions=True)
+        if self.path is not None:
+            for path in self._dirs:
+                try:
+                    os.chmod(path, 0o700)
+                except OSError:
+                    pass
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+        self._dirs = []
+        self._free = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "free": self._free.qsize() if self._free is not None else self.size,
+            "cleaning": len(self._cleanups),
+            "wiped": self.wiped,
+        }
@@ -0,0 +1,136 @@
+"""
+Per-user counters of solution-seeking attempts.
+
+Each user has a Redis sorted set of their attempts in the last 24 hours
+(scored by time, trimmed as it is updated) and a lifetime counter, so
+recording an attempt and reading both counts is one pipelined round trip
+however many interactions the user has logged. The first time a user is
+seen (or after their keys expired) both are seeded from interaction_logs.
+Without Redis the counts come straight from interaction_logs, as before.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "solution_seeking:"
+
+
+class SolutionSeekingCounter:
+    """Sliding-window and lifetime solution-seeking counts per user."""
+
+    def __init__(
+        self,
+        get_logs: Callable[[], Any],
+        window: int = 24 * 60 * 60,
+        key_ttl: int = 30 * 24 * 60 * 60,
+        sync_interval: int = 300,
+    ):
+        """
+        Args:
+            get_logs: Returns the interaction_logs collection
+            window: Length of the recent-attempts window, in seconds
+            key_ttl: Seconds a user's counters live in Redis after their
+                last attempt; they are seeded again after that
+            sync_interval: Minimum seconds between users document updates
+        """
+        self.get_logs = get_logs
+        self.window = window
+        self.key_ttl = key_ttl
+        self.sync_interval = sync_interval
+        self.redis = None
+
+    def bind_redis(self, redis_instance) -> None:
+        """Enable the Redis counters (None falls back to MongoDB counts)."""
+        self.redis = redis_instance
+
+    def _keys(self, user_id: str) -> Tuple[str, str, str]:
+        prefix = f"{KEY_PREFIX}{user_id}"
+        return f"{prefix}:recent", f"{prefix}:total", f"{prefix}:synced"
+
+    async def record(
+        self, user_id: str, attempts: List[Dict[str, Any]]
+    ) -> Tuple[int, int, bool]:
+        """
+        Count newly logged attempts and return the user's totals.
+
+        Args:
+            user_id: The user's id
+            attempts: The user's log entries just written to interaction_logs
+                (with the _id and timestamp they were stored with)
+
+        Returns:
+            Tuple of (attempts in the window, lifetime attempts, whether the
+            users document is due an update)
+        """
+        if self.redis is not None:
+            try:
+                return await self._record_redis(user_id, attempts)
+            except Exception as e:
+                logger.error(f"Redis solution-seeking counters unavailable: {str(e)}")
+        recent, total = await self._count_logs(user_id)
+        return recent, total, True
+
+    async def _record_redis(
+        self, user_id: str, attempts: List[Dict[str, Any]]
+    ) -> Tuple[int, int, bool]:
+        recent_key, total_key, synced_key = self._keys(user_id)
+        now = time.time()
+
+        if not await self.redis.exists(total_key):
+            # The logs already hold these attempts, so seeding counts them
+            return await self._seed(user_id, now)
+
+        members = {str(entry["_id"]): entry["timestamp"].timestamp() for entry in attempts}
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if members:
+                pipe.zadd(recent_key, members)
+            pipe.zremrangebyscore(recent_key, "-inf", now - self.window)
+            pipe.zcard(recent_key)
+            pipe.expire(recent_key, self.window)
+            pipe.incrby(total_key, len(attempts))
+            pipe.expire(total_key, self.key_ttl)
+            pipe.set(synced_key, 1, ex=self.sync_interval, nx=True)
+            results = await pipe.execute()
+        offset = 1 if members else 0
+        recent, total, due = results[offset + 1], results[offset + 3], results[offset + 5]
+        return int(recent), int(total), bool(due)
+
+    async def _seed(self, user_id: str, now: float) -> Tuple[int, int, bool]:
+        recent_key, total_key, synced_key = self._keys(user_id)
+        since = datetime.fromtimestamp(now - self.window)
+        recent = await self.get_logs().find(
+            {"user_id": user_id, "flags.solution_seeking": True, "timestamp": {"$gte": since}},
+            {"_id": 1, "timestamp": 1},
+        ).to_list(length=None)
+        total = await self.get_logs().count_documents(
+            {"user_id": user_id, "flags.solution_seeking": True}
+        )
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if recent:
+                pipe.zadd(
+                    recent_key,
+                    {str(entry["_id"]): entry["timestamp"].timestamp() for entry in recent},
+                )
+            pipe.expire(recent_key, self.window)
+            pipe.set(total_key, total, ex=self.key_ttl, nx=True)
+            pipe.set(synced_key, 1, ex=self.sync_interval)
+            await pipe.execute()
+        return len(recent), total, True
+
+    async def _count_logs(self, user_id: str) -> Tuple[int, int]:
+        yesterday = datetime.now() - timedelta(seconds=self.window)
+        recent = await self.get_logs().count_documents(
+            {
+                "user_id": user_id,
+                "flags.solution_seeking": True,
+                "timestamp": {"$gte": yesterday},
+            }
+        )
+        total = await self.get_logs().count_documents(
+            {"user_id": user_id, "flags.solution_seeking": True}
+        )
+        return recent, total
@@ -1,4 +1,4 @@
-from app.db.database import collection
+from app.db.database import mongo
 from bson import ObjectId
 from datetime import datetime
 from fastapi import HTTPException
@@ -14,7 +14,7 @@ async def update_user_profile(user_id: str, name: str, student_id: str, section:
             raise ValueError("All fields are required")
         
         # Update user document
-        result = collection.update_one(
+        result = await mongo.users.update_one(
             {"_id": ObjectId(user_id)},
             {
                 "$set": {
@@ -28,7 +28,7 @@ async def update_user_profile(user_id: str, name: str, student_id: str, section:
         
         if result.modified_count == 0:
             # Document might exist but no changes were made
-            if collection.count_documents({"_id": ObjectId(user_id)}) == 0:
+            if await mongo.users.count_documents({"_id": ObjectId(user_id)}) == 0:
                 raise HTTPException(status_code=404, detail="User not found")
         
         return {"message": "Profile updated successfully"}
@@ -42,7 +42,7 @@ async def get_user_by_id(user_id: str):
     Get user by ID from the database
     """
     try:
-        user = collection.find_one({"_id": ObjectId(user_id)})
+        user = await mongo.users.find_one({"_id": ObjectId(user_id)})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -0,0 +1,156 @@
+"""
+Write-behind buffering of MongoDB inserts.
+
+Documents are queued in memory and written in batches with one
+``insert_many(ordered=False)`` when the batch is full or the flush interval
+has passed, whichever comes first, so the request that produced a document
+never waits for it to be stored. A batch that fails to insert for a
+transient reason (MongoDB unreachable) is put back and retried on the next
+flush; documents beyond ``max_pending`` are dropped, oldest first, so an
+outage cannot grow the buffer without bound. ``close`` drains what is left.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Batches inserts into one collection in the background."""
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ):
+        """
+        Args:
+            get_collection: Returns the Motor collection to insert into
+            batch_size: Flush as soon as this many documents are queued
+            flush_interval: Seconds a queued document waits at most
+            max_pending: Documents kept while inserts are failing
+            on_flush: Awaited with every batch after it has been stored
+        """
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self._pending: List[Dict[str, Any]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.flushes = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+
+    def start(self) -> None:
+        """Start the background flusher (idempotent)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def add(self, document: Dict[str, Any]) -> None:
+        """Queue a document for insertion without waiting for it."""
+        self.start()
+        self._pending.append(document)
+        self._trim()
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def _trim(self) -> None:
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            del self._pending[:excess]
+            self.dropped += excess
+            logger.warning(f"Write-behind buffer full, dropped {excess} documents")
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Insert everything queued so far, in batches."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+                if not await self._insert(batch):
+                    break
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> bool:
+        started = time.perf_counter()
+        try:
+            await self.get_collection().insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Per-document failures: the rest of the batch was written
+            failed = len(e.details.get("writeErrors", []))
+            self.written += len(batch) - failed
+            self.dropped += failed
+            logger.error(f"Write-behind insert rejected {failed} documents")
+        except Exception as e:
+            # Nothing is known to be written: keep the batch for the next flush.
+            # Documents keep the _id given on this attempt, so any that were in
+            # fact stored come back as duplicate key errors, not duplicates.
+            self.failed_flushes += 1
+            self._pending[:0] = batch
+            self._trim()
+            logger.error(f"Write-behind flush failed: {str(e)}")
+            return False
+        else:
+            self.written += len(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = round(elapsed_ms, 2)
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+        if self.on_flush is not None:
+            try:
+                await self.on_flush(batch)
+            except Exception as e:
+                logger.error(f"Write-behind flush callback failed: {str(e)}")
+        return True
+
+    async def close(self) -> None:
+        """Stop the background flusher and write whatever is still queued."""
+        if self._task is not None:
+            # Let an insert in progress finish rather than cancelling it
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Write-behind buffer closed with {len(self._pending)} unwritten documents")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
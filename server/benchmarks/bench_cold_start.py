@@ -0,0 +1,88 @@
+"""
+Throughput benchmark for the cold (fresh process per run) execution path.
+
+Starts 25, 50 and 100 runs at once and compares:
+  - threads: blocking subprocess.run on a 25-thread pool (the old path)
+  - async:   execute_in_sandbox on asyncio subprocesses (the current path)
+
+Each run sleeps briefly before printing, like a student program waiting on
+nothing in particular, so the numbers show how many runs can be in flight at
+once rather than raw CPU speed. Needs the same privileges as the API (the
+sandbox drops to ``nobody``).
+
+Run from the server directory:
+
+    python -m benchmarks.bench_cold_start
+"""
+import asyncio
+import pwd
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.run_code_service import (
+    SANDBOX_PYTHON,
+    execute_in_sandbox,
+    sandbox_setup,
+)
+
+PROGRAM = "import time\ntime.sleep(0.2)\nprint(sum(range(10000)))"
+CONCURRENCY = (25, 50, 100)
+ENV = {"PATH": "/usr/bin:/bin", "PYTHONPATH": "", "USER_ID": "bench"}
+
+
+def legacy_run(temp_dir: str, uid: int, gid: int) -> None:
+    subprocess.run(
+        [SANDBOX_PYTHON, "-I", "-S", "-c", PROGRAM],
+        capture_output=True,
+        text=True,
+        timeout=5,
+        check=True,
+        env=ENV,
+        cwd=temp_dir,
+        preexec_fn=lambda: sandbox_setup(uid, gid),
+    )
+
+
+async def bench_threads(runs: int, temp_dir: str) -> float:
+    user = pwd.getpwnam("nobody")
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=25) as pool:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    pool, legacy_run, temp_dir, user.pw_uid, user.pw_gid
+                )
+                for _ in range(runs)
+            )
+        )
+        return time.perf_counter() - started
+
+
+async def bench_async(runs: int, temp_dir: str) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(execute_in_sandbox(PROGRAM, temp_dir, ENV, "bench") for _ in range(runs))
+    )
+    elapsed = time.perf_counter() - started
+    failed = [result for result in results if "output" not in result]
+    if failed:
+        raise RuntimeError(f"{len(failed)} runs failed, e.g. {failed[0]}")
+    return elapsed
+
+
+async def main():
+    print(f"{'runs':>5} {'threads':>16} {'async':>16}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for runs in CONCURRENCY:
+            threads = await bench_threads(runs, temp_dir)
+            async_ = await bench_async(runs, temp_dir)
+            print(
+                f"{runs:>5} {runs / threads:>10.1f} run/s {runs / async_:>10.1f} run/s"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
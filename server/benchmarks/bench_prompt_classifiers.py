@@ -0,0 +1,128 @@
+"""
+Micro-benchmark for the chat prompt classifiers.
+
+Measures classifying one prompt (solution seeking, hint request and problem
+type) for short questions, for long prompts with pasted code, and for pasted
+code with an explanation full of command verbs and programming keywords:
+  - before: the per-phrase ``in`` loops and the verb x keyword proximity
+            loops that re-split the prompt for every pair
+  - after:  one scan_prompt pass shared by all three detectors
+
+Both give the same answers; the benchmark checks that on every prompt.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_prompt_classifiers
+"""
+import timeit
+
+from app.services.chat_service import (
+    COMMAND_VERBS,
+    HINT_REQUEST_PHRASES,
+    PROBLEM_TYPE_KEYWORDS,
+    PROGRAMMING_KEYWORDS,
+    SOLUTION_SEEKING_PHRASES_EN,
+    SOLUTION_SEEKING_PHRASES_TH,
+    detect_problem_type,
+    detect_solution_seeking,
+    scan_prompt,
+)
+
+PASTED_CODE = '''
+def show_scores(students):
+    """Print every student's best score."""
+    for name, scores in students.items():
+        best = max(scores) if scores else 0
+        print(f"{name}: {best}")  # write the result
+
+def provide_average(numbers):
+    total = 0
+    for n in numbers:
+        total += n
+    return total / len(numbers) if numbers else 0
+'''
+
+# Explains the pasted code in words: many command verbs and programming
+# keywords, so the old proximity check re-splits the prompt for every pair
+EXPLAINED_CODE = (
+    "this function should show the list, the program must write each line, "
+    "tell me why the algorithm does not give the right solution and provide "
+    "the code fix; โปรแกรมนี้ควรแสดงผล ฟังก์ชันเขียนไฟล์ บอกหน่อยว่าโค้ดผิดตรงไหน\n"
+)
+
+QUESTIONS = {
+    "question EN": "I'm stuck on exercise 3.2, can you give me a hint about the loop?",
+    "question TH": "ช่วยแนะนำหน่อยครับ ติดตรงฟังก์ชันนี้ ควรทำอะไรต่อ",
+}
+
+PASTED_LINES = (10, 100, 1000)
+
+
+def legacy_classify(prompt: str):
+    lower_prompt = prompt.lower()
+
+    seeking = False
+    for pattern in SOLUTION_SEEKING_PHRASES_EN + SOLUTION_SEEKING_PHRASES_TH:
+        if pattern in lower_prompt:
+            seeking = True
+            break
+    if not seeking:
+        for verb in COMMAND_VERBS:
+            if verb in lower_prompt:
+                for keyword in PROGRAMMING_KEYWORDS:
+                    if keyword in lower_prompt:
+                        words = lower_prompt.split()
+                        verb_indices = [i for i, word in enumerate(words) if verb in word]
+                        keyword_indices = [
+                            i for i, word in enumerate(words) if keyword in word
+                        ]
+                        for v_idx in verb_indices:
+                            for k_idx in keyword_indices:
+                                if abs(v_idx - k_idx) <= 5:
+                                    seeking = True
+
+    hint = any(phrase in lower_prompt for phrase in HINT_REQUEST_PHRASES)
+
+    problem_type = "general"
+    for name, keywords in PROBLEM_TYPE_KEYWORDS.items():
+        if any(keyword in lower_prompt for keyword in keywords):
+            problem_type = name
+            break
+    return seeking, hint, problem_type
+
+
+def classify(prompt: str):
+    matches = scan_prompt(prompt)
+    return (
+        detect_solution_seeking(prompt, matches),
+        "hint_request" in matches,
+        detect_problem_type(prompt, matches),
+    )
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    prompts = dict(QUESTIONS)
+    for lines in PASTED_LINES:
+        code = "".join(PASTED_CODE for _ in range(max(1, lines // 12)))
+        prompts[f"pasted {lines} lines"] = (
+            "My code doesn't work, what is wrong here?\n" + code
+        )
+    for lines in PASTED_LINES:
+        code = "".join(PASTED_CODE for _ in range(max(1, lines // 12)))
+        prompts[f"explained {lines} lines"] = EXPLAINED_CODE + code
+
+    print(f"{'prompt':>21} {'chars':>7} {'before':>12} {'after':>12}")
+    for label, prompt in prompts.items():
+        assert classify(prompt) == legacy_classify(prompt), label
+        number = max(5, 20000 // len(prompt))
+        before_us = per_call_us(lambda: legacy_classify(prompt), number)
+        after_us = per_call_us(lambda: classify(prompt), number)
+        print(f"{label:>21} {len(prompt):>7} {before_us:>10.1f}us {after_us:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Load test for run_code and the /code/run-code route.
+
+Drives a weighted mix of realistic submissions at each concurrency level and
+records p50/p95/p99 latency, runs per second and how every run ended:
+
+  hello    print('Hello, world!')
+  cpu      a ~50 ms CPU-bound loop
+  print    a few thousand lines of output
+  timeout  an endless loop that runs into the CPU or wall-clock limit
+  syntax   a syntax error, rejected before anything is run
+
+Each concurrency level is a closed loop: that many simulated students each
+submit a run, wait for the answer and submit the next. Every student has
+their own user id, as in a real class, so the fair scheduler's per-user
+queues do not throttle the benchmark. Runs are made unique with a trailing
+comment so the result cache does not answer them (pass --repeat to allow
+cache hits).
+
+Targets:
+  service  run_code_service.run_code called directly
+  route    POST /code/run-code through the ASGI app, with authentication and
+           rate limiting overridden
+
+By default the warm workers are a local stand-in: the same worker processes
+and protocol, but started without dropping to ``nobody`` or applying the
+sandbox rlimits, so the benchmark runs unprivileged on a laptop or CI box.
+``--sandbox real`` uses the production sandbox setup instead (needs root).
+
+Run from the server directory:
+
+    python -m benchmarks.bench_run_code --target both --concurrency 1,10,50 \\
+        --runs 200 --output bench_run_code.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi_limiter.depends import RateLimiter
+
+from app.api.v1.endpoints import code as code_endpoints
+from app.core.security import get_current_user
+from app.db.schemas import Code
+from app.services import run_code_service
+from app.services.sandbox_pool import SandboxPool
+
+WORKLOADS = {
+    "hello": "print('Hello, world!')",
+    "cpu": "total = 0\nfor i in range(400000):\n    total += i * i % 7\nprint(total)",
+    "print": "for i in range(1500):\n    print(f'line {i}: ' + 'x' * 20)",
+    "timeout": "while True:\n    pass",
+    "syntax": "def broken(:\n    print('oops')",
+}
+DEFAULT_MIX = "hello=40,cpu=25,print=20,syntax=10,timeout=5"
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in WORKLOADS:
+            raise SystemExit(f"Unknown workload {name!r}, pick from {sorted(WORKLOADS)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered) + 0.5))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def outcome(status: int, result: Dict[str, Any]) -> str:
+    """Classify one run by how it ended."""
+    if status == 429:
+        return "queue_full"
+    if status == 503:
+        return "shed"
+    error = result.get("error") or ""
+    if "timed out" in error:
+        return "timeout"
+    if "dangerous" in error or "detail" in result:
+        return "rejected"
+    if error.startswith("Runtime error"):
+        # Includes runs killed by the CPU limit, which an endless loop hits first
+        return "runtime_error"
+    return "error" if error else "ok"
+
+
+def summarize(samples: List[Tuple[str, float, str]], elapsed: float) -> Dict[str, Any]:
+    latencies = [latency for _, latency, _ in samples]
+    summary = {
+        "runs": len(samples),
+        "elapsed_seconds": round(elapsed, 3),
+        "runs_per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "outcomes": dict(Counter(result for _, _, result in samples)),
+        "workloads": {},
+    }
+    for name in sorted({workload for workload, _, _ in samples}):
+        own = [latency for workload, latency, _ in samples if workload == name]
+        summary["workloads"][name] = {
+            "runs": len(own),
+            "p50_ms": round(percentile(own, 50) * 1000, 2),
+            "p95_ms": round(percentile(own, 95) * 1000, 2),
+            "p99_ms": round(percentile(own, 99) * 1000, 2),
+        }
+    return summary
+
+
+async def bench_user(request: Request):
+    """Stand-in for get_current_user: one user per simulated student."""
+    user_id = request.headers.get("X-Bench-User", "bench")
+    return {"username": user_id, "role": "student"}, user_id
+
+
+def build_app() -> FastAPI:
+    """The code router alone, with authentication and rate limiting overridden."""
+    app = FastAPI()
+    app.include_router(code_endpoints.router, prefix="/code")
+    app.dependency_overrides[get_current_user] = bench_user
+    for route in code_endpoints.router.routes:
+        for dependency in route.dependant.dependencies:
+            if isinstance(dependency.call, RateLimiter):
+                app.dependency_overrides[dependency.call] = lambda: True
+    return app
+
+
+async def run_level(
+    target: str,
+    concurrency: int,
+    runs: int,
+    mix: Dict[str, int],
+    repeat: bool,
+    seed: int,
+    client: httpx.AsyncClient = None,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=runs)
+    samples: List[Tuple[str, float, str]] = []
+    next_run = 0
+    # Unique per level, so one level's runs never hit another's cached results
+    nonce = uuid.uuid4().hex
+
+    async def student(index: int) -> None:
+        nonlocal next_run
+        user_id = f"bench-{index}"
+        while next_run < len(plan):
+            run = next_run
+            next_run += 1
+            workload = plan[run]
+            source = WORKLOADS[workload]
+            if not repeat:
+                source = f"{source}\n# run {nonce}-{run}"
+
+            started = time.perf_counter()
+            if target == "service":
+                try:
+                    status, result = 200, await run_code_service.run_code(
+                        Code(code=source), user_id
+                    )
+                except Exception as e:
+                    status = getattr(e, "status_code", 500)
+                    result = {"detail": getattr(e, "detail", str(e))}
+            else:
+                response = await client.post(
+                    "/code/run-code",
+                    json={"code": source},
+                    headers={"X-Bench-User": user_id},
+                )
+                status, result = response.status_code, response.json()
+            samples.append((workload, time.perf_counter() - started, outcome(status, result)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(student(index) for index in range(concurrency)))
+    summary = summarize(samples, time.perf_counter() - started)
+    summary.update(target=target, concurrency=concurrency)
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    outcomes = " ".join(f"{k}={v}" for k, v in sorted(summary["outcomes"].items()))
+    print(
+        f"{summary['target']:>8} {summary['concurrency']:>5} "
+        f"{summary['runs_per_second']:>9.1f} {summary['p50_ms']:>9.1f} "
+        f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f}  {outcomes}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    targets = ["service", "route"] if args.target == "both" else [args.target]
+
+    if args.sandbox == "standin":
+        pool = run_code_service.sandbox_pool
+        run_code_service.sandbox_pool = SandboxPool(
+            size=args.pool_size or pool.size,
+            max_uses=pool.max_uses,
+            env=pool.env,
+            preexec_fn=None,
+        )
+    elif args.pool_size:
+        run_code_service.sandbox_pool.size = args.pool_size
+    # run_code only ever sees the pool through this module global
+    pool = run_code_service.sandbox_pool
+    await pool.start()
+
+    results = []
+    print(f"{'target':>8} {'conc':>5} {'run/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  outcomes")
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=build_app()),
+            base_url="http://bench",
+            timeout=60,
+        ) as client:
+            for target in targets:
+                for concurrency in levels:
+                    summary = await run_level(
+                        target, concurrency, args.runs, mix, args.repeat, args.seed, client
+                    )
+                    print_summary(summary)
+                    results.append(summary)
+    finally:
+        await pool.close()
+        await run_code_service.scratch_dirs.close()
+
+    if args.output:
+        report = {
+            "mix": mix,
+            "runs_per_level": args.runs,
+            "sandbox": args.sandbox,
+            "pool_size": pool.size,
+            "execution_slots": run_code_service.EXECUTION_SLOTS,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=("service", "route", "both"), default="both")
+    parser.add_argument("--concurrency", default="1,10,50", help="comma-separated levels")
+    parser.add_argument("--runs", type=int, default=200, help="runs per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="workload=weight,...")
+    parser.add_argument("--sandbox", choices=("standin", "real"), default="standin")
+    parser.add_argument("--pool-size", type=int, default=0, help="warm workers (default: SANDBOX_POOL_SIZE)")
+    parser.add_argument("--repeat", action="store_true", help="let the result cache answer repeat runs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,143 @@
+"""
+Micro-benchmark for run_code_service code validation.
+
+Measures the cost of one validation for 1 KB - 100 KB submissions with:
+  - before: ast.parse + full NodeVisitor walk, plus the separate result
+            cache determinism check (what run_code used to do per run)
+  - cold:   analyze_code with nothing memoized
+  - cached: a repeat submission answered from the validation cache
+
+"plain" programs use none of the banned names; "screened" programs use a
+banned name harmlessly, which forces the exact AST walk.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_validation
+"""
+import ast
+import timeit
+
+from app.services import run_code_service
+from app.services.execution_cache import (
+    NONDETERMINISTIC_MODULES,
+    NONDETERMINISTIC_NAMES,
+)
+from app.services.run_code_service import (
+    BANNED_FUNCTIONS,
+    BANNED_METHODS,
+    BANNED_MODULES,
+    BANNED_PATTERNS,
+    analyze_code,
+)
+
+SNIPPET = '''
+def average(numbers):
+    total = 0
+    for n in numbers:
+        total += n
+    return total / len(numbers) if numbers else 0
+
+scores = [x * 3 % 17 for x in range(50)]
+print(f"avg={average(scores):.2f}", max(scores), sorted(scores)[:5])
+'''
+
+# Uses a banned name without calling it, so the AST has to be walked
+SCREENED_SNIPPET = SNIPPET + '''
+def clamp(kill):
+    return min(kill, 10)
+'''
+
+SIZES_KB = (1, 10, 100)
+
+
+class LegacyVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.unsafe = False
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name in BANNED_MODULES:
+                self.unsafe = True
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.module in BANNED_MODULES:
+            self.unsafe = True
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name):
+            if node.func.id in BANNED_FUNCTIONS:
+                self.unsafe = True
+        elif isinstance(node.func, ast.Attribute):
+            if node.func.attr in BANNED_METHODS:
+                self.unsafe = True
+        self.generic_visit(node)
+
+
+def legacy_validate(code: str) -> bool:
+    if any(pattern in code for pattern in BANNED_PATTERNS):
+        return False
+    visitor = LegacyVisitor()
+    visitor.visit(ast.parse(code))
+    return not visitor.unsafe
+
+
+def legacy_is_cacheable(code: str) -> bool:
+    """The result cache's old determinism check: a second parse and walk."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(a.name.split(".")[0] in NONDETERMINISTIC_MODULES for a in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Name):
+            if node.id in NONDETERMINISTIC_NAMES:
+                return False
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return False
+    return True
+
+
+def make_program(size_kb: int, snippet: str = SNIPPET) -> str:
+    repeats = max(1, size_kb * 1024 // len(snippet))
+    return snippet * repeats
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'program':>14} {'before':>12} {'cold':>12} {'cached':>12}")
+    for label, snippet in (("plain", SNIPPET), ("screened", SCREENED_SNIPPET)):
+        for size_kb in SIZES_KB:
+            code = make_program(size_kb, snippet)
+            number = max(3, 300 // size_kb)
+
+            def before():
+                legacy_validate(code)
+                legacy_is_cacheable(code)
+
+            def cold():
+                run_code_service._validation_cache.clear()
+                analyze_code(code)
+
+            before_us = per_call_us(before, number)
+            cold_us = per_call_us(cold, number)
+            analyze_code(code)
+            cached_us = per_call_us(lambda: analyze_code(code), number * 10)
+
+            print(
+                f"{label:>9} {size_kb:>2}KB {before_us:>10.1f}us "
+                f"{cold_us:>10.1f}us {cached_us:>10.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import BackgroundTasks, HTTPException
+
+from app.api.v1.endpoints import ai
+from app.services import chat_service
+
+USER_ID = str(ObjectId())
+
+
+class FakeUsers:
+    """users collection stand-in that applies the quota filter like MongoDB"""
+
+    def __init__(self, questions_used):
+        self.document = {"_id": ObjectId(USER_ID), "questions_used": questions_used}
+        self.projections = []
+
+    async def find_one(self, query, projection=None):
+        self.projections.append(projection)
+        await asyncio.sleep(0)  # let concurrent requests interleave
+        return dict(self.document)
+
+    async def update_one(self, query, update):
+        used = self.document.get("questions_used")
+        if used is not None and used >= ai.DEFAULT_MAX_QUESTIONS:
+            return SimpleNamespace(matched_count=0)
+        self.document["questions_used"] = (used or 0) + update["$inc"]["questions_used"]
+        return SimpleNamespace(matched_count=1)
+
+
+def use_users(monkeypatch, users):
+    monkeypatch.setattr(ai, "mongo", SimpleNamespace(users=users))
+    monkeypatch.setattr(chat_service, "mongo", SimpleNamespace(users=users))
+
+    async def no_history(user_id, exercise_id=None):
+        return []
+
+    monkeypatch.setattr(ai, "get_conversation_history", no_history)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_cannot_overrun_the_quota(monkeypatch):
+    """Test that only the questions left are admitted when messages race"""
+    users = FakeUsers(ai.DEFAULT_MAX_QUESTIONS - 1)
+    use_users(monkeypatch, users)
+    request = ai.ChatRequest(user_id=USER_ID, prompt="what is a list?")
+
+    results = await asyncio.gather(
+        *(ai.ai_chat(request, BackgroundTasks(), True) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(rejected) == 2
+    assert all(r.status_code == 403 for r in rejected)
+    assert users.document["questions_used"] == ai.DEFAULT_MAX_QUESTIONS
+
+
+@pytest.mark.asyncio
+async def test_chat_reads_only_the_problems_hint_state(monkeypatch):
+    """Test that the user is read with a projection on the prompt's problem"""
+    users = FakeUsers(0)
+    use_users(monkeypatch, users)
+    request = ai.ChatRequest(user_id=USER_ID, prompt="exercise 3.2 what now?")
+
+    await ai.ai_chat(request, BackgroundTasks(), True)
+
+    assert users.projections == [
+        {
+            "skill_level": 1,
+            "hint_levels.3_2": 1,
+            "hint_counts.3_2": 1,
+        }
+    ]
@@ -0,0 +1,49 @@
+import pytest
+
+from app.db.database import (
+    MONGODB_ACCOUNTS_DB,
+    MONGODB_DB,
+    MONGODB_MAX_POOL_SIZE,
+    MongoDatabase,
+)
+
+
+@pytest.fixture
+def mongo():
+    database = MongoDatabase()
+    yield database
+    database.close()
+
+
+def test_every_collection_shares_one_client(mongo):
+    """Test that all collections come from the same client and pool"""
+    client = mongo.client
+    for collection in (
+        mongo.users,
+        mongo.interaction_logs,
+        mongo.code_patterns,
+        mongo.conversations,
+        mongo.question_resets,
+        mongo.exercises,
+        mongo.code_history,
+        mongo.code_keystrokes,
+        mongo.assignments,
+        mongo.submissions,
+    ):
+        assert collection.database.client is client
+    assert client.options.pool_options.max_pool_size == MONGODB_MAX_POOL_SIZE
+
+
+def test_collections_live_in_their_databases(mongo):
+    """Test that account data and code data keep their existing databases"""
+    assert mongo.users.database.name == MONGODB_ACCOUNTS_DB
+    assert mongo.conversations.database.name == MONGODB_ACCOUNTS_DB
+    assert mongo.code_history.database.name == MONGODB_DB
+    assert mongo.submissions.database.name == MONGODB_DB
+
+
+def test_close_discards_the_client(mongo):
+    """Test that a closed database creates a fresh client on next use"""
+    client = mongo.client
+    mongo.close()
+    assert mongo.client is not client
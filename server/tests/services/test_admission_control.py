@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.admission_control import AdmissionController
+from app.services.execution_scheduler import ExecutionScheduler
+
+
+def test_admits_without_latency_history():
+    """Test that runs are admitted before any run has finished"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6)
+    scheduler.active = 1
+
+    controller.admit()
+
+    assert controller.stats()["admitted"] == 1
+
+
+def test_latency_is_a_moving_average():
+    """Test that recorded run times are smoothed, not replaced"""
+    controller = AdmissionController(
+        ExecutionScheduler(slots=1, max_queue_per_user=5), request_timeout=6, smoothing=0.5
+    )
+
+    controller.record(1.0)
+    controller.record(3.0)
+
+    assert controller.latency == 2.0
+
+
+def test_admits_while_slots_are_free():
+    """Test that slow runs alone do not trigger shedding when capacity is free"""
+    scheduler = ExecutionScheduler(slots=2, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6)
+    controller.record(4.0)
+    scheduler.active = 1
+
+    controller.admit()
+
+    assert controller.predicted_wait() == 0.0
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_retry_after_when_saturated():
+    """Test that a run that would miss the timeout gets a fast 503"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6)
+    controller.record(2.5)
+
+    await scheduler.acquire("blocker")
+    waiters = [asyncio.create_task(scheduler.acquire("alice")) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    # One running and two queued ahead: 3 * 2.5s wait + 2.5s run is 4s too long
+    with pytest.raises(HTTPException) as exc_info:
+        controller.admit()
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "4"
+    assert controller.stats()["rejected"] == 1
+
+    for user_id in ("blocker", "alice", "alice"):
+        scheduler.release(user_id)
+    await asyncio.gather(*waiters)
+
+
+@pytest.mark.asyncio
+async def test_admits_again_once_queue_drains():
+    """Test that shedding stops as soon as the backlog clears"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6)
+    controller.record(2.5)
+
+    await scheduler.acquire("blocker")
+    waiters = [asyncio.create_task(scheduler.acquire("alice")) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException):
+        controller.admit()
+
+    scheduler.release("blocker")
+    await asyncio.sleep(0)
+    scheduler.release("alice")
+    await asyncio.gather(*waiters)
+
+    controller.admit()
+    assert controller.stats()["queued"] == 0
+
+
+def test_slow_runs_never_block_an_idle_sandbox():
+    """Test that a timed-out run does not shed load once nothing is running"""
+    scheduler = ExecutionScheduler(slots=4, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6)
+    controller.record(6.01)
+
+    controller.admit()
+
+    assert controller.latency == 6
+    assert controller.stats()["rejected"] == 0
+
+
+def test_predicts_waves_from_parallelism_not_slots():
+    """Test that runs holding slots beyond the real parallelism count as waiting"""
+    scheduler = ExecutionScheduler(slots=50, max_queue_per_user=5)
+    controller = AdmissionController(scheduler, request_timeout=6, parallelism=4)
+    controller.record(2.0)
+    scheduler.active = 12
+
+    # Twelve runs on four sandboxes: three waves of 2s ahead, then this run
+    assert controller.predicted_wait() == 6.0
+    with pytest.raises(HTTPException):
+        controller.admit()
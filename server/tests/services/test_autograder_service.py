@@ -0,0 +1,255 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from app.db.schemas import Exercise
+from app.services.autograder_service import (
+    AnswerKey,
+    autograde_assignment,
+    normalize_answer,
+)
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, option) for option in condition):
+                return False
+        elif field == "$expr":
+            later, earlier = (document.get(ref[1:]) for ref in condition["$gt"])
+            if later is None or earlier is None or not later > earlier:
+                return False
+        elif isinstance(condition, dict) and "$exists" in condition:
+            if (field in document) != condition["$exists"]:
+                return False
+        elif isinstance(condition, dict):
+            if document.get(field) not in condition["$in"]:
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the autograder"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.bulk_writes = []
+
+    async def find_one(self, query):
+        for document in self.documents:
+            if all(document.get(k) == v for k, v in query.items()):
+                return document
+        return None
+
+    def find(self, query, projection=None, batch_size=None):
+        return FakeCursor([d for d in self.documents if matches(d, query)])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append((operations, ordered))
+        by_id = {d["_id"]: d for d in self.documents}
+        for operation in operations:
+            by_id[operation._filter["_id"]].update(operation._doc["$set"])
+
+
+ASSIGNMENT = {
+    "id": "a1",
+    "exercises": [
+        {
+            "id": 1,
+            "title": "Sum",
+            "description": "Sum evens",
+            "type": "coding",
+            "points": 4,
+            "test_cases": "assert sum_even([2, 3]) == 2\nassert sum_even([]) == 0",
+        },
+        {
+            "id": 2,
+            "title": "Output",
+            "description": "Predict",
+            "type": "output",
+            "points": 2,
+            "expected_output": "3 33 10",
+        },
+        {
+            "id": 3,
+            "title": "Fill",
+            "description": "Fill",
+            "type": "fill",
+            "points": 2,
+            "blanks": [
+                {"position": 1, "answer": "len(arr)-1"},
+                {"position": 2, "answers": ["(low+high)//2", "low+(high-low)//2"]},
+            ],
+        },
+    ],
+}
+
+
+def make_db(submissions, assignment=ASSIGNMENT):
+    return {
+        "assignments": FakeCollection([assignment]),
+        "submissions": FakeCollection(submissions),
+    }
+
+
+def test_normalize_answer_ignores_spacing():
+    """Test that whitespace differences do not change an answer"""
+    assert normalize_answer("  3   33 10 \n\n") == normalize_answer("3 33 10")
+
+
+def test_fill_answer_key_gives_partial_credit():
+    """Test that each correct blank earns its share of the points"""
+    key = AnswerKey(Exercise(**ASSIGNMENT["exercises"][2]))
+
+    assert key.grade([" len(arr)-1 ", "low+(high-low)//2"])["score"] == 2
+    assert key.grade(["len(arr)-1", "wrong"])["score"] == 1
+    assert key.grade(["len(arr)"])["score"] == 0
+
+
+def test_fill_without_answers_needs_review():
+    """Test that blanks with only options are left for the teacher"""
+    exercise = dict(ASSIGNMENT["exercises"][2], blanks=[{"position": 1, "options": ["a", "b"]}])
+
+    assert not AnswerKey(Exercise(**exercise)).auto
+
+
+@pytest.mark.asyncio
+async def test_autograde_grades_all_pending_submissions():
+    """Test that pending submissions are scored and written back in bulk"""
+    submissions = [
+        {
+            "_id": 1,
+            "assignment_id": "a1",
+            "user_id": "u1",
+            "status": "pending",
+            "answers": {
+                "1": "def sum_even(n):\n    return sum(x for x in n if x % 2 == 0)",
+                "2": "3  33 10",
+                "3": ["len(arr)-1", "(low+high)//2"],
+            },
+        },
+        {
+            "_id": 2,
+            "assignment_id": "a1",
+            "user_id": "u2",
+            "status": "pending",
+            "answers": {"1": "def sum_even(n):\n    return 0", "2": "3 33 9"},
+        },
+        {"_id": 3, "assignment_id": "a1", "user_id": "u3", "status": "graded", "answers": {}},
+    ]
+    db = make_db(submissions)
+
+    report = await autograde_assignment(db, "a1")
+
+    assert report["graded"] == 2
+    assert report["submissions_per_second"] > 0
+    assert [ordered for _, ordered in db["submissions"].bulk_writes] == [False]
+    assert submissions[0]["auto_score"] == 8
+    # Coding scores are provisional until a teacher confirms them
+    assert report["needs_review"] == 2
+    assert submissions[0]["status"] == "pending"
+    assert "score" not in submissions[0]
+    assert submissions[1]["exercise_scores"] == {"1": 2.0, "2": 0, "3": 0.0}
+    assert submissions[1]["feedback"]["1"] == "1/2 test cases passed"
+    assert "score" not in submissions[2]
+
+
+@pytest.mark.asyncio
+async def test_autograde_leaves_explain_exercises_for_review():
+    """Test that submissions with ungradable exercises stay pending"""
+    assignment = {
+        "id": "a2",
+        "exercises": [
+            ASSIGNMENT["exercises"][1],
+            {"id": 5, "title": "Explain", "description": "Explain", "type": "explain"},
+        ],
+    }
+    submissions = [
+        {
+            "_id": 1,
+            "assignment_id": "a2",
+            "user_id": "u1",
+            "status": "pending",
+            "answers": {"2": "3 33 10", "5": "It adds numbers"},
+            "feedback": {"5": "Nice explanation"},
+        }
+    ]
+    db = make_db(submissions, assignment)
+
+    report = await autograde_assignment(db, "a2")
+
+    assert report["needs_review"] == 1
+    assert submissions[0]["status"] == "pending"
+    assert submissions[0]["auto_score"] == 2
+    assert submissions[0]["feedback"] == {"2": "Correct output", "5": "Nice explanation"}
+
+
+@pytest.mark.asyncio
+async def test_autograde_finalizes_late_submissions_without_coding():
+    """Test that late submissions are graded and keep their lateness"""
+    assignment = {"id": "a3", "exercises": ASSIGNMENT["exercises"][1:]}
+    submissions = [
+        {
+            "_id": 1,
+            "assignment_id": "a3",
+            "user_id": "u1",
+            "status": "late",
+            "answers": {"2": "3 33 10", "3": ["len(arr)-1", "(low+high)//2"]},
+        }
+    ]
+    db = make_db(submissions, assignment)
+
+    report = await autograde_assignment(db, "a3")
+
+    assert report == {**report, "graded": 1, "needs_review": 0}
+    assert submissions[0]["score"] == 4
+    assert submissions[0]["status"] == "graded"
+    assert submissions[0]["late"] is True
+
+
+@pytest.mark.asyncio
+async def test_autograde_skips_submissions_already_graded():
+    """Test that only new or resubmitted answers are graded again, unless asked"""
+    submitted = datetime(2024, 1, 1)
+    submissions = [
+        {
+            "_id": 1,
+            "assignment_id": "a1",
+            "user_id": "u1",
+            "status": "pending",
+            "submitted_at": submitted,
+            "answers": {"1": "def sum_even(n):\n    return 0"},
+        }
+    ]
+    db = make_db(submissions)
+
+    assert (await autograde_assignment(db, "a1"))["graded"] == 1
+    assert (await autograde_assignment(db, "a1"))["graded"] == 0
+
+    submissions[0]["submitted_at"] = submissions[0]["autograded_at"] + timedelta(seconds=1)
+    assert (await autograde_assignment(db, "a1"))["graded"] == 1
+    assert (await autograde_assignment(db, "a1", regrade=True))["graded"] == 1
+    assert len(db["submissions"].bulk_writes) == 3
+
+
+@pytest.mark.asyncio
+async def test_autograde_unknown_assignment():
+    """Test that a missing assignment is a 404"""
+    with pytest.raises(HTTPException) as exc_info:
+        await autograde_assignment(make_db([]), "missing")
+
+    assert exc_info.value.status_code == 404
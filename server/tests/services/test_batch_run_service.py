@@ -0,0 +1,69 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from app.services.batch_run_service import MAX_BATCH_INPUTS, run_with_inputs
+from app.services.run_code_service import sandbox_pool
+
+GREETER = "name = input('Name: ')\nage = int(input())\nprint(f'Hi {name}, next year {age + 1}')"
+
+
+@pytest_asyncio.fixture
+async def pool():
+    """Start the shared sandbox pool and shut it down after the test"""
+    await sandbox_pool.start()
+    yield sandbox_pool
+    await sandbox_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_each_input(pool):
+    """Test that every stdin payload gets its own run and output"""
+    result = await run_with_inputs(GREETER, ["Ann\n20\n", "Bo\n41\n"], "user1")
+
+    outputs = [case["output"] for case in result["results"]]
+    assert outputs == ["Name: Hi Ann, next year 21", "Name: Hi Bo, next year 42"]
+    assert all(case["error"] is None for case in result["results"])
+
+
+@pytest.mark.asyncio
+async def test_batch_resets_globals_between_inputs(pool):
+    """Test that globals from one case are not visible to the next"""
+    code = "print('seen' in globals())\nseen = input()"
+
+    result = await run_with_inputs(code, ["a", "b"], "user1")
+
+    assert [case["output"] for case in result["results"]] == ["False", "False"]
+
+
+@pytest.mark.asyncio
+async def test_batch_reports_errors_per_input(pool):
+    """Test that one failing input does not affect the others"""
+    result = await run_with_inputs(GREETER, ["Ann\nold\n", "Cy\n1\n", "Di\n"], "user1")
+    ann, cy, di = result["results"]
+
+    assert "ValueError" in ann["error"]
+    assert "run_batch" not in ann["error"]
+    assert cy["output"].endswith("next year 2")
+    assert "EOFError" in di["error"]
+
+
+@pytest.mark.asyncio
+async def test_batch_times_out_single_input(pool):
+    """Test that a case stuck in a loop is stopped without losing the rest"""
+    code = "n = int(input())\nwhile n < 0:\n    pass\nprint(n)"
+
+    result = await run_with_inputs(code, ["1", "-1", "2"], "user1")
+
+    first, stuck, last = result["results"]
+    assert first["output"] == "1"
+    assert stuck["timed_out"]
+    assert last["output"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_too_many_inputs():
+    """Test that oversized batches are rejected before running"""
+    with pytest.raises(HTTPException) as exc_info:
+        await run_with_inputs("print(input())", ["x"] * (MAX_BATCH_INPUTS + 1), "user1")
+
+    assert exc_info.value.status_code == 400
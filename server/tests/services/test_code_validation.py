@@ -0,0 +1,120 @@
+import base64
+import marshal
+import pytest
+from app.services import run_code_service
+from app.services.run_code_service import analyze_code, validate_code_safety
+
+
+@pytest.fixture(autouse=True)
+def clear_validation_cache():
+    run_code_service._validation_cache.clear()
+    yield
+    run_code_service._validation_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "print('Hello')",
+        "import math\nprint(math.sqrt(16))",
+        "def clamp(kill):\n    return min(kill, 10)",
+        "handler = button.connect",
+        "def f():\n    open = 1\n    return open",
+    ],
+)
+def test_safe_code_passes(code):
+    """Test that code without banned imports or calls is accepted"""
+    assert validate_code_safety(code)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import os",
+        "from subprocess import run",
+        "eval('1 + 1')",
+        "def f():\n    return open('x')",
+        "items = [1]\nitems.remove(1)",
+        "print('.env')",
+        "print('unclosed'",
+        "x = 1\0",
+    ],
+)
+def test_unsafe_code_is_rejected(code):
+    """Test that banned imports, calls, patterns and invalid code are rejected"""
+    assert not validate_code_safety(code)
+
+
+@pytest.mark.parametrize(
+    "code, cacheable",
+    [
+        ("print(sum(range(10)))", True),
+        ("name = input()", False),
+        ("import random\nprint(random.random())", False),
+        ("for c in {'a', 'b'}:\n    print(c)", False),
+        ("print({x for x in 'ab'})", False),
+        ("def f(x):\n    return [i for i in x]", True),
+    ],
+)
+def test_cacheability_is_decided_in_the_same_pass(code, cacheable):
+    """Test that the analysis also flags non-deterministic programs"""
+    analysis = analyze_code(code)
+
+    assert analysis.safe
+    assert analysis.cacheable is cacheable
+
+
+def test_analysis_is_memoized(monkeypatch):
+    """Test that a repeated submission is not analyzed again"""
+    calls = []
+    original = run_code_service._analyze
+
+    def counting_analyze(code):
+        calls.append(code)
+        return original(code)
+
+    monkeypatch.setattr(run_code_service, "_analyze", counting_analyze)
+
+    analyze_code("print(1)")
+    analyze_code("print(1)")
+
+    assert len(calls) == 1
+
+
+def test_validation_cache_is_bounded(monkeypatch):
+    """Test that the least recently used entry is evicted"""
+    monkeypatch.setattr(run_code_service, "VALIDATION_CACHE_SIZE", 2)
+
+    analyze_code("print(1)")
+    analyze_code("print(2)")
+    analyze_code("print(1)")
+    analyze_code("print(3)")
+
+    assert len(run_code_service._validation_cache) == 2
+
+
+def test_validation_cache_is_bounded_by_bytes(monkeypatch):
+    """Test that large compiled programs evict older entries to stay in budget"""
+    monkeypatch.setattr(run_code_service, "VALIDATION_CACHE_MAX_BYTES", 4096)
+    program = "x = [" + ", ".join(str(n) for n in range(300)) + "]"
+
+    for n in range(5):
+        analyze_code(f"{program}\nprint({n})")
+
+    assert run_code_service._validation_cache.bytes <= 4096
+    assert 0 < len(run_code_service._validation_cache) < 5
+
+
+def test_no_bytecode_when_the_sandbox_interpreter_differs(monkeypatch):
+    """Test that code is not kept compiled for workers that could not load it"""
+    monkeypatch.setattr(run_code_service, "sandbox_magic", lambda: "00000000")
+
+    assert analyze_code("print(6 * 7)") == (True, True, None)
+
+
+def test_analysis_keeps_compiled_code():
+    """Test that safe programs carry their marshaled code object and unsafe ones don't"""
+    code = marshal.loads(base64.b64decode(analyze_code("print(6 * 7)").bytecode))
+
+    assert code.co_filename == "<string>"
+    assert analyze_code("import os").bytecode is None
@@ -0,0 +1,151 @@
+import pytest
+from app.db.schemas import Code
+from app.services import run_code_service
+from app.services.execution_cache import ExecutionCache, is_cacheable_result
+from app.services.run_code_service import analyze_code
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the async Redis client"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def make_cache(**overrides):
+    options = {"max_entries": 10, "max_bytes": 10_000, "ttl": 60, "redis_ttl": 60}
+    options.update(overrides)
+    return ExecutionCache(**options)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "print('Hello')",
+        "import math\nprint(math.sqrt(16))",
+        "def add(a, b):\n    return a + b\nprint(add(2, 3))",
+    ],
+)
+def test_deterministic_code_is_cacheable(code):
+    """Test that plain deterministic programs can be cached"""
+    assert analyze_code(code).cacheable
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "name = input()\nprint(name)",
+        "import random\nprint(random.randint(1, 6))",
+        "from datetime import datetime\nprint(datetime.now())",
+        "import time\nprint(time.time())",
+        "print({'a', 'b'})",
+        "print(id(object()))",
+        "print('unclosed'",
+    ],
+)
+def test_nondeterministic_code_bypasses_cache(code):
+    """Test that input, randomness, time and set ordering bypass the cache"""
+    assert not analyze_code(code).cacheable
+
+
+def test_only_stable_results_are_cached():
+    """Test that timeouts and server errors are never cached"""
+    assert is_cacheable_result({"output": "15", "error": ""})
+    assert is_cacheable_result({"error": "Runtime error: Traceback (most recent call last):"})
+    assert not is_cacheable_result({"error": "Execution timed out (5s limit)"})
+    assert not is_cacheable_result({"error": "Internal server error"})
+
+
+@pytest.mark.asyncio
+async def test_cache_round_trip_and_stats():
+    """Test storing and reading back a result"""
+    cache = make_cache()
+    key = cache.key("print(1)", "salt")
+
+    assert await cache.get(key) is None
+    await cache.set(key, {"output": "1", "error": ""})
+
+    assert await cache.get(key) == {"output": "1", "error": ""}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_key_depends_on_salt():
+    """Test that changing interpreter or limits changes the key"""
+    assert ExecutionCache.key("print(1)", "v1") != ExecutionCache.key("print(1)", "v2")
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted():
+    """Test LRU eviction by entry count"""
+    cache = make_cache(max_entries=2)
+    await cache.set("a", {"output": "a"})
+    await cache.set("b", {"output": "b"})
+    await cache.get("a")
+    await cache.set("c", {"output": "c"})
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+    assert await cache.get("c") is not None
+
+
+@pytest.mark.asyncio
+async def test_entries_are_evicted_by_size():
+    """Test that the total cached payload stays within max_bytes"""
+    cache = make_cache(max_bytes=100)
+    await cache.set("a", {"output": "x" * 60})
+    await cache.set("b", {"output": "y" * 60})
+
+    assert await cache.get("a") is None
+    assert cache.stats()["bytes"] <= 100
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_dropped():
+    """Test TTL expiry of the local tier"""
+    cache = make_cache(ttl=-1)
+    await cache.set("a", {"output": "a"})
+
+    assert await cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_between_caches():
+    """Test that a result stored by one process is visible to another"""
+    redis_instance = FakeRedis()
+    first, second = make_cache(), make_cache()
+    first.bind_redis(redis_instance)
+    second.bind_redis(redis_instance)
+
+    await first.set("a", {"output": "shared"})
+
+    assert await second.get("a") == {"output": "shared"}
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_does_not_replay_usage(monkeypatch):
+    """Test that a cached answer carries no resource usage of its own"""
+    runs = []
+
+    async def execute(code_str, user_id):
+        runs.append(code_str)
+        usage = {"cpu_user_ms": 9.0, "wall_ms": 12.0}
+        return {"output": "4", "error": "", "user_id": user_id, "usage": usage}
+
+    monkeypatch.setattr(run_code_service, "_execute", execute)
+    monkeypatch.setattr(run_code_service, "execution_cache", make_cache())
+
+    first = await run_code_service.run_code(Code(code="print(2 + 2)"), "alice")
+    second = await run_code_service.run_code(Code(code="print(2 + 2)"), "bob")
+
+    assert len(runs) == 1
+    assert first["usage"]["cpu_user_ms"] == 9.0
+    assert second["cached"] and second["user_id"] == "bob"
+    assert "usage" not in second
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+import pytest
+import pytest_asyncio
+from app.services.execution_queue import JOBS_KEY, ExecutionQueue
+from app.services.run_code_service import sandbox_pool
+
+
+class FakeRedis:
+    """In-memory stand-in for the async Redis list commands"""
+
+    def __init__(self):
+        self.lists = {}
+        self.expiry = {}
+        self.changed = asyncio.Condition()
+
+    async def lpush(self, key, value):
+        async with self.changed:
+            self.lists.setdefault(key, []).insert(0, value)
+            self.changed.notify_all()
+
+    async def rpush(self, key, value):
+        async with self.changed:
+            self.lists.setdefault(key, []).append(value)
+            self.changed.notify_all()
+
+    async def expire(self, key, seconds):
+        self.expiry[key] = seconds
+
+    async def _pop(self, key, timeout, index):
+        async with self.changed:
+            try:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.lists.get(key)), timeout
+                )
+            except asyncio.TimeoutError:
+                return None
+            return key, self.lists[key].pop(index)
+
+    async def blpop(self, key, timeout=0):
+        return await self._pop(key, timeout, 0)
+
+    async def brpop(self, key, timeout=0):
+        return await self._pop(key, timeout, -1)
+
+
+@pytest_asyncio.fixture
+async def pool():
+    """Start the shared sandbox pool and shut it down after the test"""
+    await sandbox_pool.start()
+    yield sandbox_pool
+    await sandbox_pool.close()
+
+
+def make_queue(redis_instance):
+    queue = ExecutionQueue("queue")
+    queue.bind_redis(redis_instance)
+    return queue
+
+
+def test_queue_disabled_without_redis_or_mode():
+    """Test that the queue is only used in queue mode with Redis bound"""
+    assert not ExecutionQueue("queue").enabled
+    assert not make_queue(None).enabled
+    assert not ExecutionQueue("local").enabled
+
+
+@pytest.mark.asyncio
+async def test_queue_round_trip_through_worker(pool):
+    """Test that a job pushed by the API is run by a worker and answered"""
+    redis_instance = FakeRedis()
+    api, worker = make_queue(redis_instance), make_queue(redis_instance)
+    stop = asyncio.Event()
+    consumer = asyncio.create_task(worker.consume(pool, stop))
+
+    result = await api.run({"code": "print(6 * 7)", "timeout": 5})
+
+    stop.set()
+    await consumer
+    assert result["event"] == "result"
+    assert result["stdout"] == "42\n"
+    assert all(seconds > 0 for seconds in redis_instance.expiry.values())
+
+
+@pytest.mark.asyncio
+async def test_worker_skips_expired_jobs(pool):
+    """Test that jobs the API already gave up on are never run"""
+    redis_instance = FakeRedis()
+    worker = make_queue(redis_instance)
+    await redis_instance.lpush(
+        JOBS_KEY,
+        json.dumps({"id": "old", "job": {"code": "print(1)"}, "expires_at": time.time() - 1}),
+    )
+    stop = asyncio.Event()
+    consumer = asyncio.create_task(worker.consume(pool, stop))
+
+    await asyncio.sleep(0.2)
+    stop.set()
+    await consumer
+    assert "run_code:reply:old" not in redis_instance.lists
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.execution_scheduler import ExecutionScheduler
+
+
+async def _run(scheduler, user_id, order, hold):
+    async with scheduler.slot(user_id):
+        order.append(user_id)
+        await hold.wait()
+
+
+@pytest.mark.asyncio
+async def test_free_slot_is_granted_immediately():
+    """Test that a run with free capacity does not wait"""
+    scheduler = ExecutionScheduler(slots=2, max_queue_per_user=5)
+
+    waited = await scheduler.acquire("alice")
+
+    assert waited == 0.0
+    assert scheduler.active == 1
+
+
+@pytest.mark.asyncio
+async def test_slots_are_shared_round_robin():
+    """Test that a user with a burst of runs does not starve other users"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=10)
+    order = []
+    hold = asyncio.Event()
+
+    blocker = await scheduler.acquire("blocker")
+    tasks = [asyncio.create_task(_run(scheduler, "alice", order, hold)) for _ in range(3)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(_run(scheduler, "bob", order, hold)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    hold.set()
+    scheduler.release("blocker")
+    await asyncio.gather(*tasks)
+
+    assert blocker == 0.0
+    assert order == ["alice", "bob", "alice", "bob", "alice"]
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_full_user_queue_is_rejected_with_429():
+    """Test that queue overflow is rejected immediately"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=1)
+    await scheduler.acquire("alice")
+    waiting = asyncio.create_task(scheduler.acquire("alice"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await scheduler.acquire("alice")
+
+    assert exc_info.value.status_code == 429
+    waiting.cancel()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    """Test that a cancelled run gives up its place in the queue"""
+    scheduler = ExecutionScheduler(slots=1, max_queue_per_user=5)
+    await scheduler.acquire("alice")
+    waiting = asyncio.create_task(scheduler.acquire("bob"))
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert scheduler.queued == 0
+    scheduler.release("alice")
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_user_active_limit_lets_other_users_through():
+    """Test that a user at their active limit waits while others use free slots"""
+    scheduler = ExecutionScheduler(slots=4, max_queue_per_user=5, max_active_per_user=2)
+    order = []
+    hold = asyncio.Event()
+
+    alice = [asyncio.create_task(_run(scheduler, "alice", order, hold)) for _ in range(3)]
+    await asyncio.sleep(0)
+    bob = asyncio.create_task(_run(scheduler, "bob", order, hold))
+    await asyncio.sleep(0)
+
+    assert order == ["alice", "alice", "bob"]
+    assert (scheduler.active, scheduler.queued) == (3, 1)
+
+    hold.set()
+    await asyncio.gather(*alice, bob)
+    assert order == ["alice", "alice", "bob", "alice"]
+    assert scheduler.active == 0
@@ -0,0 +1,191 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from app.db.schemas import CodingExercise
+from app.services.grading_service import grade_code, split_test_cases
+from app.services import sandbox_worker
+from app.services.run_code_service import sandbox_pool
+
+SUBMISSION = "def sum_even(numbers):\n    return sum(n for n in numbers if n % 2 == 0)\n"
+
+
+def make_exercise(test_cases, expected_output="", time_limit=5):
+    return CodingExercise(
+        id=1,
+        title="Sum of evens",
+        description="Sum the even numbers",
+        type="coding",
+        test_cases=test_cases,
+        expected_output=expected_output,
+        time_limit=time_limit,
+    )
+
+
+@pytest_asyncio.fixture
+async def pool():
+    """Start the shared sandbox pool and shut it down after the test"""
+    await sandbox_pool.start()
+    yield sandbox_pool
+    await sandbox_pool.close()
+
+
+def test_split_test_cases_groups_setup_with_assert():
+    """Test that setup statements belong to the following assert"""
+    cases = split_test_cases(
+        "assert sum_even([]) == 0\nnums = [1, 2, 3, 4]\nassert sum_even(nums) == 6\n"
+    )
+
+    assert cases == ["assert sum_even([]) == 0", "nums = [1, 2, 3, 4]\nassert sum_even(nums) == 6"]
+
+
+def test_split_test_cases_rejects_invalid_code():
+    """Test that unparsable test code is a 400"""
+    with pytest.raises(HTTPException) as exc_info:
+        split_test_cases("assert (")
+
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_grade_runs_all_cases(pool):
+    """Test that every case is reported with pass/fail and timing"""
+    exercise = make_exercise(
+        "assert sum_even([1, 2, 3, 4, 5, 6]) == 12\n"
+        "assert sum_even([1, 3]) == 1, 'no evens'\n"
+        "assert sum_even([]) == 0\n"
+    )
+
+    result = await grade_code(SUBMISSION, exercise, "user1")
+
+    assert result["total"] == 3
+    assert result["passed_count"] == 2
+    assert not result["passed"]
+    assert [case["passed"] for case in result["cases"]] == [True, False, True]
+    assert result["cases"][1]["error"] == "AssertionError: no evens"
+    assert all(case["time_ms"] >= 0 for case in result["cases"])
+
+
+@pytest.mark.asyncio
+async def test_grade_stops_on_first_failure(pool):
+    """Test that remaining cases are skipped when stop_on_failure is set"""
+    exercise = make_exercise("assert sum_even([1]) == 1\nassert sum_even([2]) == 2\n")
+
+    result = await grade_code(SUBMISSION, exercise, "user1", stop_on_failure=True)
+
+    assert result["cases"][0]["error"] == "AssertionError"
+    assert result["cases"][1]["error"] == "Not run"
+    assert result["passed_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_grade_checks_expected_output(pool):
+    """Test that expected_output is graded as an extra case"""
+    exercise = make_exercise(
+        "assert sum_even([2]) == 2", expected_output="6\n"
+    )
+
+    result = await grade_code(SUBMISSION + "print(sum_even([2, 4]))", exercise, "user1")
+
+    assert result["passed"]
+    assert result["output"] == "6"
+    assert result["cases"][-1]["source"] == "expected output"
+
+
+@pytest.mark.asyncio
+async def test_grade_reports_submission_error(pool):
+    """Test that a crashing submission fails every case with its error"""
+    exercise = make_exercise("assert sum_even([2]) == 2")
+
+    result = await grade_code("raise ValueError('broken')", exercise, "user1")
+
+    assert not result["passed"]
+    assert result["error"] == "Runtime error: ValueError: broken"
+    assert result["cases"][0]["error"] == result["error"]
+
+
+@pytest.mark.asyncio
+async def test_grade_keeps_results_before_timeout(pool):
+    """Test that cases finished before a timeout are still reported"""
+    exercise = make_exercise(
+        "assert sum_even([2]) == 2\n"
+        "while True:\n    pass\n"
+        "assert sum_even([4]) == 4\n",
+        time_limit=1,
+    )
+
+    result = await grade_code(SUBMISSION, exercise, "user1")
+
+    assert result["timed_out"]
+    assert result["cases"][0]["passed"]
+    assert not result["cases"][1]["passed"]
+    assert "timed out" in result["cases"][1]["error"]
+
+
+@pytest.mark.asyncio
+async def test_grade_rejects_dangerous_code():
+    """Test that banned code is rejected before anything runs"""
+    exercise = make_exercise("assert True")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await grade_code("import os\nos.system('ls')", exercise, "user1")
+
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_grade_ignores_tampering_with_builtins(pool):
+    """Test that a submission replacing exec cannot skip its test cases"""
+    exercise = make_exercise("assert sum_even([2]) == 2\nassert sum_even([4]) == 4\n")
+    submission = (
+        "def sum_even(numbers):\n    return 0\n"
+        "import builtins\nbuiltins.exec = lambda *a, **k: None\n"
+    )
+
+    result = await grade_code(submission, exercise, "user1")
+
+    assert result["passed_count"] == 0
+    assert [case["error"] for case in result["cases"]] == ["AssertionError"] * 2
+
+
+@pytest.mark.asyncio
+async def test_grade_cases_do_not_share_state(pool):
+    """Test that each case starts from a fresh run of the submission"""
+    exercise = make_exercise("seen.append(1)\nassert seen == [1]\nseen.append(2)\nassert seen == [2]\n")
+
+    result = await grade_code("seen = []", exercise, "user1")
+
+    assert [case["passed"] for case in result["cases"]] == [True, True]
+
+
+@pytest.mark.asyncio
+async def test_grade_caps_submission_output(pool):
+    """Test that a printing flood fails with the output limit, not a blank error"""
+    exercise = make_exercise("assert sum_even([2]) == 2")
+
+    result = await grade_code("while True:\n    print('x' * 1000)", exercise, "user1")
+
+    assert result["error"].startswith("Runtime error: Output limit exceeded")
+
+
+@pytest.mark.asyncio
+async def test_grade_runs_a_slow_submission_once(pool):
+    """Test that a slow top level is run once, not again for every case"""
+    exercise = make_exercise("assert sum_even([2]) == 2\n" * 15, time_limit=2)
+    submission = (
+        "import time\n"
+        "started = time.monotonic()\n"
+        "while time.monotonic() - started < 0.4:\n    pass\n" + SUBMISSION
+    )
+
+    result = await grade_code(submission, exercise, "user1")
+
+    assert not result["timed_out"]
+    assert (result["passed_count"], result["total"]) == (15, 15)
+
+
+def test_grade_job_errors_end_the_child():
+    """Test that an exception escaping a job exits the fork instead of returning"""
+    result = sandbox_worker.handle_job({"kind": "grade", "timeout": 2})
+
+    assert result["returncode"] == 1
+    assert result["reports"] == []
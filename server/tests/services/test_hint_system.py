@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from app.services import chat_service
+from app.services.chat_service import UserContext
+
+USER_ID = str(ObjectId())
+
+
+class FakeUsers:
+    """users collection stand-in that records projections and updates"""
+
+    def __init__(self, document):
+        self.document = document
+        self.projections = []
+        self.updates = []
+
+    async def find_one(self, query, projection=None):
+        self.projections.append(projection)
+        return self.document
+
+    async def insert_one(self, document):
+        self.document = document
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append((update, upsert))
+
+
+@pytest.fixture
+def users(monkeypatch):
+    fake = FakeUsers({"_id": ObjectId(USER_ID)})
+    monkeypatch.setattr(chat_service, "mongo", SimpleNamespace(users=fake))
+    monkeypatch.setattr(chat_service.hint_history_buffer, "_pending", [])
+    monkeypatch.setattr(chat_service.hint_history_buffer, "start", lambda: None)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_reads_only_the_problems_hint_state(users):
+    """Test that the user is read with a projection on one problem"""
+    users.document = {"hint_levels": {"3_2": 2}, "hint_counts": {"3_2": 4}}
+
+    result = await chat_service.manage_hint_system(USER_ID, "exercise 3.2 what now?")
+
+    assert users.projections == [
+        {
+            "skill_level": 1,
+            "hint_levels.3_2": 1,
+            "hint_counts.3_2": 1,
+        }
+    ]
+    assert result["hint_level"] == 2
+    assert "received 4 hints" in result["hint_context"]
+    assert users.updates == []
+
+
+@pytest.mark.asyncio
+async def test_hint_request_increments_level_and_count(users):
+    """Test that a hint request updates counters and queues the history"""
+    users.document = {"hint_levels": {"5": 3}, "hint_counts": {"5": 3}}
+
+    result = await chat_service.manage_hint_system(USER_ID, "problem 5, I need a hint")
+
+    assert result["hint_level"] == 4
+    assert users.updates == [
+        ({"$set": {"hint_levels.5": 4}, "$inc": {"hint_counts.5": 1}}, True)
+    ]
+    history = chat_service.hint_history_buffer._pending
+    assert [(h["problem_id"], h["level"]) for h in history] == [("5", 4)]
+
+
+@pytest.mark.asyncio
+async def test_users_without_counts_fall_back_to_level(users):
+    """Test that documents from before hint_counts still get hint context"""
+    users.document = {"hint_levels": {"7": 3}, "hint_history": [{}] * 3}
+
+    result = await chat_service.manage_hint_system(USER_ID, "lab 7 looks fine")
+
+    assert "received 3 hints" in result["hint_context"]
+
+
+@pytest.mark.asyncio
+async def test_shared_context_is_left_for_the_caller_to_save(users):
+    """Test that with a caller's context, hint changes join its single update"""
+    context = UserContext(USER_ID, {"hint_levels": {}})
+    context.inc("solution_seeking_count")
+
+    await chat_service.manage_hint_system(USER_ID, "lab 1 hint please", context=context)
+    assert users.projections == []
+    assert users.updates == []
+
+    await context.save()
+    assert users.updates == [
+        (
+            {
+                "$set": {"hint_levels.1": 1},
+                "$inc": {"solution_seeking_count": 1, "hint_counts.1": 1},
+            },
+            True,
+        )
+    ]
+
+
+def test_new_user_gets_defaults_that_do_not_conflict():
+    """Test that creating a user never sets a field its own update changes"""
+    context = UserContext(USER_ID, None)
+    context.inc("solution_seeking_count")
+    context.set("hint_levels.2", 1)
+
+    assert context.update()["$setOnInsert"] == {
+        "skill_level": "beginner",
+        "questions_used": 0,
+        "hint_counts": {},
+    }
+    assert UserContext(USER_ID, {}).update() == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_read_still_creates_a_complete_user(users):
+    """Test that a user created after a failed read gets every default"""
+
+    async def fail(query, projection=None):
+        raise RuntimeError("mongo is down")
+
+    users.find_one = fail
+
+    await chat_service.manage_hint_system(USER_ID, "problem 5, I need a hint")
+
+    update, upsert = users.updates[0]
+    assert upsert
+    assert update["$setOnInsert"] == {
+        "skill_level": "beginner",
+        "questions_used": 0,
+        "solution_seeking_count": 0,
+    }
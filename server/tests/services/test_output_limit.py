@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+import pytest
+import pytest_asyncio
+from app.services import run_code_service
+from app.services.run_code_service import (
+    EXECUTION_OUTPUT_LIMIT,
+    execute_in_pool,
+    execute_in_sandbox,
+    sandbox_pool,
+)
+
+FLOOD = "while True:\n    print('x' * 1000)"
+ENV = {"PATH": "/usr/bin:/bin", "PYTHONPATH": "", "USER_ID": "user1"}
+
+
+@pytest_asyncio.fixture
+async def pool():
+    """Start the shared sandbox pool and shut it down after the test"""
+    await sandbox_pool.start()
+    yield sandbox_pool
+    await sandbox_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_truncates_flooding_output(pool):
+    """Test that a warm-worker run is cut off at the output budget"""
+    result = await execute_in_pool(FLOOD, "user1")
+
+    assert result["truncated"]
+    assert "Output limit exceeded" in result["error"]
+    assert len(result["output"]) <= EXECUTION_OUTPUT_LIMIT
+
+
+@pytest.mark.asyncio
+async def test_cold_start_truncates_flooding_output():
+    """Test that a fresh-process run is cut off at the output budget"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result = await execute_in_sandbox(FLOOD, temp_dir, ENV, "user1")
+
+    assert result["truncated"]
+    assert len(result["output"]) <= EXECUTION_OUTPUT_LIMIT
+
+
+@pytest.mark.asyncio
+async def test_cold_start_keeps_small_output():
+    """Test that output under the budget is returned untouched"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result = await execute_in_sandbox("print('hello')", temp_dir, ENV, "user1")
+
+    result.pop("usage")
+    assert result == {"output": "hello", "error": "", "user_id": "user1"}
+
+
+@pytest.mark.asyncio
+async def test_cold_start_reports_runtime_error():
+    """Test that a failing program still reports its traceback"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result = await execute_in_sandbox("1 / 0", temp_dir, ENV, "user1")
+
+    assert result["error"].startswith("Runtime error:")
+    assert "ZeroDivisionError" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_cold_start_reports_cpu_time():
+    """Test that a fresh-process run reports the child's own CPU time"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result = await execute_in_sandbox(
+            "total = sum(range(3_000_000))\nprint(total)", temp_dir, ENV, "user1"
+        )
+
+    usage = result["usage"]
+    assert usage["cpu_user_ms"] + usage["cpu_system_ms"] > 10
+    assert usage["output_bytes"] == len(result["output"]) + 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_cold_start_reaps_its_child(monkeypatch):
+    """Test that giving up on a fresh-process run leaves no zombie behind"""
+    started = []
+    popen = run_code_service.subprocess.Popen
+
+    def recording_popen(*args, **kwargs):
+        started.append(popen(*args, **kwargs))
+        return started[-1]
+
+    monkeypatch.setattr(run_code_service.subprocess, "Popen", recording_popen)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        run = asyncio.create_task(
+            execute_in_sandbox("while True:\n    pass", temp_dir, ENV, "user1")
+        )
+        await asyncio.sleep(0.3)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        await asyncio.sleep(0.1)
+
+    with pytest.raises(ChildProcessError):
+        os.waitpid(started[0].pid, os.WNOHANG)
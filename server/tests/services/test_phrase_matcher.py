@@ -0,0 +1,70 @@
+from app.services.chat_service import (
+    detect_problem_type,
+    detect_solution_seeking,
+    scan_prompt,
+)
+from app.services.phrase_matcher import PhraseMatcher
+
+
+def test_scan_finds_overlapping_and_nested_phrases():
+    """Test that every occurrence is reported, including ones inside others"""
+    matcher = PhraseMatcher({"a": ["he", "she", "hers"], "b": ["his"]})
+
+    matches = matcher.scan("Ushers his")
+
+    assert [(m.phrase, m.start) for m in matches.matches] == [
+        ("she", 1),
+        ("he", 2),
+        ("hers", 2),
+        ("his", 7),
+    ]
+    assert matches.categories == {"a", "b"}
+
+
+def test_scan_reports_word_positions():
+    """Test that a match carries the index of the word it starts in"""
+    matcher = PhraseMatcher({"verb": ["give"], "noun": ["code", "full code"]})
+
+    matches = matcher.scan("Please  GIVE me\nthe full code")
+
+    assert matches.words("verb") == [1]
+    assert matches.words("noun") == [4, 5]
+    assert matches.near("verb", "noun", 3)
+    assert not matches.near("verb", "noun", 2)
+    assert "missing" not in matches
+
+
+def test_scan_without_matches():
+    """Test scanning text that contains none of the phrases"""
+    matches = PhraseMatcher({"a": ["needle"]}).scan("haystack " * 100)
+
+    assert matches.matches == []
+    assert not matches.near("a", "a", 5)
+
+
+def test_solution_seeking_phrases_and_proximity():
+    """Test the phrase list and the verb-near-keyword rule"""
+    assert detect_solution_seeking("Please just give me the code")
+    assert detect_solution_seeking("ขอแค่โค้ดครับ")
+    # Verb and keyword inside the same Thai word
+    assert detect_solution_seeking("ให้โค้ดหน่อย")
+    assert detect_solution_seeking("can you show the working function")
+    filler = " ".join(["word"] * 5)
+    assert not detect_solution_seeking(f"show {filler} function")
+    assert not detect_solution_seeking("why does my loop stop early?")
+
+
+def test_classifiers_share_one_scan():
+    """Test that one scan answers every detector"""
+    prompt = "I'm stuck on the bubble sort, can you give me a hint?"
+    matches = scan_prompt(prompt)
+
+    assert "hint_request" in matches
+    assert not detect_solution_seeking(prompt, matches)
+    assert detect_problem_type(prompt, matches) == "sort"
+
+
+def test_problem_type_keeps_declaration_order():
+    """Test that the first matching problem type in order wins"""
+    assert detect_problem_type("recursive fibonacci") == "fibonacci"
+    assert detect_problem_type("hello there") == "general"
@@ -0,0 +1,170 @@
+from types import SimpleNamespace
+
+from app.services.chat_service import (
+    SOLUTION_SEEKING_WARNING,
+    PromptCacheStats,
+    build_messages,
+    build_system_prompt,
+    trim_history,
+)
+
+HISTORY = [
+    {"role": "user", "content": "What does a for loop do?"},
+    {"role": "assistant", "content": "It repeats a block for each item."},
+]
+
+
+def test_system_prompt_depends_only_on_skill_level():
+    """Test that the cached system prompt is a single stable block"""
+    blocks = build_system_prompt("beginner")
+
+    assert blocks == build_system_prompt("beginner")
+    assert len(blocks) == 1
+    assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_history_ends_with_a_cache_breakpoint():
+    """Test that the last history message is cached without touching the history"""
+    messages = build_messages(HISTORY, "And a while loop?")
+
+    assert messages[0] == HISTORY[0]
+    assert messages[1]["content"] == [
+        {
+            "type": "text",
+            "text": "It repeats a block for each item.",
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    assert messages[2] == {"role": "user", "content": "And a while loop?"}
+    assert HISTORY[1]["content"] == "It repeats a block for each item."
+
+
+def test_per_message_context_follows_the_breakpoints():
+    """Test that hint context and the warning go in the new user turn"""
+    plain = build_messages(HISTORY, "Give me the answer")
+    with_context = build_messages(
+        HISTORY, "Give me the answer", "This student has received 3 hints.", True
+    )
+
+    assert plain[:2] == with_context[:2]
+    context, prompt = with_context[2]["content"]
+    assert context["text"].startswith("This student has received 3 hints.")
+    assert context["text"].endswith(SOLUTION_SEEKING_WARNING.strip()[-20:])
+    assert prompt == {"type": "text", "text": "Give me the answer"}
+    assert build_messages([], "Hi") == [{"role": "user", "content": "Hi"}]
+
+
+def test_unknown_skill_level_uses_beginner_prefix():
+    """Test the fallback to the beginner prompt"""
+    assert build_system_prompt("expert")[0] == build_system_prompt("beginner")[0]
+
+
+def test_trimming_drops_whole_blocks():
+    """Test that the kept history only changes its start once per block"""
+    messages = [{"role": "user", "content": str(i)} for i in range(30)]
+
+    assert trim_history(messages[:20], max_exchanges=10) == messages[:20]
+    assert trim_history(messages[:22], max_exchanges=10) == messages[8:22]
+    assert trim_history(messages[:28], max_exchanges=10) == messages[8:28]
+    assert trim_history(messages[:30], max_exchanges=10) == messages[16:30]
+
+
+def text_of(message):
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(block["text"] for block in content)
+
+
+class FakePromptCache:
+    """Anthropic prompt caching in miniature, counting characters as tokens"""
+
+    minimum = 1024
+
+    def __init__(self):
+        self.prefixes = set()
+
+    def usage(self, system, messages):
+        """Read the longest cached prefix, write the one up to the breakpoint"""
+        texts = [system[0]["text"], *(text_of(m) for m in messages)]
+        marked = [
+            index
+            for index, message in enumerate(messages)
+            if not isinstance(message["content"], str)
+            and any("cache_control" in block for block in message["content"])
+        ]
+        # texts[0] is the system prompt, which always has a breakpoint
+        breakpoint = marked[-1] + 2 if marked else 1
+        read = 0
+        for end in range(breakpoint, 0, -1):
+            if tuple(texts[:end]) in self.prefixes:
+                read = len("".join(texts[:end]))
+                break
+        written = 0
+        prefix = tuple(texts[:breakpoint])
+        size = len("".join(prefix))
+        if size >= self.minimum and prefix not in self.prefixes:
+            self.prefixes.add(prefix)
+            written = size - read
+        return SimpleNamespace(
+            input_tokens=len("".join(texts)) - read - written,
+            cache_read_input_tokens=read,
+            cache_creation_input_tokens=written,
+        )
+
+
+def replay(trim, turns=40):
+    """Stats for a long conversation whose history is cut down by ``trim``"""
+    cache = FakePromptCache()
+    stats = PromptCacheStats()
+    stored = []
+    for turn in range(turns):
+        prompt = f"Question {turn}: " + "why does my loop never stop? " * 6
+        messages = build_messages(trim(stored), prompt)
+        stats.record(cache.usage(build_system_prompt("beginner"), messages))
+        answer = f"Answer {turn}: " + "check the condition. " * 10
+        # Stored history is trimmed by the same blocks, at its own limit
+        stored = trim_history(
+            [
+                *stored,
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": answer},
+            ],
+            max_exchanges=20,
+        )
+    return stats.stats()
+
+
+def test_long_conversations_keep_hitting_the_cache():
+    """Test that a conversation past the history limit still reads the cache"""
+    blocks = replay(lambda history: trim_history(history, max_exchanges=10))
+    sliding = replay(lambda history: history[-20:])
+
+    # Trimming by blocks misses once per block; a sliding window never hits
+    # once it is full, and writes the cache on every message instead
+    assert blocks["hits"] >= 30
+    assert sliding["hits"] < 15
+    assert blocks["cache_creation_input_tokens"] < sliding["cache_creation_input_tokens"] / 2
+
+
+def test_cache_accounting():
+    """Test that usage is classified as hit, write or miss"""
+    stats = PromptCacheStats()
+
+    stats.record(SimpleNamespace(input_tokens=50, cache_creation_input_tokens=1500))
+    tokens = stats.record(
+        SimpleNamespace(
+            input_tokens=40, cache_read_input_tokens=1500, cache_creation_input_tokens=0
+        )
+    )
+    stats.record(SimpleNamespace(input_tokens=900, cache_read_input_tokens=None))
+
+    assert tokens == {
+        "input_tokens": 40,
+        "cache_read_input_tokens": 1500,
+        "cache_creation_input_tokens": 0,
+    }
+    summary = stats.stats()
+    assert (summary["hits"], summary["writes"], summary["misses"]) == (1, 1, 1)
+    assert summary["cache_read_input_tokens"] == 1500
+    assert summary["input_tokens"] == 990
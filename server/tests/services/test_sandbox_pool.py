@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from app.db.schemas import Code
+from app.services import run_code_service
+from app.services.run_code_service import (
+    BYTECODE_MAGIC,
+    analyze_code,
+    execute_in_pool,
+    sandbox_pool,
+    stream_code,
+)
+
+
+@pytest_asyncio.fixture
+async def pool():
+    """Start the shared sandbox pool and shut it down after the test"""
+    await sandbox_pool.start()
+    yield sandbox_pool
+    await sandbox_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_simple_code(pool):
+    """Test that a warm worker executes code and returns its output"""
+    result = await execute_in_pool("a = 5\nb = 10\nprint(a + b)", "user1")
+
+    assert result["output"] == "15"
+    assert result["error"] == ""
+    assert result["user_id"] == "user1"
+
+
+@pytest.mark.asyncio
+async def test_pool_reports_runtime_error(pool):
+    """Test that exceptions come back as runtime errors with a clean traceback"""
+    result = await execute_in_pool("a = 5 / 0", "user1")
+
+    assert result["error"].startswith("Runtime error:")
+    assert "ZeroDivisionError" in result["error"]
+    assert "run_child" not in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_pool_isolates_runs(pool):
+    """Test that state from one run does not leak into the next"""
+    await execute_in_pool("import math\nmath.pi = 3\nleaked = 1", "user1")
+    result = await execute_in_pool("import math\nprint(math.pi)\nprint('leaked' in globals())", "user2")
+
+    assert result["output"] == "3.141592653589793\nFalse"
+
+
+@pytest.mark.asyncio
+async def test_pool_recycles_worker_after_crash(pool):
+    """Test that the pool keeps serving after a job kills its child"""
+    crash = await execute_in_pool("import math\nmath.factorial(10**9)", "user1")
+    result = await execute_in_pool("print('still alive')", "user1")
+
+    assert "error" in crash
+    assert result["output"] == "still alive"
+
+
+@pytest.mark.asyncio
+async def test_pool_times_out_long_running_code(pool):
+    """Test that a run exceeding the time limit is killed"""
+    result = await execute_in_pool("import time\nwhile True:\n    time.sleep(0.1)", "user1")
+
+    assert "Execution timed out" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_pool_streams_output_before_exit(pool):
+    """Test that printed lines arrive as chunks while the program still runs"""
+    frames = []
+    async for frame in pool.stream(
+        {
+            "code": "import time\nprint('first')\ntime.sleep(0.5)\nprint('second')",
+            "timeout": 5,
+            "stream": True,
+        }
+    ):
+        frames.append((frame, asyncio.get_running_loop().time()))
+
+    chunks = [frame for frame, _ in frames if frame["event"] == "chunk"]
+    result, finished_at = frames[-1]
+    assert [chunk["data"] for chunk in chunks] == ["first\n", "second\n"]
+    assert finished_at - frames[0][1] >= 0.4
+    assert result["event"] == "result"
+    assert result["stdout"] == ""
+
+
+@pytest.mark.asyncio
+async def test_pool_stream_stops_at_output_cap(pool):
+    """Test that a streaming run is killed once it prints past its byte cap"""
+    frames = [
+        frame
+        async for frame in pool.stream(
+            {
+                "code": "while True:\n    print('x' * 1000)",
+                "timeout": 5,
+                "stream": True,
+                "max_output": 10000,
+            }
+        )
+    ]
+
+    streamed = sum(len(frame["data"]) for frame in frames if frame["event"] == "chunk")
+    assert frames[-1]["truncated"]
+    assert not frames[-1]["timed_out"]
+    assert streamed == 10000
+
+
+@pytest.mark.asyncio
+async def test_stream_code_emits_done_event(pool):
+    """Test that stream_code wraps worker frames into output and done events"""
+    events = [event async for event in stream_code(Code(code="print('hi')"), "user1")]
+
+    assert events[0] == {"event": "stdout", "data": "hi\n"}
+    assert events[-1]["event"] == "done"
+    assert events[-1]["returncode"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_reports_resource_usage(pool):
+    """Test that a run reports its CPU time, peak memory and output size"""
+    small = await execute_in_pool("print('hi')", "user1")
+    large = await execute_in_pool("block = bytearray(20 * 1024 * 1024)\nprint('hi')", "user1")
+
+    assert small["usage"]["output_bytes"] == 3
+    assert small["usage"]["cpu_user_ms"] >= 0
+    assert small["usage"]["wall_ms"] > 0
+    assert large["usage"]["max_rss_kb"] - small["usage"]["max_rss_kb"] > 15 * 1024
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_precompiled_bytecode(pool):
+    """Test that a worker executes the API's compiled code object, not the source"""
+    bytecode = analyze_code("print('compiled')").bytecode
+    job = {"code": "print('source')", "bytecode": bytecode, "magic": BYTECODE_MAGIC, "timeout": 5}
+
+    result = await pool.run(job)
+
+    assert result["stdout"] == "compiled\n"
+
+
+@pytest.mark.asyncio
+async def test_pool_ignores_bytecode_from_other_interpreter(pool):
+    """Test that bytecode with a different magic number falls back to the source"""
+    bytecode = analyze_code("print('compiled')").bytecode
+    job = {"code": "print('source')", "bytecode": bytecode, "magic": "00000000", "timeout": 5}
+
+    result = await pool.run(job)
+
+    assert result["stdout"] == "source\n"
+
+
+@pytest.mark.asyncio
+async def test_precompiled_traceback_matches_source_run(pool):
+    """Test that tracebacks from bytecode point at the same line as `python -c`"""
+    result = await execute_in_pool("x = 1\nraise ValueError('bad')", "user1")
+
+    assert 'File "<string>", line 2' in result["error"]
+    assert "ValueError: bad" in result["error"]
+
+
+def test_slots_match_the_local_pool():
+    """Test that the scheduler never admits more runs than there are warm workers"""
+    assert run_code_service.EXECUTION_SLOTS == sandbox_pool.size
+    assert run_code_service.admission_controller.parallelism == sandbox_pool.size
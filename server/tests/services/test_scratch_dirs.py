@@ -0,0 +1,77 @@
+import asyncio
+import os
+import pytest
+import pytest_asyncio
+from app.services.scratch_dirs import ScratchDirPool
+
+
+@pytest_asyncio.fixture
+async def scratch(tmp_path):
+    """Scratch directory pool under a per-test root"""
+    pool = ScratchDirPool(size=2, root=str(tmp_path), mode=0o755)
+    pool.start()
+    yield pool
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_directories_are_created_up_front(scratch):
+    """Test that every directory exists and is permissioned before any run"""
+    assert len(os.listdir(scratch.path)) == 2
+    for name in os.listdir(scratch.path):
+        assert os.stat(os.path.join(scratch.path, name)).st_mode & 0o777 == 0o755
+
+
+@pytest.mark.asyncio
+async def test_clean_directory_is_reused(scratch):
+    """Test that an untouched directory goes straight back into the pool"""
+    async with scratch.lease() as first:
+        pass
+    async with scratch.lease() as second:
+        async with scratch.lease() as third:
+            pass
+
+    assert first in (second, third)
+    assert scratch.stats()["free"] == 2
+    assert scratch.stats()["wiped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_used_directory_is_wiped_before_reuse(scratch):
+    """Test that files left behind by a run never reach the next run"""
+    async with scratch.lease() as path:
+        os.makedirs(os.path.join(path, "nested"))
+        with open(os.path.join(path, "nested", "data.txt"), "w") as f:
+            f.write("secret")
+
+    leased = [await scratch.acquire() for _ in range(2)]
+
+    assert path in leased
+    assert os.listdir(path) == []
+    assert scratch.stats()["wiped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_leases_are_bounded(scratch):
+    """Test that a lease waits while every directory is in use"""
+    first = await scratch.acquire()
+    await scratch.acquire()
+    waiter = asyncio.create_task(scratch.acquire())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    scratch.release(first)
+
+    assert await asyncio.wait_for(waiter, timeout=1) == first
+
+
+@pytest.mark.asyncio
+async def test_close_removes_everything(tmp_path):
+    """Test that closing the pool deletes its directories"""
+    pool = ScratchDirPool(size=3, root=str(tmp_path))
+    pool.start()
+    path = pool.path
+
+    await pool.close()
+
+    assert not os.path.exists(path)
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services.solution_seeking_counter import SolutionSeekingCounter
+
+
+class FakePipeline:
+    """Queues commands and runs them against FakeRedis on execute"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        results = [getattr(self.redis, name)(*a, **kw) for name, a, kw in self.commands]
+        self.redis.round_trips += 1
+        return results
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the sorted-set and counter commands"""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    async def exists(self, key):
+        self.round_trips += 1
+        return int(key in self.data)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        for member in [m for m, score in zset.items() if score <= high]:
+            del zset[member]
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class FakeLogs:
+    """interaction_logs stand-in that counts the queries it answers"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.queries = 0
+
+    def _matching(self, query):
+        since = query.get("timestamp", {}).get("$gte", datetime.min)
+        return [
+            e
+            for e in self.entries
+            if e["user_id"] == query["user_id"] and e["timestamp"] >= since
+        ]
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return FakeCursor(self._matching(query))
+
+    async def count_documents(self, query):
+        self.queries += 1
+        return len(self._matching(query))
+
+
+def attempt(user_id="u1", age=timedelta(0)):
+    return {"_id": ObjectId(), "user_id": user_id, "timestamp": datetime.now() - age}
+
+
+@pytest.mark.asyncio
+async def test_first_attempt_seeds_from_logs():
+    """Test that a user's counters start from their logged history"""
+    old = attempt(age=timedelta(days=3))
+    new = attempt()
+    logs = FakeLogs([old, new])
+    counter = SolutionSeekingCounter(lambda: logs)
+    counter.bind_redis(FakeRedis())
+
+    assert await counter.record("u1", [new]) == (1, 2, True)
+
+
+@pytest.mark.asyncio
+async def test_later_attempts_skip_the_logs():
+    """Test that once seeded, counting is one Redis round trip"""
+    first = attempt()
+    logs = FakeLogs([first])
+    redis = FakeRedis()
+    counter = SolutionSeekingCounter(lambda: logs, sync_interval=300)
+    counter.bind_redis(redis)
+    await counter.record("u1", [first])
+    queries = logs.queries
+
+    batch = [attempt(), attempt()]
+    redis.round_trips = 0
+    recent, total, sync_due = await counter.record("u1", batch)
+
+    assert (recent, total) == (3, 3)
+    assert not sync_due  # the users document was updated while seeding
+    assert logs.queries == queries
+    assert redis.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_window_forgets_old_attempts():
+    """Test that attempts older than the window leave the recent count"""
+    logs = FakeLogs([])
+    redis = FakeRedis()
+    counter = SolutionSeekingCounter(lambda: logs, window=3600)
+    counter.bind_redis(redis)
+    await counter.record("u1", [])
+
+    recent, total, _ = await counter.record(
+        "u1", [attempt(age=timedelta(hours=2)), attempt()]
+    )
+
+    assert (recent, total) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_without_redis_counts_the_logs():
+    """Test the MongoDB fallback when Redis is not connected"""
+    logs = FakeLogs([attempt(age=timedelta(days=2)), attempt(), attempt("u2")])
+    counter = SolutionSeekingCounter(lambda: logs)
+
+    assert await counter.record("u1", []) == (1, 2, True)
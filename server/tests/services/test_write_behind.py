@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from app.services.write_behind import WriteBehindBuffer
+
+
+class FakeCollection:
+    """Minimal in-memory stand-in for a Motor collection"""
+
+    def __init__(self):
+        self.batches = []
+        self.failures = []
+
+    async def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(list(documents))
+
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_is_full():
+    """Test that a full batch is written without waiting for the interval"""
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(lambda: collection, batch_size=3, flush_interval=60)
+
+    for i in range(3):
+        buffer.add({"n": i})
+    assert collection.batches == []
+    await asyncio.sleep(0.05)
+
+    assert collection.batches == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+    assert buffer.stats()["written"] == 3
+    assert buffer.stats()["last_flush_ms"] is not None
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flushes_on_interval():
+    """Test that a partial batch is written once the interval passes"""
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(lambda: collection, batch_size=100, flush_interval=0.05)
+
+    buffer.add({"n": 1})
+    await asyncio.sleep(0.15)
+
+    assert collection.batches == [[{"n": 1}]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_drains_pending_documents():
+    """Test that shutdown writes what is still queued"""
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(lambda: collection, batch_size=2, flush_interval=60)
+    buffer.add({"n": 1})
+
+    await buffer.close()
+
+    assert collection.batches == [[{"n": 1}]]
+    assert buffer.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_and_bounded():
+    """Test that a transient failure keeps the batch, within max_pending"""
+    collection = FakeCollection()
+    collection.failures.append(AutoReconnect("mongo is down"))
+    buffer = WriteBehindBuffer(
+        lambda: collection, batch_size=10, flush_interval=60, max_pending=2
+    )
+    for i in range(3):
+        buffer._pending.append({"n": i})
+
+    await buffer.flush()
+    stats = buffer.stats()
+    assert stats["failed_flushes"] == 1
+    assert stats["pending"] == 2
+    assert stats["dropped"] == 1
+
+    await buffer.flush()
+    assert collection.batches == [[{"n": 1}, {"n": 2}]]
+
+
+@pytest.mark.asyncio
+async def test_rejected_documents_are_not_retried():
+    """Test that per-document insert errors drop only those documents"""
+    collection = FakeCollection()
+    collection.failures.append(
+        BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}]})
+    )
+    batches = []
+
+    async def on_flush(batch):
+        batches.append(batch)
+
+    buffer = WriteBehindBuffer(lambda: collection, on_flush=on_flush)
+    buffer._pending.extend([{"n": 1}, {"n": 2}])
+    await buffer.flush()
+
+    stats = buffer.stats()
+    assert stats == {**stats, "written": 1, "dropped": 1, "pending": 0}
+    assert batches == [[{"n": 1}, {"n": 2}]]